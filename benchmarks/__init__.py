@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+"""
+Pidgen benchmark suite.
+
+Benchmarks are run as modules from the repository root, e.g.
+
+python -m benchmarks.parse -h
+"""
@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+
+"""
+Codec throughput benchmark for Pidgen.
+
+Measures packets/s and bytes/s for each codec operation:
+
+- encode  - PidgenCodecPlan.encode (one packet per call)
+- decode  - PidgenCodecPlan.decode (one packet per call)
+- view    - Lazy access of a single field through a PidgenPacketView
+- batch   - PidgenCodecPlan.decodeColumns (NumPy, all packets in one call, materialised as columns)
+- stream  - PidgenStream.feed over a buffer of framed packets
+
+Each operation is run against several packet shapes:
+
+- small   - A handful of scalar fields
+- wide    - Many scalar fields of mixed datatypes
+- array   - Large primitive arrays
+- nested  - Nested structs, and arrays of structs
+
+Per-packet latency percentiles are measured by timing every call of the single-packet operations
+(encode / decode / view) individually. The batch and stream operations process every packet in a
+single call, so they only report throughput.
+
+Results are written as JSON so that they can be compared across commits:
+
+python -m benchmarks.codec --output results.json
+python -m benchmarks.codec --compare results.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from pidgen.protocolparser import PidgenProtocolParser
+from pidgen.stream import PidgenStream
+from pidgen.version import PIDGEN_VERSION
+
+from .parse import gitCommit
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+OPERATIONS = ["encode", "decode", "view", "batch", "stream"]
+
+SHAPES = ["small", "wide", "array", "nested"]
+
+WIDE_TYPES = ["u8", "i8", "u16", "i16", "u32", "i32", "u64", "i64", "f32", "f64"]
+
+# Operations which process a single packet per call (and so report per-packet latency)
+SINGLE_OPERATIONS = ["encode", "decode", "view"]
+
+# Percentiles reported for per-packet latency
+PERCENTILES = [50, 90, 99]
+
+
+def generateProtocol(directory, wide_fields=64):
+    """
+    Write a protocol containing one packet for each benchmark shape.
+
+    Return:
+        Path to the protocol file
+    """
+
+    lines = [
+        "<Protocol name='codec_bench' version='1.0'>",
+        "",
+        "<Struct name='Vector'>",
+        "    <Data name='x' datatype='i16'/>",
+        "    <Data name='y' datatype='i16'/>",
+        "    <Data name='z' datatype='i16'/>",
+        "</Struct>",
+        "",
+        "<Struct name='Pose'>",
+        "    <Data name='position' struct='Vector'/>",
+        "    <Data name='velocity' struct='Vector'/>",
+        "    <Data name='heading' datatype='f32'/>",
+        "</Struct>",
+        "",
+        "<Struct name='Track'>",
+        "    <Data name='pose' struct='Pose'/>",
+        "    <Data name='history' struct='Vector' array='4'/>",
+        "    <Data name='quality' datatype='u8'/>",
+        "</Struct>",
+        "",
+        "<Packet name='Small' id='1'>",
+        "    <Data name='status' datatype='u8'/>",
+        "    <Data name='counter' datatype='u16'/>",
+        "    <Data name='timestamp' datatype='u32'/>",
+        "</Packet>",
+        "",
+        "<Packet name='Wide' id='2'>",
+    ]
+
+    for idx in range(wide_fields):
+        lines.append("    <Data name='f{i}' datatype='{t}'/>".format(i=idx, t=WIDE_TYPES[idx % len(WIDE_TYPES)]))
+
+    lines += [
+        "</Packet>",
+        "",
+        "<Packet name='Array' id='3'>",
+        "    <Data name='channel' datatype='u8'/>",
+        "    <Data name='samples' datatype='i16' array='256'/>",
+        "    <Data name='gains' datatype='f32' array='16'/>",
+        "</Packet>",
+        "",
+        "<Packet name='Nested' id='4'>",
+        "    <Data name='primary' struct='Track'/>",
+        "    <Data name='secondary' struct='Track'/>",
+        "    <Data name='targets' struct='Pose' array='4'/>",
+        "</Packet>",
+        "",
+        "</Protocol>",
+    ]
+
+    path = os.path.join(directory, "codec.xml")
+
+    with open(path, "w") as xml_file:
+        xml_file.write("\n".join(lines) + "\n")
+
+    return path
+
+
+def randomValues(plan, rng):
+    """
+    Generate a dict of random (encoded) values for every field in a plan.
+    """
+
+    values = {}
+
+    for field in plan.fields:
+
+        if field.format in "fde":
+            generate = rng.uniform
+        else:
+            generate = rng.randrange
+
+        if field.count is None:
+            values[field.name] = generate(0, 100)
+        else:
+            values[field.name] = tuple(generate(0, 100) for _ in range(field.count))
+
+    return values
+
+
+def percentiles(samples):
+    """ Return the configured percentiles of a list of samples """
+
+    ordered = sorted(samples)
+
+    result = {}
+
+    for p in PERCENTILES:
+        idx = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        result["p{p}".format(p=p)] = ordered[idx]
+
+    return result
+
+
+def calibrate(iterations=200000):
+    """
+    Time a fixed pure-Python loop.
+    This gives a rough machine speed score, so that results from different machines can be compared.
+
+    Return:
+        Loop iterations per second
+    """
+
+    started = time.perf_counter()
+
+    total = 0
+
+    for idx in range(iterations):
+        total += idx & 0xFF
+
+    return iterations / (time.perf_counter() - started)
+
+
+class ShapeBenchmark():
+    """
+    Benchmark of each codec operation for a single packet shape.
+    """
+
+    def __init__(self, packet, count, seed):
+
+        self.packet = packet
+        self.plan = packet.codecPlan()
+        self.count = count
+
+        rng = random.Random(seed)
+
+        self.records = [randomValues(self.plan, rng) for _ in range(count)]
+
+        self.buffers = [self.plan.encode(record) for record in self.records]
+
+        self.buffer = b"".join(self.buffers)
+
+        self.stream = PidgenStream([packet])
+        self.packetId = packet.packetIdValue
+
+        self.frames = b"".join(self.stream.encode(self.packetId, record) for record in self.records)
+
+        # A representative field for lazy access (the last field in the packet)
+        self.viewField = self.plan.names[-1]
+
+    def operations(self):
+        """ Return a dict of the operations available for this shape """
+
+        ops = {
+            "encode": self.encode,
+            "decode": self.decode,
+            "view": self.view,
+            "stream": self.streamDecode,
+        }
+
+        if numpy is not None:
+            ops["batch"] = self.batch
+
+        return ops
+
+    def encode(self):
+        encode = self.plan.encode
+
+        for record in self.records:
+            encode(record)
+
+    def decode(self):
+        decode = self.plan.decode
+
+        for buffer in self.buffers:
+            decode(buffer)
+
+    def view(self):
+        view = self.plan.view
+        name = self.viewField
+
+        for buffer in self.buffers:
+            view(buffer)[name]
+
+    def batch(self):
+        self.plan.decodeColumns(self.buffer)
+
+    def streamDecode(self):
+        self.stream.feed(self.frames)
+
+    def single(self, operation):
+        """
+        Return a function which runs an operation on a single packet (given its index),
+        or None if the operation processes every packet at once.
+        """
+
+        plan = self.plan
+        name = self.viewField
+
+        if operation == "encode":
+            return lambda idx: plan.encode(self.records[idx])
+
+        if operation == "decode":
+            return lambda idx: plan.decode(self.buffers[idx])
+
+        if operation == "view":
+            return lambda idx: plan.view(self.buffers[idx])[name]
+
+        return None
+
+    def bytesPerRun(self, operation):
+        if operation == "stream":
+            return len(self.frames)
+
+        return len(self.buffer)
+
+
+def timeOperation(function, warmup, repeat):
+    """
+    Run an operation (warmup + repeat times).
+
+    Return:
+        List of elapsed times (seconds), one per repetition
+    """
+
+    for _ in range(warmup):
+        function()
+
+    samples = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+
+    return samples
+
+
+def timeEach(function, count):
+    """
+    Time every call of a single-packet operation individually.
+
+    Return:
+        List of elapsed times (seconds), one per packet
+    """
+
+    clock = time.perf_counter
+
+    samples = []
+
+    for idx in range(count):
+        started = clock()
+        function(idx)
+        samples.append(clock() - started)
+
+    return samples
+
+
+def runBenchmark(params):
+    """
+    Run the codec benchmark described by params.
+
+    Return:
+        Dict of results (suitable for writing as JSON)
+    """
+
+    directory = tempfile.mkdtemp(prefix="pidgen_codec_")
+
+    try:
+        protocol = PidgenProtocolParser(generateProtocol(directory, wide_fields=params["wide_fields"]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = {}
+
+    for shape in params["shapes"]:
+
+        packet = protocol.findItemByName("PidgenPacket", shape.capitalize())
+
+        bench = ShapeBenchmark(packet, params["packets"], params["seed"])
+
+        shape_results = {
+            "packet_size": bench.plan.size,
+            "operations": {},
+        }
+
+        for operation, function in bench.operations().items():
+
+            if operation not in params["operations"]:
+                continue
+
+            samples = timeOperation(function, params["warmup"], params["repeat"])
+
+            median = statistics.median(samples)
+
+            latency = None
+
+            if operation in SINGLE_OPERATIONS:
+                latency = percentiles(timeEach(bench.single(operation), bench.count))
+
+            shape_results["operations"][operation] = {
+                "packets_per_s": bench.count / median,
+                "bytes_per_s": bench.bytesPerRun(operation) / median,
+                "latency": latency,
+                "samples": samples,
+            }
+
+        results[shape] = shape_results
+
+    return {
+        "benchmark": "codec",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": gitCommit(),
+        "pidgen": PIDGEN_VERSION,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__ if numpy is not None else None,
+        "platform": platform.platform(),
+        "calibration": calibrate(),
+        "params": params,
+        "shapes": results,
+    }
+
+
+def printResults(results, baseline=None):
+
+    print("Codec benchmark - {n} packets per run (calibration {c:.0f} loops/s)".format(
+        n=results["params"]["packets"],
+        c=results["calibration"]
+    ))
+    print("")
+
+    header = "{s:<8}{o:<8}{p:>14}{b:>12}{p50:>10}{p99:>10}".format(
+        s="Shape",
+        o="Op",
+        p="Packets/s",
+        b="MB/s",
+        p50="p50 (us)",
+        p99="p99 (us)"
+    )
+
+    if baseline is not None:
+        header += "{r:>10}".format(r="Ratio")
+
+    print(header)
+
+    for shape, shape_results in results["shapes"].items():
+        for operation in OPERATIONS:
+
+            result = shape_results["operations"].get(operation, None)
+
+            if result is None:
+                continue
+
+            latency = result["latency"]
+
+            line = "{s:<8}{o:<8}{p:>14.0f}{b:>12.2f}{p50:>10}{p99:>10}".format(
+                s=shape,
+                o=operation,
+                p=result["packets_per_s"],
+                b=result["bytes_per_s"] / 1e6,
+                p50="-" if latency is None else "{t:.2f}".format(t=latency["p50"] * 1e6),
+                p99="-" if latency is None else "{t:.2f}".format(t=latency["p99"] * 1e6)
+            )
+
+            if baseline is not None:
+                base = baseline.get("shapes", {}).get(shape, {}).get("operations", {}).get(operation, None)
+
+                if base is not None and base["packets_per_s"] > 0:
+                    line += "{r:>10.2f}".format(r=result["packets_per_s"] / base["packets_per_s"])
+
+            print(line)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Pidgen codec throughput benchmark")
+
+    parser.add_argument("--packets", help="Number of packets per run", type=int, default=1000)
+    parser.add_argument("--wide-fields", help="Number of fields in the 'wide' packet", type=int, default=64)
+    parser.add_argument("--warmup", help="Number of warmup runs", type=int, default=2)
+    parser.add_argument("--repeat", help="Number of timed runs", type=int, default=10)
+    parser.add_argument("--shape", help="Packet shapes to benchmark", choices=SHAPES, action="append")
+    parser.add_argument("--op", help="Operations to benchmark", choices=OPERATIONS, action="append")
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to a JSON file", metavar="FILE")
+    parser.add_argument("--compare", help="Compare results against a previous JSON file", metavar="FILE")
+
+    args = parser.parse_args()
+
+    params = {
+        "packets": max(1, args.packets),
+        "wide_fields": args.wide_fields,
+        "warmup": max(0, args.warmup),
+        "repeat": max(1, args.repeat),
+        "shapes": args.shape or SHAPES,
+        "operations": args.op or OPERATIONS,
+        "seed": args.seed,
+    }
+
+    results = runBenchmark(params)
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare, "r") as json_file:
+            baseline = json.load(json_file)
+
+        if baseline.get("params") != params:
+            print("Warning: baseline was generated with different parameters")
+
+    printResults(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parse benchmark for Pidgen.
+
+Generates a synthetic protocol, and times each phase of PidgenProtocolParser:
+
+- xml       - Reading and parsing the XML files
+- validate  - Key and child validation
+- construct - Element construction (total parse time, excluding the above)
+- lookup    - Name lookups (findItemByName) against the parsed protocol
+
+Results are written as JSON so that they can be compared across commits:
+
+python -m benchmarks.parse --files 50 --packets 20 --output results.json
+python -m benchmarks.parse --files 50 --packets 20 --compare results.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pidgen import timing
+from pidgen.protocolparser import PidgenProtocolParser
+from pidgen.version import PIDGEN_VERSION
+
+from .synthetic import generateProtocol, packetName
+
+
+PHASES = ["total", "xml", "validate", "construct", "lookup"]
+
+
+def gitCommit():
+    """ Return the current git commit hash (or None if not available) """
+
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runOnce(master, params, rng):
+    """
+    Parse the protocol once, and return the time taken for each phase.
+    """
+
+    timing.reset()
+    timing.enable(True)
+
+    try:
+        protocol = PidgenProtocolParser(master, lazy=params["lazy"])
+
+        phases = timing.results()
+
+        total = phases["protocol"]["time"]
+        xml = phases.get("xml", {}).get("time", 0)
+        validate = phases.get("validate", {}).get("time", 0)
+
+        result = {
+            "total": total,
+            "xml": xml,
+            "validate": validate,
+            "construct": max(0, total - xml - validate),
+        }
+
+        timing.reset()
+
+        for _ in range(params["lookups"]):
+            f = rng.randrange(params["files"])
+            p = rng.randrange(params["packets"])
+
+            protocol.findItemByName("PidgenPacket", packetName(f, p))
+
+        result["lookup"] = timing.results().get("lookup", {}).get("time", 0)
+
+    finally:
+        timing.enable(False)
+        timing.reset()
+
+    result["elements"] = len(protocol.getDescendants([]))
+    result["files"] = len(protocol.files)
+
+    return result
+
+
+def summarize(samples):
+    """ Summarize a list of timing samples """
+
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "samples": samples,
+    }
+
+
+def runBenchmark(params):
+    """
+    Generate the protocol described by params, and benchmark it.
+
+    Return:
+        Dict of results (suitable for writing as JSON)
+    """
+
+    directory = tempfile.mkdtemp(prefix="pidgen_bench_")
+
+    try:
+        started = time.perf_counter()
+
+        master = generateProtocol(
+            directory,
+            files=params["files"],
+            packets=params["packets"],
+            fields=params["fields"],
+            depth=params["depth"],
+            enum_values=params["enum_values"],
+            seed=params["seed"],
+        )
+
+        generate_time = time.perf_counter() - started
+
+        rng = random.Random(params["seed"])
+
+        runs = [runOnce(master, params, rng) for _ in range(params["repeat"])]
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "benchmark": "parse",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": gitCommit(),
+        "pidgen": PIDGEN_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "generate_time": generate_time,
+        "elements": runs[0]["elements"],
+        "files": runs[0]["files"],
+        "phases": dict((phase, summarize([r[phase] for r in runs])) for phase in PHASES),
+    }
+
+
+def printResults(results, baseline=None):
+
+    print("Parse benchmark - {e} elements in {f} files".format(e=results["elements"], f=results["files"]))
+    print("")
+
+    header = "{p:<12}{m:>12}{med:>12}".format(p="Phase", m="Min (ms)", med="Median (ms)")
+
+    if baseline is not None:
+        header += "{b:>14}{r:>10}".format(b="Baseline (ms)", r="Ratio")
+
+    print(header)
+
+    for phase in PHASES:
+        result = results["phases"][phase]
+
+        line = "{p:<12}{m:>12.2f}{med:>12.2f}".format(p=phase, m=result["min"] * 1000, med=result["median"] * 1000)
+
+        if baseline is not None and phase in baseline["phases"]:
+            base = baseline["phases"][phase]["median"]
+
+            line += "{b:>14.2f}".format(b=base * 1000)
+
+            if base > 0:
+                line += "{r:>10.2f}".format(r=result["median"] / base)
+
+        print(line)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Pidgen parse benchmark")
+
+    parser.add_argument("--files", help="Number of protocol files", type=int, default=10)
+    parser.add_argument("--packets", help="Number of packets per file", type=int, default=10)
+    parser.add_argument("--fields", help="Number of fields per packet", type=int, default=8)
+    parser.add_argument("--depth", help="Depth of <Require> chains", type=int, default=1)
+    parser.add_argument("--enum-values", help="Number of enumeration values", type=int, default=100)
+    parser.add_argument("--lookups", help="Number of name lookups", type=int, default=100)
+    parser.add_argument("--repeat", help="Number of repetitions", type=int, default=5)
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    parser.add_argument("--lazy", help="Load the protocol lazily", action="store_true")
+    parser.add_argument("--output", help="Write results to a JSON file", metavar="FILE")
+    parser.add_argument("--compare", help="Compare results against a previous JSON file", metavar="FILE")
+
+    args = parser.parse_args()
+
+    params = {
+        "files": args.files,
+        "packets": args.packets,
+        "fields": args.fields,
+        "depth": args.depth,
+        "enum_values": args.enum_values,
+        "lookups": args.lookups,
+        "repeat": max(1, args.repeat),
+        "seed": args.seed,
+        "lazy": args.lazy,
+    }
+
+    results = runBenchmark(params)
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare, "r") as json_file:
+            baseline = json.load(json_file)
+
+        if baseline.get("params") != params:
+            print("Warning: baseline was generated with different parameters")
+
+    printResults(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic protocol generator.
+
+Generates a protocol of configurable size, for benchmarking:
+
+- A master protocol file, which defines a (large) packet ID enumeration
+- N protocol files, each containing M packets of K fields and a shared struct
+- Files are included through <Require> chains of configurable depth
+"""
+
+import os
+import random
+
+
+# Datatypes used for generated fields
+DATATYPES = ["u8", "i8", "u16", "i16", "u32", "i32", "u64", "i64", "f32", "f64"]
+
+
+def packetName(file_idx, packet_idx):
+    return "Packet_{f}_{p}".format(f=file_idx, p=packet_idx)
+
+
+def structName(file_idx):
+    return "Struct_{f}".format(f=file_idx)
+
+
+def fileName(file_idx):
+    return "file_{f}.xml".format(f=file_idx)
+
+
+def generateProtocol(directory, files=10, packets=10, fields=8, depth=1, enum_values=100, seed=0):
+    """
+    Generate a synthetic protocol.
+
+    Args:
+        directory - Directory to write the protocol files into (created if required)
+
+    kwargs:
+        files - Number of protocol files (N)
+        packets - Number of packets per file (M)
+        fields - Number of fields per packet (K)
+        depth - Length of each <Require> chain (1 = every file is required by the master file)
+        enum_values - Number of values in the generated enumeration (at least one per packet)
+        seed - Random seed, so that generated protocols are reproducible
+
+    Return:
+        Path to the master protocol file
+    """
+
+    rng = random.Random(seed)
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    depth = max(1, depth)
+
+    n_packets = files * packets
+    enum_values = max(enum_values, n_packets)
+
+    # Master file
+    lines = [
+        "<Protocol name='synthetic' version='1.0'>",
+        "",
+        "<Enum name='PacketIds' prefix='PKT_'>",
+    ]
+
+    for idx in range(enum_values):
+        lines.append("    <Value name='ID_{i}'/>".format(i=idx))
+
+    lines += [
+        "</Enum>",
+        "",
+    ]
+
+    # The master file includes the head of each chain
+    for idx in range(0, files, depth):
+        lines.append("<Require file='{f}'/>".format(f=fileName(idx)))
+
+    lines += [
+        "",
+        "</Protocol>",
+    ]
+
+    master = os.path.join(directory, "protocol.xml")
+
+    with open(master, "w") as xml_file:
+        xml_file.write("\n".join(lines) + "\n")
+
+    # Protocol files
+    for file_idx in range(files):
+
+        lines = [
+            "<Protocol>",
+            "",
+        ]
+
+        # Each file requires the next file in its chain
+        if (file_idx + 1) % depth != 0 and file_idx + 1 < files:
+            lines.append("<Require file='{f}'/>".format(f=fileName(file_idx + 1)))
+            lines.append("")
+
+        lines.append("<Struct name='{s}'>".format(s=structName(file_idx)))
+        lines.append("    <Data name='x' datatype='i16'/>")
+        lines.append("    <Data name='y' datatype='i16'/>")
+        lines.append("    <Data name='z' datatype='i16'/>")
+        lines.append("</Struct>")
+        lines.append("")
+
+        for packet_idx in range(packets):
+
+            n = file_idx * packets + packet_idx
+
+            lines.append("<Packet name='{p}' id='PKT_ID_{n}' comment='Synthetic packet {n}'>".format(
+                p=packetName(file_idx, packet_idx),
+                n=n
+            ))
+
+            for field_idx in range(fields):
+
+                if field_idx == 0:
+                    lines.append("    <Data name='f{i}' struct='{s}'/>".format(i=field_idx, s=structName(file_idx)))
+                    continue
+
+                datatype = rng.choice(DATATYPES)
+
+                extra = ""
+
+                if rng.random() < 0.25:
+                    extra = " minValue='0' maxValue='100'"
+
+                lines.append("    <Data name='f{i}' datatype='{t}'{e} comment='Field {i}'/>".format(
+                    i=field_idx,
+                    t=datatype,
+                    e=extra
+                ))
+
+            lines.append("</Packet>")
+            lines.append("")
+
+        lines.append("</Protocol>")
+
+        with open(os.path.join(directory, fileName(file_idx)), "w") as xml_file:
+            xml_file.write("\n".join(lines) + "\n")
+
+    return master
@@ -7,6 +7,15 @@ from . import enumeration
 from . import struct
 from . import packet
 from . import data
+from . import ir
+from . import layout
+from . import linker
+from . import codec
+from . import crc
+from . import framing
+from . import export
+from . import metrics
+from . import records
 from . import version
 
 __version__ = version.PIDGEN_VERSION
@@ -5,25 +5,98 @@ Run this script to parse a set of protocol files using Pidgen.
 
 python -m Pidgen <path/to/protocol>
 
+To decode a capture file into a columnar (.npy / .npz) store for each packet type:
+
+python -m Pidgen decode <path/to/capture> --protocol <path/to/protocol> --out <dir>
+
 For help, run:
 
 python -m Pidgen -h
+python -m Pidgen decode -h
 """
 
 from __future__ import print_function
 
 import argparse
+import cProfile
+import pstats
 import sys
 
 from .version import PIDGEN_VERSION
 from .protocolparser import PidgenProtocolParser
+from .ir import exportIR
+from .export import exportCapture, CHUNK_SIZE
+from .framing import PidgenFramedStream
+from .packet import PidgenPacket
 from . import debug
+from . import memory
+from . import timing
 
 __version__ = PIDGEN_VERSION
 
 
+def decode(argv):
+    """
+    Decode a capture file, and export the decoded values as columns (see export.py).
+    If the protocol defines a <Framing> element, the capture is decoded as a stream of frames.
+    """
+
+    parser = argparse.ArgumentParser(description="Pidgen - Decode a capture file - v{version}".format(version=PIDGEN_VERSION))
+
+    parser.add_argument("capture", help="Path to capture file")
+
+    parser.add_argument("-p", "--protocol", help="Path to protocol definition file", required=True)
+    parser.add_argument("-o", "--out", help="Output directory", required=True)
+    parser.add_argument("--npz", help="Bundle the columns for each packet type into a single .npz file", action="store_true")
+    parser.add_argument("--chunk-size", help="Number of bytes decoded at once (default = {n})".format(n=CHUNK_SIZE), type=int, default=CHUNK_SIZE)
+    parser.add_argument("--aligned", help="Decode packets with the naturally aligned layout", action="store_true")
+    parser.add_argument("--no-color", help="Disable colorized debug output", action="store_true")
+    parser.add_argument("-v", "--verbose", help="Print verbose output", action="count")
+
+    args = parser.parse_args(argv)
+
+    if args.no_color:
+        debug.setDebugColorOn(False)
+
+    debug.setDebugLevel(int(args.verbose) if args.verbose is not None else debug.MSG_ERROR)
+
+    protocol = PidgenProtocolParser(args.protocol)
+
+    packets = protocol.getChildren(PidgenPacket, traverse_children=True)
+
+    stream = None
+
+    if protocol.framing is not None:
+        stream = PidgenFramedStream(packets, protocol.framing, packed=not args.aligned)
+
+    debug.message("Decoding '{c}' to '{d}'".format(c=args.capture, d=args.out))
+
+    counts = exportCapture(
+        packets,
+        args.capture,
+        args.out,
+        stream=stream,
+        chunk_size=args.chunk_size,
+        npz=args.npz,
+        packed=not args.aligned
+    )
+
+    for name, count in sorted((counts or {}).items()):
+        debug.message("{name}: {n} packets".format(name=name, n=count))
+
+    errors = debug.getErrorCount()
+
+    if errors > 0:
+        debug.error("Exiting with {n} errors".format(n=errors))
+
+    sys.exit(errors)
+
+
 def main():
 
+    if len(sys.argv) > 1 and sys.argv[1] == "decode":
+        decode(sys.argv[2:])
+
     parser = argparse.ArgumentParser(description="Pidgen - Protocol Generation Tool - v{version}".format(version=PIDGEN_VERSION))
 
     # Position arguments
@@ -32,6 +105,11 @@ def main():
     # Optional arguments
     parser.add_argument("--no-color", help="Disable colorized debug output", action="store_true")
     parser.add_argument("-v", "--verbose", help="Print verbose output", action="count")
+    parser.add_argument("--ir", help="Export the parsed protocol to a binary IR file", metavar="FILE")
+    parser.add_argument("--compact", help="Release the XML data once parsed, to reduce memory usage", action="store_true")
+    parser.add_argument("--memory", help="Print memory usage for each type of element", action="store_true")
+    parser.add_argument("--timings", help="Print timing information for each phase of parsing", action="store_true")
+    parser.add_argument("--profile", help="Profile the parser, and write the profile (pstats) data to a file", metavar="FILE")
 
     parser.add_argument("--version", action="version", version="Pidgen version: {v}".format(v=PIDGEN_VERSION))
 
@@ -51,8 +129,43 @@ def main():
 
     debug.message("Loading protocol from '{f}'".format(f=protocol_file))
 
+    if args.timings:
+        timing.enable(True)
+
+    profiler = None
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     # Parse the protocol
-    PidgenProtocolParser(protocol_file)
+    if args.memory:
+        protocol, current, peak = memory.trace(PidgenProtocolParser, protocol_file, compact=args.compact)
+    else:
+        protocol = PidgenProtocolParser(protocol_file, compact=args.compact)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+        debug.message("Profile data written to '{f}'".format(f=args.profile))
+
+        print("")
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(20)
+
+    if args.timings:
+        timing.enable(False)
+
+        print("")
+        print(timing.report())
+
+    if args.memory:
+        print("")
+        print(memory.report(memory.measure(protocol), current, peak))
+
+    if args.ir:
+        debug.message("Exporting protocol IR to '{f}'".format(f=args.ir))
+        exportIR(protocol, args.ir)
 
     errors = debug.getErrorCount()
 
@@ -0,0 +1,1699 @@
+# -*- coding: utf-8 -*-
+
+"""
+Encoding and decoding of packets.
+
+A codec plan is compiled from the layout of a struct (or packet).
+Any nested structs are inlined into a single flat list of fields (with dotted names, e.g. 'position.x'),
+and a single struct.Struct format is generated for the entire packet.
+
+Decoding a packet is then a single (C-level) unpack operation, no matter how deeply the structs are nested.
+
+Arrays of primitive values are encoded with a struct repeat count (e.g. '256H'),
+and are decoded as a single tuple value.
+
+Batches of packets can be encoded / decoded with NumPy (if installed),
+using a structured dtype which mirrors the packet layout.
+
+The byte order of each packet is taken from the 'endian' setting (little-endian by default).
+Batches with a non-native byte order are byte-swapped as a whole (every column in a single operation).
+
+Packets with conditional fields (the 'dependsOn' key) use a PidgenConditionalPlan.
+The fixed prefix of the packet is decoded in a single unpack operation,
+and the controlling values then select a precompiled plan for the remainder of the packet.
+
+Bitfields which share a storage word are encoded as a single value (the storage word).
+Packets with bitfields use a generated function (with precomputed masks and shifts)
+which splits (or combines) every storage word in a single pass.
+
+Strings with a fixed capacity are encoded as a fixed-size field (struct format '16s').
+Packets with length-prefixed strings use a PidgenVariablePlan, which decodes each run of
+fixed-size fields in a single unpack operation, and slices each string from the buffer (with a memoryview).
+Strings are decoded as raw bytes, and are only decoded to text when converted (convert=True).
+
+Packets can also be decoded into a reusable record object (with __slots__, see records.py) with decodeInto,
+or into a row of a preallocated NumPy array with decodeRow, rather than allocating a new dict for every packet.
+"""
+
+import copy
+import itertools
+import struct
+import sys
+
+from .data import PidgenDataElement as Data
+from .layout import PidgenStructLayout
+from .conversion import compileConversion
+from .validation import compileValidator
+from .records import compileRecordClass, PidgenRecordPool
+from . import debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Map of encoded datatypes to struct format characters
+STRUCT_FORMAT = Data._STRUCT_FORMAT
+
+# Map of encoded datatypes to NumPy dtype strings (without byte order)
+NUMPY_FORMAT = Data._NUMPY_FORMAT
+
+# Byte order prefix of the host
+NATIVE_ORDER = "<" if sys.byteorder == "little" else ">"
+
+
+class PidgenCodecField():
+    """
+    A single primitive value (or array of primitive values) in a flattened codec plan.
+
+    Attributes:
+        name - Dotted name of the field (e.g. 'position.x')
+        field - PidgenFieldLayout of the underlying data element
+        offset - Byte offset of the value within the packet
+        count - Number of values (for array fields), or None
+        format - struct format character
+        conversion - PidgenConversion between the in-memory and encoded values (or None)
+        bits - Number of bits, for a bitfield (None otherwise)
+        shift - Position (bits) of a bitfield within its storage word
+        mask - Mask of a bitfield (after shifting)
+        signed - True if a bitfield is sign-extended when decoded
+    """
+
+    def __init__(self, name, field, offset, count=None):
+
+        self.name = name
+        self.field = field
+        self.offset = offset
+        self.count = count
+        self.conversion = compileConversion(field.element)
+
+        self.bits = field.bits
+        self.shift = field.bitOffset
+        self.mask = None if self.bits is None else (1 << self.bits) - 1
+        self.signed = self.bits is not None and field.encoding in [Data.DATA_S8, Data.DATA_S16, Data.DATA_S32, Data.DATA_S64]
+
+        if field.encoding == Data.DATA_STR:
+            # Fixed-capacity string
+            self.format = "{n}s".format(n=field.itemSize)
+        else:
+            self.format = STRUCT_FORMAT[field.encoding]
+
+    def __repr__(self):
+        return "<{n} @ {o}>".format(n=self.name, o=self.offset)
+
+    @property
+    def element(self):
+        return self.field.element
+
+    @property
+    def size(self):
+        """ Encoded size (bytes) of this field """
+        return self.field.itemSize * (self.count or 1)
+
+    @property
+    def structFormat(self):
+        """ struct format for this field (including the repeat count for arrays) """
+
+        if self.count is None:
+            return self.format
+
+        if self.field.encoding == Data.DATA_STR:
+            # The struct repeat count of a string is its length, so each item is listed separately
+            return self.format * self.count
+
+        return "{n}{c}".format(n=self.count, c=self.format)
+
+    def dtype(self, byteorder="<"):
+        """ Return the NumPy dtype specification for this field """
+
+        if self.field.encoding == Data.DATA_STR:
+            fmt = "S{n}".format(n=self.field.itemSize)
+        else:
+            fmt = byteorder + NUMPY_FORMAT[self.field.encoding]
+
+        if self.count is None:
+            return fmt
+
+        return (fmt, (self.count,))
+
+    @property
+    def limits(self):
+        """ Return the (min, max) range of values which can be stored in a bitfield (or None for other fields) """
+
+        if self.bits is None:
+            return None
+
+        if self.signed:
+            half = 1 << (self.bits - 1)
+            return -half, half - 1
+
+        return 0, self.mask
+
+    def extract(self, word):
+        """ Extract the value of a bitfield from its storage word """
+
+        value = (word >> self.shift) & self.mask
+
+        if self.signed:
+            half = 1 << (self.bits - 1)
+            value = (value ^ half) - half
+
+        return value
+
+    def extractColumn(self, column):
+        """ Extract the value of a bitfield from an entire column (NumPy array) of storage words """
+
+        column = ((column >> self.shift) & self.mask).astype(numpy.dtype(NUMPY_FORMAT[self.field.encoding]))
+
+        if self.signed:
+            half = 1 << (self.bits - 1)
+            column = (column ^ half) - half
+
+        return column
+
+    @property
+    def default(self):
+        """ Value used when encoding, if no value is provided for this field """
+
+        value = self._scalarDefault()
+
+        if self.count is None:
+            return value
+
+        return (value,) * self.count
+
+    def _scalarDefault(self):
+        """ Return the (encoded) default value, from the in-memory 'default' key """
+
+        value = self.element.get(["default", "defaultvalue"], None)
+
+        if self.field.encoding == Data.DATA_STR:
+            return self.conversion.encode(value or "")
+
+        datatype = self.field.encoding if self.conversion is None else self.conversion.datatype
+
+        is_float = datatype in [Data.DATA_F16, Data.DATA_F32, Data.DATA_F64]
+
+        if value is None:
+            value = 0.0 if is_float else 0
+        else:
+            try:
+                if is_float:
+                    value = float(value.rstrip("fF"))
+                else:
+                    value = int(value, 0)
+            except ValueError:
+                debug.warning("Invalid default value '{v}' for '{n}' - {f}".format(
+                    v=value,
+                    n=self.name,
+                    f=self.element.path
+                ))
+
+                value = 0
+
+        if self.conversion is not None:
+            value = self.conversion.encode(value)
+
+        return value
+
+
+class PidgenPlan():
+    """
+    Base class of the encoding / decoding plans, with the members which are common to every plan.
+
+    Attributes:
+        layout - PidgenStructLayout which the plan was compiled from
+        byteOrder - Byte order prefix ('<' or '>'), from the 'endian' setting of the struct
+        size - Encoded size (bytes), or None if the size depends on the values
+        dtype - NumPy structured dtype of the packet, or None if the packet does not have a fixed layout
+    """
+
+    size = None
+    dtype = None
+
+    def __init__(self, layout):
+
+        self.layout = layout
+        self.byteOrder = layout.struct.byteOrder
+
+        self._validator = None
+        self._recordClass = None
+        self._pool = None
+
+    def encodeInto(self, buffer, offset, values, convert=False):
+        """
+        Encode a packet directly into a writable buffer, at the given offset.
+
+        Return:
+            Number of bytes written
+        """
+
+        data = self.encode(values, convert=convert)
+
+        buffer[offset:offset + len(data)] = data
+
+        return len(data)
+
+    def _compileValidator(self):
+        return compileValidator(self)
+
+    @property
+    def validator(self):
+        """
+        Return the compiled validator for this packet (see PidgenValidator).
+        The validator checks in-memory values, i.e. records decoded with convert=True.
+        """
+
+        if self._validator is None:
+            self._validator = self._compileValidator()
+
+        return self._validator
+
+    @property
+    def recordClass(self):
+        """ Return the generated record class for this packet (see records.py) """
+
+        if self._recordClass is None:
+            self._recordClass = compileRecordClass(self)
+
+        return self._recordClass
+
+    @property
+    def pool(self):
+        """ Return the pool of reusable records for this packet (see PidgenRecordPool) """
+
+        if self._pool is None:
+            self._pool = PidgenRecordPool(self.recordClass)
+
+        return self._pool
+
+    def decodeInto(self, buffer, offset=0, record=None, convert=False):
+        """
+        Decode a packet into a record object, rather than a new dict.
+        Fields which are not present (e.g. conditional fields) are set to None.
+
+        Args:
+            buffer - Any bytes-like object
+
+        kwargs:
+            offset - Offset of the packet within the buffer
+            record - Record to decode into (an instance of self.recordClass).
+                     If not provided, a record is acquired from self.pool (and should be released once no longer required)
+            convert - If True, convert the decoded values to their in-memory representation
+
+        Return:
+            The record
+        """
+
+        if record is None:
+            record = self.pool.acquire()
+
+        return record.update(self.decode(buffer, offset, convert=convert))
+
+
+class PidgenCodecPlan(PidgenPlan):
+    """
+    Flattened encoding / decoding plan for a struct (or packet).
+
+    Attributes:
+        layout - PidgenStructLayout which the plan was compiled from
+        fields - Flat list of PidgenCodecField objects
+        names - Flat list of field names (in encoded order)
+        words - List of (name, fields) for each encoded value, where bitfields which share a storage word
+                are grouped together (named e.g. 'mode|armed'), and every other field is a group of one
+        byteOrder - Byte order prefix for the struct format ('<' or '>'), from the 'endian' setting of the struct
+        format - struct format string for the entire packet
+        size - Encoded size (bytes)
+        minSize / maxSize - Minimum and maximum encoded size (bytes), always equal to size
+    """
+
+    def __init__(self, layout):
+
+        PidgenPlan.__init__(self, layout)
+
+        self.fields = []
+
+        self._flatten(layout, "", 0)
+
+        self.names = [f.name for f in self.fields]
+
+        words = []
+
+        for f in self.fields:
+            if f.bits is not None and f.shift > 0:
+                # Bitfield which shares the storage word of the previous field
+                words[-1].append(f)
+            else:
+                words.append([f])
+
+        self.words = [("|".join(f.name for f in fields), fields) for fields in words]
+
+        self.hasBits = any(f.bits is not None for f in self.fields)
+
+        self.format = self.byteOrder + self._buildFormat()
+        self.codec = struct.Struct(self.format)
+        self.size = self.codec.size
+
+        self.minSize = self.size
+        self.maxSize = self.size
+
+        self._defaults = dict((f.name, f.default) for f in self.fields)
+
+        # Array fields occupy a slice of the unpacked values
+        self.hasArrays = any(f.count is not None for f in self.fields)
+
+        self._slices = []
+
+        idx = 0
+
+        for f in self.fields:
+            if f.count is None:
+                self._slices.append((f.name, idx, None))
+                idx += 1
+            else:
+                self._slices.append((f.name, idx, idx + f.count))
+                idx += f.count
+
+        # Fields which require conversion between in-memory and encoded values
+        self._conversions = [(f.name, f.conversion, f.count is not None) for f in self.fields if f.conversion is not None]
+
+        # Fixed-capacity strings (which struct would silently truncate): (name, capacity, is_array)
+        self._strings = [(f.name, f.field.itemSize, f.count is not None) for f in self.fields if f.field.encoding == Data.DATA_STR]
+
+        # Individual field codecs, for lazy (view) access: name -> (struct.Struct, offset, is_array, bitfield)
+        self._fieldCodecs = dict(
+            (f.name, (struct.Struct(self.byteOrder + f.structFormat), f.offset, f.count is not None, f if f.bits is not None else None))
+            for f in self.fields
+        )
+
+        # Packets with bitfields are split / combined by generated functions
+        self._unpack = None
+        self._pack = None
+
+        if self.hasBits:
+            self._compileBits()
+
+        self._dtype = None
+        self._nativeDtype = None
+
+        self._fill = None
+
+    def __repr__(self):
+        return "<Plan '{n}' '{f}'>".format(n=self.layout.struct.name, f=self.format)
+
+    def _flatten(self, layout, prefix, offset):
+        """
+        Recursively inline the fields of a layout (and any nested layouts).
+        Elements of struct arrays are named with an index, e.g. 'history[2].x'
+        """
+
+        for field in layout.fields:
+
+            name = prefix + field.name
+
+            if field.isArray and not field.isStruct:
+                # Arrays of primitive values are kept as a single field
+                self.fields.append(PidgenCodecField(name, field, offset + field.offset, count=field.count))
+                continue
+
+            for idx in range(field.count):
+
+                item_name = name
+                item_offset = offset + field.offset + idx * field.itemSize
+
+                if field.isArray:
+                    item_name += "[{i}]".format(i=idx)
+
+                if field.isStruct:
+                    self._flatten(field.layout, item_name + ".", item_offset)
+                else:
+                    self.fields.append(PidgenCodecField(item_name, field, item_offset))
+
+    def _compileBits(self):
+        """
+        Generate the functions which convert between the unpacked values (with a single value for each storage word)
+        and the (dotted) field values, using precomputed masks and shifts.
+        Bitfield values are range-checked when packed (raising struct.error, as for other fields).
+        """
+
+        unpack = ["def unpack(v):", "    return {"]
+        checks = ["def pack(values):", "    g = values.get"]
+        pack = ["    return ["]
+
+        idx = 0
+
+        for name, fields in self.words:
+
+            f = fields[0]
+
+            if f.bits is None:
+                if f.count is None:
+                    unpack.append("        {n!r}: v[{i}],".format(n=f.name, i=idx))
+                    pack.append("        g({n!r}, d[{n!r}]),".format(n=f.name))
+                    idx += 1
+                else:
+                    unpack.append("        {n!r}: v[{i}:{j}],".format(n=f.name, i=idx, j=idx + f.count))
+                    pack.append("        *g({n!r}, d[{n!r}]),".format(n=f.name))
+                    idx += f.count
+
+                continue
+
+            terms = []
+
+            for f in fields:
+
+                value = "(v[{i}] >> {s}) & {m}".format(i=idx, s=f.shift, m=f.mask) if f.shift > 0 else "v[{i}] & {m}".format(i=idx, m=f.mask)
+
+                if f.signed:
+                    half = 1 << (f.bits - 1)
+                    value = "(({v}) ^ {h}) - {h}".format(v=value, h=half)
+
+                unpack.append("        {n!r}: {v},".format(n=f.name, v=value))
+
+                lo, hi = f.limits
+                local = "b{i}".format(i=len(checks) // 2 - 1)
+
+                checks.append("    {b} = g({n!r}, d[{n!r}])".format(b=local, n=f.name))
+                checks.append("    if not {lo} <= {b} <= {hi}: raise error({msg!r}.format({b}))".format(
+                    b=local,
+                    lo=lo,
+                    hi=hi,
+                    msg="Bitfield '{n}' requires {lo} <= value <= {hi} (got {{}})".format(n=f.name, lo=lo, hi=hi)
+                ))
+
+                term = "({b} & {m})".format(b=local, m=f.mask)
+
+                if f.shift > 0:
+                    term += " << {s}".format(s=f.shift)
+
+                terms.append("({t})".format(t=term))
+
+            word = " | ".join(terms)
+
+            # Signed storage words are packed as signed values
+            if fields[0].field.encoding in [Data.DATA_S8, Data.DATA_S16, Data.DATA_S32, Data.DATA_S64]:
+                half = 1 << (8 * fields[0].field.itemSize - 1)
+                word = "(({w}) ^ {h}) - {h}".format(w=word, h=half)
+
+            pack.append("        {w},".format(w=word))
+
+            idx += 1
+
+        unpack.append("    }")
+        pack.append("    ]")
+
+        self.source = "\n".join(unpack + [""] + checks + pack) + "\n"
+
+        namespace = {"d": self._defaults, "error": struct.error}
+
+        exec(compile(self.source, "<pidgen codec '{n}'>".format(n=self.layout.struct.name), "exec"), namespace)
+
+        self._unpack = namespace["unpack"]
+        self._pack = namespace["pack"]
+
+    def _buildFormat(self):
+        """
+        Build the struct format string, including any alignment padding.
+        Bitfields which share a storage word are encoded as a single value.
+        """
+
+        fmt = ""
+        position = 0
+
+        for name, fields in self.words:
+
+            field = fields[0]
+
+            if field.offset > position:
+                fmt += "{n}x".format(n=field.offset - position)
+
+            fmt += field.structFormat
+            position = field.offset + field.size
+
+        if self.layout.size > position:
+            fmt += "{n}x".format(n=self.layout.size - position)
+
+        return fmt
+
+    def sizeOf(self, buffer, offset=0):
+        """ Return the encoded size (bytes) of the packet in the buffer """
+        return self.size
+
+    def view(self, buffer, offset=0):
+        """
+        Return a lazy view of a packet in the buffer.
+        Fields are only decoded when they are accessed.
+        """
+
+        return PidgenPacketView(self, buffer, offset)
+
+    def decodeField(self, name, buffer, offset=0):
+        """
+        Decode a single field of a packet from the buffer.
+
+        Args:
+            name - (Dotted) name of the field
+            buffer - Buffer containing the packet
+
+        kwargs:
+            offset - Offset of the packet within the buffer
+        """
+
+        codec, field_offset, is_array, bitfield = self._fieldCodecs[name]
+
+        if is_array:
+            return codec.unpack_from(buffer, offset + field_offset)
+
+        if bitfield is not None:
+            return bitfield.extract(codec.unpack_from(buffer, offset + field_offset)[0])
+
+        return codec.unpack_from(buffer, offset + field_offset)[0]
+
+    def decodeTuple(self, buffer, offset=0):
+        """
+        Decode a packet from the buffer, returning a flat tuple of values (in encoded order).
+        Bitfields which share a storage word are returned as a single value (the storage word).
+        """
+
+        return self.codec.unpack_from(buffer, offset)
+
+    def decode(self, buffer, offset=0, convert=False):
+        """
+        Decode a packet from the buffer.
+
+        Args:
+            buffer - Any bytes-like object
+
+        kwargs:
+            offset - Offset of the packet within the buffer
+            convert - If True, convert the decoded values to their in-memory representation
+
+        Return:
+            Dict of (dotted) field names to values. Array fields are decoded as a tuple.
+        """
+
+        values = self.codec.unpack_from(buffer, offset)
+
+        if self._unpack is not None:
+            values = self._unpack(values)
+        elif not self.hasArrays:
+            values = dict(zip(self.names, values))
+        else:
+            values = dict((name, values[start] if stop is None else values[start:stop]) for name, start, stop in self._slices)
+
+        if convert and len(self._conversions) > 0:
+            self.toMemory(values)
+
+        return values
+
+    def decodeSized(self, buffer, offset=0, convert=False):
+        """ Decode a packet from the buffer, returning a (values, encoded size) tuple """
+        return self.decode(buffer, offset, convert=convert), self.size
+
+    def toMemory(self, values):
+        """
+        Convert a dict of decoded (encoded) values to their in-memory representation (in place).
+        """
+
+        for name, conversion, is_array in self._conversions:
+            if is_array:
+                values[name] = tuple(map(conversion.decode, values[name]))
+            else:
+                values[name] = conversion.decode(values[name])
+
+        return values
+
+    def toEncoded(self, values):
+        """
+        Convert a dict of in-memory values to their encoded representation.
+        Returns a new dict (the provided values are not modified).
+        """
+
+        if len(self._conversions) == 0:
+            return values
+
+        values = dict(values)
+
+        for name, conversion, is_array in self._conversions:
+            if name not in values:
+                continue
+
+            if is_array:
+                values[name] = tuple(map(conversion.encode, values[name]))
+            else:
+                values[name] = conversion.encode(values[name])
+
+        return values
+
+    def _checkStrings(self, values):
+        """ Check that fixed-capacity strings fit within their capacity (struct would truncate them) """
+
+        for name, capacity, is_array in self._strings:
+
+            value = values.get(name, None)
+
+            if value is None:
+                continue
+
+            for item in (value if is_array else (value, )):
+                if len(item) > capacity:
+                    raise struct.error("String '{n}' is too long ({l} > {m} bytes)".format(n=name, l=len(item), m=capacity))
+
+    def _values(self, values):
+
+        if self._strings:
+            self._checkStrings(values)
+
+        if self._pack is not None:
+            return self._pack(values)
+
+        defaults = self._defaults
+
+        if not self.hasArrays:
+            return [values.get(name, defaults[name]) for name in self.names]
+
+        result = []
+
+        for name, start, stop in self._slices:
+            if stop is None:
+                result.append(values.get(name, defaults[name]))
+            else:
+                result.extend(values.get(name, defaults[name]))
+
+        return result
+
+    def encode(self, values, convert=False):
+        """
+        Encode a packet.
+
+        Args:
+            values - Dict of (dotted) field names to values. Any missing fields use their default value.
+                     Array fields must provide exactly 'count' values.
+
+        kwargs:
+            convert - If True, the provided values are in-memory values (and are converted before encoding)
+
+        Return:
+            Encoded bytes
+        """
+
+        if convert:
+            values = self.toEncoded(values)
+
+        return self.codec.pack(*self._values(values))
+
+    def encodeInto(self, buffer, offset, values, convert=False):
+        """
+        Encode a packet directly into a writable buffer, at the given offset.
+
+        Return:
+            Number of bytes written
+        """
+
+        if convert:
+            values = self.toEncoded(values)
+
+        self.codec.pack_into(buffer, offset, *self._values(values))
+
+        return self.size
+
+    def _compileFill(self):
+        """
+        Generate the functions which decode a packet into a record (one assignment per field).
+        Returns a pair of functions - (unconverted, converted).
+        """
+
+        namespace = {
+            "unpack_from": self.codec.unpack_from,
+            "unpack": self._unpack,
+        }
+
+        conversions = dict((name, idx) for idx, (name, conversion, is_array) in enumerate(self._conversions))
+
+        for idx, (name, conversion, is_array) in enumerate(self._conversions):
+            namespace["c{i}".format(i=idx)] = conversion.decode
+
+        lines = []
+
+        for convert in [False, True]:
+
+            lines += [
+                "def {f}(buffer, offset, r):".format(f="fillConverted" if convert else "fill"),
+                "    v = unpack_from(buffer, offset)",
+            ]
+
+            if self._unpack is not None:
+                lines.append("    v = unpack(v)")
+
+            for (name, start, stop), attr in zip(self._slices, self.recordClass.ATTRIBUTES):
+
+                if self._unpack is not None:
+                    value = "v[{n!r}]".format(n=name)
+                elif stop is None:
+                    value = "v[{i}]".format(i=start)
+                else:
+                    value = "v[{i}:{j}]".format(i=start, j=stop)
+
+                if convert and name in conversions:
+                    c = "c{i}".format(i=conversions[name])
+
+                    if stop is None:
+                        value = "{c}({v})".format(c=c, v=value)
+                    else:
+                        value = "tuple(map({c}, {v}))".format(c=c, v=value)
+
+                lines.append("    r.{a} = {v}".format(a=attr, v=value))
+
+            lines += ["    return r", ""]
+
+        exec(compile("\n".join(lines), "<pidgen record '{n}'>".format(n=self.layout.struct.name), "exec"), namespace)
+
+        return namespace["fill"], namespace["fillConverted"]
+
+    def decodeInto(self, buffer, offset=0, record=None, convert=False):
+        """
+        Decode a packet into a record object (see PidgenPlan.decodeInto).
+        Each field is assigned directly from the unpacked values (with a generated function).
+        """
+
+        if self._fill is None:
+            self._fill = self._compileFill()
+
+        if record is None:
+            record = self.pool.acquire()
+
+        return self._fill[1 if convert else 0](buffer, offset, record)
+
+    def newRows(self, count):
+        """
+        Return a preallocated NumPy array of (encoded) packet records, in the host byte order (see decodeRow).
+        """
+
+        if self.nativeDtype is None:
+            return None
+
+        return numpy.zeros(count, dtype=self.nativeDtype)
+
+    def decodeRow(self, buffer, rows, index, offset=0):
+        """
+        Decode a packet into a row of a preallocated NumPy array (see newRows), without any conversion.
+        Bitfields which share a storage word are stored as a single value (see self.words).
+
+        Args:
+            buffer - Any bytes-like object
+            rows - Structured array (with the dtype of this packet, in any byte order)
+            index - Index of the row to decode into
+        """
+
+        rows[index] = numpy.frombuffer(buffer, dtype=self.dtype, count=1, offset=offset)[0]
+
+    @property
+    def dtype(self):
+        """
+        Return a NumPy structured dtype which matches the encoded layout of this packet.
+        Array fields are represented as sub-array fields.
+        Bitfields which share a storage word are represented as a single field (see self.words).
+        """
+
+        if numpy is None:
+            debug.error("NumPy is required for batch encoding / decoding")
+            return None
+
+        if self._dtype is None:
+            self._dtype = numpy.dtype({
+                "names": [name for name, fields in self.words],
+                "formats": [fields[0].dtype(self.byteOrder) for name, fields in self.words],
+                "offsets": [fields[0].offset for name, fields in self.words],
+                "itemsize": self.size,
+            })
+
+        return self._dtype
+
+    @property
+    def swapped(self):
+        """ Return True if the byte order of this packet differs from the host byte order """
+        return self.byteOrder != NATIVE_ORDER
+
+    @property
+    def nativeDtype(self):
+        """
+        Return the NumPy structured dtype of this packet, in the host byte order.
+        """
+
+        dtype = self.dtype
+
+        if dtype is None:
+            return None
+
+        if self._nativeDtype is None:
+            self._nativeDtype = dtype.newbyteorder("=")
+
+        return self._nativeDtype
+
+    def decodeBatch(self, buffer, count=-1, offset=0):
+        """
+        Decode a batch of consecutive packets from a buffer, without copying.
+
+        Args:
+            buffer - Any bytes-like object containing back-to-back encoded packets
+
+        kwargs:
+            count - Number of packets to decode (default = all complete packets in the buffer)
+            offset - Offset of the first packet within the buffer
+
+        Return:
+            NumPy structured array (one record per packet)
+        """
+
+        dtype = self.dtype
+
+        if dtype is None:
+            return None
+
+        if count < 0:
+            count = (len(memoryview(buffer).cast("B")) - offset) // self.size
+
+        return numpy.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+
+    def decodeColumns(self, buffer, count=-1, offset=0):
+        """
+        Decode a batch of packets into a dict of columns, in their in-memory representation.
+
+        Columns which do not require conversion are (zero-copy) views into the buffer.
+        Columns which do require conversion are converted in a single vectorized operation.
+        Bitfields are extracted from their storage word column in a single vectorized operation.
+
+        If the packet byte order differs from the host byte order, the entire batch is
+        byte-swapped in a single operation first (rather than swapping each column separately).
+
+        Return:
+            Dict of field names to NumPy arrays
+        """
+
+        records = self.decodeBatch(buffer, count=count, offset=offset)
+
+        if records is None:
+            return None
+
+        if self.swapped:
+            records = records.byteswap().view(self.nativeDtype)
+
+        if self.hasBits:
+            columns = {}
+
+            for name, fields in self.words:
+                if fields[0].bits is None:
+                    columns[name] = records[name]
+                else:
+                    for f in fields:
+                        columns[f.name] = f.extractColumn(records[name])
+        else:
+            columns = dict((name, records[name]) for name in self.names)
+
+        for name, conversion, is_array in self._conversions:
+            columns[name] = conversion.decodeColumn(columns[name])
+
+        return columns
+
+    def encodeBatch(self, records, convert=False):
+        """
+        Encode a batch of packets.
+
+        Args:
+            records - Either a NumPy structured array (with field names matching this plan),
+                      or a dict of field names to columns (missing fields use their default value)
+
+        kwargs:
+            convert - If True, the provided columns are in-memory values (and are converted before encoding)
+
+        Return:
+            Encoded bytes (back-to-back packets)
+        """
+
+        dtype = self.dtype
+
+        if dtype is None:
+            return None
+
+        if convert:
+            columns = dict((name, records[name]) for name in self.names if not isinstance(records, dict) or name in records)
+
+            for name, conversion, is_array in self._conversions:
+                if name in columns:
+                    columns[name] = conversion.encodeColumn(columns[name])
+
+            records = columns
+
+        if not isinstance(records, dict) and records.dtype == dtype:
+            return numpy.ascontiguousarray(records).tobytes()
+
+        # Columns are assembled in the host byte order, and the batch is then byte-swapped in a single operation
+        native = self.nativeDtype
+
+        if isinstance(records, dict):
+            count = max(len(column) for column in records.values()) if len(records) > 0 else 0
+
+            array = numpy.empty(count, dtype=native)
+
+            # Missing fields use their default value
+            missing = [name for name in self.names if name not in records]
+
+            if len(missing) > 0:
+                records = dict(records)
+
+                for name in missing:
+                    records[name] = self._defaults[name]
+        else:
+            array = numpy.empty(len(records), dtype=native)
+
+        for name, capacity, is_array in self._strings:
+            column = numpy.asarray(records[name])
+
+            if column.dtype.kind == "S" and column.dtype.itemsize > capacity and numpy.any(numpy.char.str_len(column) > capacity):
+                raise struct.error("String '{n}' is too long (> {m} bytes)".format(n=name, m=capacity))
+
+        for name, fields in self.words:
+            if fields[0].bits is None:
+                array[name] = records[name]
+            else:
+                array[name] = self._combineColumn(fields, records, len(array))
+
+        if self.swapped:
+            array = array.byteswap()
+
+        return array.tobytes()
+
+    def _combineColumn(self, fields, records, count):
+        """ Combine the columns of the bitfields which share a storage word (in a single vectorized pass) """
+
+        word = numpy.zeros(count, dtype=numpy.uint64)
+
+        for f in fields:
+            column = numpy.asarray(records[f.name]).astype(numpy.int64)
+
+            lo, hi = f.limits
+
+            if numpy.any((column < lo) | (column > hi)):
+                raise struct.error("Bitfield '{n}' requires {lo} <= value <= {hi}".format(n=f.name, lo=lo, hi=hi))
+
+            column = column & f.mask
+            word |= column.astype(numpy.uint64) << numpy.uint64(f.shift)
+
+        return word.astype(numpy.dtype(NUMPY_FORMAT[fields[0].field.encoding]))
+
+
+class PidgenPacketView():
+    """
+    Lazy view of an encoded packet.
+    Fields are decoded (individually) on access, e.g. view['position.x']
+    The buffer is not copied, so the view is only valid while the buffer is unchanged.
+    """
+
+    __slots__ = ["plan", "buffer", "offset"]
+
+    def __init__(self, plan, buffer, offset=0):
+
+        self.plan = plan
+        self.buffer = buffer
+        self.offset = offset
+
+    def __getitem__(self, name):
+        return self.plan.decodeField(name, self.buffer, self.offset)
+
+    def __contains__(self, name):
+        return name in self.plan._fieldCodecs
+
+    def keys(self):
+        return list(self.plan.names)
+
+    def get(self, name, default=None):
+
+        if name not in self.plan._fieldCodecs:
+            return default
+
+        return self.plan.decodeField(name, self.buffer, self.offset)
+
+    def decode(self, convert=False):
+        """ Decode the entire packet """
+        return self.plan.decode(self.buffer, self.offset, convert=convert)
+
+
+class PidgenStringCodec():
+    """
+    A length-prefixed string field in a variable plan.
+
+    Attributes:
+        name - Name of the field
+        field - PidgenFieldLayout of the underlying data element
+        prefix - struct.Struct for the length prefix
+        maxLength - Maximum length (bytes) of the string, or None if only limited by the prefix
+        conversion - PidgenStringConversion between the encoded bytes and text
+        default - Value used when encoding, if no value is provided for this field
+    """
+
+    # String fields are never arrays
+    count = None
+
+    def __init__(self, name, field, byteorder="<"):
+
+        element = field.element
+
+        self.name = name
+        self.field = field
+        self.prefix = struct.Struct(byteorder + STRUCT_FORMAT[element.stringPrefix])
+        self.conversion = compileConversion(element)
+
+        limit = (1 << (8 * self.prefix.size)) - 1
+
+        self.maxLength = element.stringLength
+
+        if self.maxLength is not None and self.maxLength > limit:
+            debug.warning("String length {n} for '{name}' exceeds the length prefix - {f}".format(
+                n=self.maxLength,
+                name=name,
+                f=element.path
+            ))
+
+        self._limit = limit if self.maxLength is None else min(self.maxLength, limit)
+
+        self.default = self.conversion.encode(element.get(["default", "defaultvalue"], None) or "")
+
+    def __repr__(self):
+        return "<{n} (string)>".format(n=self.name)
+
+    @property
+    def element(self):
+        return self.field.element
+
+    def decode(self, buffer, offset):
+        """
+        Decode the string at the given offset.
+
+        Return:
+            (value, end) tuple, where value is the (raw) string bytes,
+            and end is the offset immediately after the string
+        """
+
+        length = self.prefix.unpack_from(buffer, offset)[0]
+
+        start = offset + self.prefix.size
+        end = start + length
+
+        data = memoryview(buffer)[start:end]
+
+        if len(data) != length:
+            raise struct.error("String '{n}' extends past the end of the buffer".format(n=self.name))
+
+        return bytes(data), end
+
+    def encode(self, value):
+        """ Encode a (raw) string value, including the length prefix """
+
+        if len(value) > self._limit:
+            raise struct.error("String '{n}' is too long ({l} > {m} bytes)".format(n=self.name, l=len(value), m=self._limit))
+
+        return self.prefix.pack(len(value)) + value
+
+
+class PidgenVariablePlan(PidgenPlan):
+    """
+    Encoding / decoding plan for a struct (or packet) which contains length-prefixed strings.
+
+    The packet is split into segments:
+    - Runs of fixed-size fields, each of which is decoded in a single unpack operation (PidgenCodecPlan)
+    - Length-prefixed strings (PidgenStringCodec)
+
+    Length-prefixed strings must be at the top level of the struct (not arrays),
+    and only packed layouts are supported.
+
+    Attributes:
+        layout - PidgenStructLayout which the plan was compiled from
+        byteOrder - Byte order prefix ('<' or '>'), from the 'endian' setting of the struct
+        segments - List of PidgenCodecPlan / PidgenStringCodec objects (in encoded order)
+        fields - Flat list of fields (PidgenCodecField / PidgenStringCodec objects)
+        names - Flat list of field names (in encoded order)
+        size - Always None (the size depends on the string lengths)
+        minSize / maxSize - Minimum and maximum encoded size (bytes), maxSize is None if unbounded
+    """
+
+    def __init__(self, layout):
+
+        PidgenPlan.__init__(self, layout)
+
+        if not layout.packed:
+            debug.error("Cannot compile codec for '{n}' - strings without a fixed capacity require a packed layout - {f}".format(
+                n=layout.struct.name,
+                f=layout.struct.path
+            ))
+
+            raise ValueError
+
+        self.segments = []
+
+        run = []
+
+        for field in layout.fields:
+
+            if field.size is not None:
+                run.append(field)
+                continue
+
+            element = field.element
+
+            if field.isStruct or field.isArray or field.encoding != Data.DATA_STR:
+                debug.error("Cannot compile codec for '{n}' - field '{name}' does not have a fixed size - {f}".format(
+                    n=layout.struct.name,
+                    name=field.name,
+                    f=element.path
+                ))
+
+                raise ValueError
+
+            if len(run) > 0:
+                self.segments.append(PidgenCodecPlan(subLayout(layout, run)))
+                run = []
+
+            self.segments.append(PidgenStringCodec(field.name, field, self.byteOrder))
+
+        if len(run) > 0:
+            self.segments.append(PidgenCodecPlan(subLayout(layout, run)))
+
+        self._strings = [isinstance(segment, PidgenStringCodec) for segment in self.segments]
+
+        self.fields = []
+
+        for segment, is_string in zip(self.segments, self._strings):
+            if is_string:
+                self.fields.append(segment)
+            else:
+                self.fields += segment.fields
+
+        self.names = [f.name for f in self.fields]
+
+        self._defaults = dict((f.name, f.default) for f in self.fields)
+
+        # Size of the fixed data before each length prefix, and after the last string
+        self._prefixes = []
+
+        gap = 0
+
+        for segment, is_string in zip(self.segments, self._strings):
+            if is_string:
+                self._prefixes.append((gap, segment.prefix))
+                gap = 0
+            else:
+                gap += segment.size
+
+        self._trailing = gap
+
+        strings = [segment for segment, is_string in zip(self.segments, self._strings) if is_string]
+
+        self.minSize = sum(segment.size for segment in self.segments if not isinstance(segment, PidgenStringCodec))
+        self.minSize += sum(string.prefix.size for string in strings)
+
+        if any(string.maxLength is None for string in strings):
+            self.maxSize = None
+        else:
+            self.maxSize = self.minSize + sum(string._limit for string in strings)
+
+    def __repr__(self):
+        return "<Variable plan '{n}' ({s} segments)>".format(n=self.layout.struct.name, s=len(self.segments))
+
+    def sizeOf(self, buffer, offset=0):
+        """
+        Return the encoded size (bytes) of the packet in the buffer,
+        or None if the buffer does not contain every length prefix.
+        Only the length prefixes are read.
+        """
+
+        length = len(buffer)
+        position = offset
+
+        for gap, prefix in self._prefixes:
+
+            position += gap
+
+            if position + prefix.size > length:
+                return None
+
+            position += prefix.size + prefix.unpack_from(buffer, position)[0]
+
+        return position + self._trailing - offset
+
+    def decodeSized(self, buffer, offset=0, convert=False):
+        """ Decode a packet from the buffer, returning a (values, encoded size) tuple """
+
+        values = {}
+
+        position = offset
+
+        for segment, is_string in zip(self.segments, self._strings):
+            if is_string:
+                values[segment.name], position = segment.decode(buffer, position)
+            else:
+                values.update(segment.decode(buffer, position))
+                position += segment.size
+
+        if convert:
+            self.toMemory(values)
+
+        return values, position - offset
+
+    def decode(self, buffer, offset=0, convert=False):
+        """
+        Decode a packet from the buffer.
+        Strings are decoded as bytes, unless convert is True.
+
+        Return:
+            Dict of (dotted) field names to values
+        """
+
+        return self.decodeSized(buffer, offset, convert=convert)[0]
+
+    def toMemory(self, values):
+        """
+        Convert a dict of decoded (encoded) values to their in-memory representation (in place).
+        """
+
+        for segment, is_string in zip(self.segments, self._strings):
+            if is_string:
+                values[segment.name] = segment.conversion.decode(values[segment.name])
+            else:
+                segment.toMemory(values)
+
+        return values
+
+    def toEncoded(self, values):
+        """
+        Convert a dict of in-memory values to their encoded representation.
+        Returns a new dict (the provided values are not modified).
+        """
+
+        values = dict(values)
+
+        for segment, is_string in zip(self.segments, self._strings):
+            if not is_string:
+                values.update(segment.toEncoded(values))
+            elif segment.name in values:
+                values[segment.name] = segment.conversion.encode(values[segment.name])
+
+        return values
+
+    def encode(self, values, convert=False):
+        """
+        Encode a packet.
+
+        Return:
+            Encoded bytes
+        """
+
+        if convert:
+            values = self.toEncoded(values)
+
+        data = []
+
+        for segment, is_string in zip(self.segments, self._strings):
+            if is_string:
+                data.append(segment.encode(values.get(segment.name, segment.default)))
+            else:
+                data.append(segment.encode(values))
+
+        return b"".join(data)
+
+
+class PidgenConditionalPlan(PidgenPlan):
+    """
+    Encoding / decoding plan for a struct (or packet) which contains conditional fields.
+
+    The packet is split into:
+    - A fixed prefix (every field before the first conditional field), which is decoded in a single operation
+    - A tail, which has a separate (fixed) plan for each combination of conditions
+
+    Conditional fields must be at the top level of the struct,
+    and must depend on a (non-array) field within the fixed prefix.
+
+    Each condition is either:
+    - The controlling field is non-zero (dependsOn='field')
+    - The controlling field matches one of a set of values (dependsOn='field=1,2')
+
+    Conditions are evaluated against the encoded value of the controlling field.
+
+    Attributes:
+        layout - PidgenStructLayout which the plan was compiled from
+        byteOrder - Byte order prefix ('<' or '>'), from the 'endian' setting of the struct
+        prefix - PidgenCodecPlan for the fixed prefix
+        conditions - List of (controlling field name, accepted values or None) for each unique condition
+        fields - Conditions which control each conditional field - {field name: condition index}
+        names - Names of every (top-level) field which may be present
+        size - Always None (the size depends on the conditions)
+        minSize / maxSize - Minimum and maximum encoded size (bytes)
+    """
+
+    # Tail plans are compiled up-front if there are no more than this many conditions.
+    # Otherwise they are compiled (and cached) as each combination is encountered.
+    MAX_PRECOMPILED = 6
+
+    def __init__(self, layout):
+
+        PidgenPlan.__init__(self, layout)
+
+        if not layout.packed and any(field.size is None for field in layout.fields):
+            debug.error("Cannot compile codec for '{n}' - strings without a fixed capacity require a packed layout - {f}".format(
+                n=layout.struct.name,
+                f=layout.struct.path
+            ))
+
+            raise ValueError
+
+        split = 0
+
+        while split < len(layout.fields) and not layout.fields[split].conditional:
+            split += 1
+
+        self.prefix = compileLayoutPlan(subLayout(layout, layout.fields[:split]))
+
+        self.conditions = []
+        self.fields = {}
+
+        self._tailFields = layout.fields[split:]
+        self._tailConditions = []
+
+        for field in self._tailFields:
+
+            if not field.conditional:
+                self._tailConditions.append(None)
+                continue
+
+            condition = self._condition(field)
+
+            if condition not in self.conditions:
+                self.conditions.append(condition)
+
+            idx = self.conditions.index(condition)
+
+            self.fields[field.name] = idx
+            self._tailConditions.append(idx)
+
+        self.names = self.prefix.names + [field.name for field in self._tailFields]
+
+        self._controls = [name for name, values in self.conditions]
+
+        self._tails = {}
+
+        if len(self.conditions) <= self.MAX_PRECOMPILED:
+            for key in itertools.product([False, True], repeat=len(self.conditions)):
+                self.tail(key)
+
+        smallest = self.tail((False,) * len(self.conditions))
+        largest = self.tail((True,) * len(self.conditions))
+
+        self.minSize = self.prefix.minSize + smallest.minSize
+
+        if self.prefix.maxSize is None or largest.maxSize is None:
+            self.maxSize = None
+        else:
+            self.maxSize = self.prefix.maxSize + largest.maxSize
+
+    def __repr__(self):
+        return "<Conditional plan '{n}' {p} ({c} conditions)>".format(
+            n=self.layout.struct.name,
+            p=self.prefix,
+            c=len(self.conditions)
+        )
+
+    def _condition(self, field):
+        """
+        Return the (controlling field name, accepted values) condition for a conditional field.
+        """
+
+        element = field.element
+
+        target = element.dependencyTarget
+
+        name, values = element.dependency
+
+        controls = [f for f in self.prefix.fields if (target is not None and f.element is target) or f.name.lower() == name.lower()]
+
+        if len(controls) != 1 or controls[0].count is not None:
+            debug.error("Field '{n}' depends on '{d}', which must be a non-array field before the first conditional field - {f}".format(
+                n=field.name,
+                d=name,
+                f=element.path
+            ))
+
+            raise ValueError
+
+        if values is not None:
+            values = frozenset(self._conditionValue(element, value) for value in values)
+
+        return controls[0].name, values
+
+    def _conditionValue(self, element, value):
+        """
+        Parse a value from a 'dependsOn' condition.
+        The value can be a number, or the name of an enumeration value.
+        """
+
+        try:
+            return int(value, 0)
+        except ValueError:
+            pass
+
+        linker = element.protocol.linker
+
+        if linker is not None:
+            matches = linker.index.lookup("value", value)
+
+            if len(matches) > 0:
+                return matches[0].value
+
+        debug.error("Invalid value '{v}' in 'dependsOn' for '{n}' - {f}".format(
+            v=value,
+            n=element.name,
+            f=element.path
+        ))
+
+        raise ValueError
+
+    def tail(self, key):
+        """
+        Return the plan for the tail of the packet, for a given combination of conditions.
+
+        Args:
+            key - Tuple of booleans (one for each condition)
+        """
+
+        plan = self._tails.get(key, None)
+
+        if plan is not None:
+            return plan
+
+        present = [f for f, c in zip(self._tailFields, self._tailConditions) if c is None or key[c]]
+
+        if self.layout.packed:
+            tail = subLayout(self.layout, present)
+        else:
+            # Lay out the complete packet, so that alignment padding is calculated correctly
+            full = subLayout(self.layout, self.layout.fields[:len(self.prefix.layout.fields)] + present)
+            full.finish()
+
+            # Then shift the tail fields to start at the end of the prefix
+            tail = PidgenStructLayout(self.layout.struct, packed=self.layout.packed)
+            tail.size = full.size - self.prefix.size
+
+            for field in full.fields[len(self.prefix.layout.fields):]:
+                field.offset -= self.prefix.size
+                tail.fields.append(field)
+
+        plan = compileLayoutPlan(tail)
+
+        self._tails[key] = plan
+
+        return plan
+
+    def key(self, values):
+        """ Evaluate the conditions for a set of (encoded) values, returning a tuple of booleans """
+
+        return tuple(bool(values[name]) if accepted is None else values[name] in accepted for name, accepted in self.conditions)
+
+    def sizeOf(self, buffer, offset=0):
+        """
+        Return the encoded size (bytes) of the packet in the buffer,
+        or None if the buffer does not contain the complete prefix.
+        """
+
+        prefix = self.prefix
+
+        size = prefix.sizeOf(buffer, offset)
+
+        if size is None or len(buffer) - offset < size:
+            return None
+
+        tail = self.tail(self.key(prefix.decode(buffer, offset)))
+
+        tail_size = tail.sizeOf(buffer, offset + size)
+
+        if tail_size is None:
+            return None
+
+        return size + tail_size
+
+    def decode(self, buffer, offset=0, convert=False):
+        """
+        Decode a packet from the buffer.
+        Any conditional fields which are not present are not included in the returned values.
+
+        Return:
+            Dict of (dotted) field names to values
+        """
+
+        return self.decodeSized(buffer, offset, convert=convert)[0]
+
+    def decodeSized(self, buffer, offset=0, convert=False):
+        """ Decode a packet from the buffer, returning a (values, encoded size) tuple """
+
+        prefix = self.prefix
+
+        values, size = prefix.decodeSized(buffer, offset)
+
+        tail = self._tails.get(self.key(values), None)
+
+        if tail is None:
+            tail = self.tail(self.key(values))
+
+        tail_values, tail_size = tail.decodeSized(buffer, offset + size)
+
+        values.update(tail_values)
+
+        if convert:
+            prefix.toMemory(values)
+            tail.toMemory(values)
+
+        return values, size + tail_size
+
+    def _compileValidator(self):
+        """ Conditional fields are only validated if they are present """
+
+        largest = self.tail((True,) * len(self.conditions))
+        smallest = self.tail((False,) * len(self.conditions))
+
+        return compileValidator(
+            self,
+            fields=self.prefix.fields + largest.fields,
+            optional=set(largest.names) - set(smallest.names)
+        )
+
+    def encode(self, values, convert=False):
+        """
+        Encode a packet.
+        Conditional fields are only encoded if their condition is met.
+
+        Return:
+            Encoded bytes
+        """
+
+        prefix = self.prefix
+
+        if convert:
+            values = prefix.toEncoded(values)
+
+        # Controlling values which are not provided use their default value
+        controls = dict((name, values.get(name, prefix._defaults[name])) for name in self._controls)
+
+        tail = self.tail(self.key(controls))
+
+        if convert:
+            values = tail.toEncoded(values)
+
+        return prefix.encode(values) + tail.encode(values)
+
+
+def subLayout(layout, fields):
+    """
+    Construct a layout containing (unconditional copies of) a subset of the fields of a layout.
+    """
+
+    result = PidgenStructLayout(layout.struct, packed=layout.packed)
+
+    for field in fields:
+        field = copy.copy(field)
+        field.conditional = False
+        field.padding = 0
+
+        result.addField(field)
+
+    return result
+
+
+def nestedConditional(layout):
+    """
+    Find a conditional field within any struct nested in a layout.
+
+    Return:
+        (struct field, conditional field) tuple, or None if every conditional field is at the top level
+    """
+
+    for field in layout.fields:
+
+        if field.layout is None:
+            continue
+
+        for nested in field.layout.fields:
+            if nested.conditional:
+                return field, nested
+
+        found = nestedConditional(field.layout)
+
+        if found is not None:
+            return field, found[1]
+
+    return None
+
+
+def compileLayoutPlan(layout):
+    """
+    Compile the plan for a layout which does not contain any conditional fields.
+
+    Return:
+        PidgenCodecPlan (for a fixed size layout) or PidgenVariablePlan object.
+        Raises ValueError if the layout cannot be encoded.
+    """
+
+    if layout.isFixed:
+        return PidgenCodecPlan(layout)
+
+    return PidgenVariablePlan(layout)
+
+
+def compilePlan(struct, packed=True):
+    """
+    Compile a flattened codec plan for a struct (or packet).
+    Use PidgenStruct.codecPlan() rather than calling this directly, so that the result is cached.
+
+    Return:
+        PidgenCodecPlan, PidgenVariablePlan or PidgenConditionalPlan object,
+        or None if the struct cannot be encoded
+    """
+
+    layout = struct.layout(packed=packed)
+
+    nested = nestedConditional(layout)
+
+    if nested is not None:
+        debug.error("Cannot compile codec for '{n}' - field '{name}' (within '{s}') is conditional - conditional fields must be at the top level of the packet - {f}".format(
+            n=struct.name,
+            name=nested[1].name,
+            s=nested[0].name,
+            f=nested[1].element.path
+        ))
+
+        return None
+
+    try:
+        if layout.conditional:
+            return PidgenConditionalPlan(layout)
+
+        return compileLayoutPlan(layout)
+    except ValueError:
+        return None
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+"""
+Conversion between the "in memory" and "on the wire" representations of a data element.
+
+A data element may specify a different datatype and encoding (e.g. u32 in memory, f16 on the wire),
+and a 'scaler' which is applied when encoding:
+
+    encoded value = in-memory value * scaler
+
+Each conversion is compiled once per data element:
+- Scalar conversions use integer-only arithmetic where possible (integer types, rational scaler)
+- Column conversions operate on entire NumPy arrays at once
+"""
+
+from fractions import Fraction
+
+from .data import PidgenDataElement as Data
+from . import debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_INTEGER_RANGE = {
+    Data.DATA_U8: (0, 2 ** 8 - 1),
+    Data.DATA_S8: (-2 ** 7, 2 ** 7 - 1),
+    Data.DATA_U16: (0, 2 ** 16 - 1),
+    Data.DATA_S16: (-2 ** 15, 2 ** 15 - 1),
+    Data.DATA_U32: (0, 2 ** 32 - 1),
+    Data.DATA_S32: (-2 ** 31, 2 ** 31 - 1),
+    Data.DATA_U64: (0, 2 ** 64 - 1),
+    Data.DATA_S64: (-2 ** 63, 2 ** 63 - 1),
+}
+
+# Largest finite value of each (narrow) floating point type
+_FLOAT_MAX = {
+    Data.DATA_F16: 65504.0,
+    Data.DATA_F32: 3.4028234663852886e38,
+}
+
+# Largest denominator / numerator for which integer-only scaling is used
+_MAX_RATIONAL = 2 ** 16
+
+
+def _numpyType(datatype):
+    """ Return the (native byte order) NumPy type for a datatype """
+
+    return numpy.dtype(Data._NUMPY_FORMAT[datatype])
+
+
+class PidgenConversion():
+    """
+    Conversion kernel for a single data element.
+
+    Attributes:
+        datatype - In-memory datatype
+        encoding - Encoded (on the wire) datatype
+        scaler - Scale factor (Fraction), or None if no scaling is applied
+        integer - True if the scalar conversion uses integer-only arithmetic
+    """
+
+    def __init__(self, datatype, encoding, scaler=None):
+
+        self.datatype = datatype
+        self.encoding = encoding
+
+        if scaler is not None and scaler == 1:
+            scaler = None
+
+        self.scaler = scaler
+
+        self.memoryIsInteger = datatype in _INTEGER_RANGE
+        self.encodedIsInteger = encoding in _INTEGER_RANGE
+
+        # Finite values which overflow a narrow float type are saturated to its largest finite value
+        self._memoryMax = _FLOAT_MAX.get(datatype, None)
+        self._encodedMax = _FLOAT_MAX.get(encoding, None)
+
+        # Integer-only conversion requires integer types on both sides, and a "simple" rational scaler
+        self.integer = self.memoryIsInteger and self.encodedIsInteger and (
+            scaler is None or (scaler.numerator < _MAX_RATIONAL and scaler.denominator < _MAX_RATIONAL)
+        )
+
+        # Integer-only column conversion is performed in int64, which cannot represent all u64 values
+        self._integerColumns = self.integer and Data.DATA_U64 not in [datatype, encoding]
+
+        if scaler is None:
+            self._num, self._den = 1, 1
+            self._scale = 1.0
+        else:
+            self._num, self._den = scaler.numerator, scaler.denominator
+            self._scale = float(scaler)
+
+    def __repr__(self):
+        return "<Conversion {m} -> {e} x{s}>".format(m=self.datatype, e=self.encoding, s=self.scaler)
+
+    @staticmethod
+    def _clamp(value, datatype):
+        lo, hi = _INTEGER_RANGE[datatype]
+        return lo if value < lo else hi if value > hi else value
+
+    @staticmethod
+    def _roundClamp(value, datatype):
+        """
+        Round a float value to the nearest integer, saturated to the range of the datatype.
+        Infinite values saturate, and NaN is converted to zero (matching the column conversion).
+        """
+
+        lo, hi = _INTEGER_RANGE[datatype]
+
+        if value != value:
+            return 0
+
+        if value <= lo:
+            return lo
+
+        if value >= hi:
+            return hi
+
+        return int(round(value))
+
+    @staticmethod
+    def _floatClamp(value, limit):
+        """
+        Saturate a finite float value to the range of a narrow float type (of which 'limit' is the largest finite value).
+        Infinite and NaN values are unchanged.
+        """
+
+        if limit < value < float("inf"):
+            return limit
+
+        if -limit > value > float("-inf"):
+            return -limit
+
+        return value
+
+    @staticmethod
+    def _scaleInt(value, num, den):
+        """ Compute round(value * num / den) using integer arithmetic only (rounding half away from zero) """
+
+        if den == 1:
+            return value * num
+
+        value = value * num
+
+        if value >= 0:
+            return (value + den // 2) // den
+        else:
+            return -((-value + den // 2) // den)
+
+    def encode(self, value):
+        """ Convert a single in-memory value to its encoded representation """
+
+        if self.integer:
+            return self._clamp(self._scaleInt(int(value), self._num, self._den), self.encoding)
+
+        if self.scaler is not None:
+            value = value * self._scale
+
+        if self.encodedIsInteger:
+            return self._roundClamp(value, self.encoding)
+
+        if self._encodedMax is not None:
+            return self._floatClamp(float(value), self._encodedMax)
+
+        return float(value)
+
+    def decode(self, value):
+        """ Convert a single encoded value to its in-memory representation """
+
+        if self.integer:
+            return self._clamp(self._scaleInt(value, self._den, self._num), self.datatype)
+
+        if self.scaler is not None:
+            value = value / self._scale
+
+        if self.memoryIsInteger:
+            return self._roundClamp(value, self.datatype)
+
+        if self._memoryMax is not None:
+            return self._floatClamp(float(value), self._memoryMax)
+
+        return float(value)
+
+    def _castColumn(self, column, datatype):
+        """
+        Cast a float64 column to the given datatype, rounding and saturating integer types.
+        Infinite values saturate, and NaN is converted to zero.
+        Finite values which overflow a narrow float type are saturated to its largest finite value.
+        """
+
+        if datatype in _INTEGER_RANGE:
+            lo, hi = _INTEGER_RANGE[datatype]
+            column = numpy.clip(numpy.rint(column), lo, hi)
+            column[numpy.isnan(column)] = 0
+        elif datatype in _FLOAT_MAX:
+            limit = _FLOAT_MAX[datatype]
+            column = numpy.where(numpy.isinf(column), column, numpy.clip(column, -limit, limit))
+
+        return column.astype(_numpyType(datatype))
+
+    def _scaleColumn(self, column, num, den, datatype):
+        """ Integer-only column scaling (round(column * num / den)), saturated to the datatype """
+
+        column = column.astype(numpy.int64) * num
+
+        if den != 1:
+            column = numpy.where(column >= 0, (column + den // 2) // den, -((-column + den // 2) // den))
+
+        lo, hi = _INTEGER_RANGE[datatype]
+
+        return numpy.clip(column, lo, hi).astype(_numpyType(datatype))
+
+    def encodeColumn(self, column):
+        """
+        Convert an entire column (NumPy array) of in-memory values to the encoded representation.
+        Float16 encodings are narrowed in a single cast.
+        """
+
+        column = numpy.asarray(column)
+
+        if self._integerColumns:
+            return self._scaleColumn(column, self._num, self._den, self.encoding)
+
+        column = column.astype(numpy.float64)
+
+        if self.scaler is not None:
+            column = column * self._scale
+
+        return self._castColumn(column, self.encoding)
+
+    def decodeColumn(self, column):
+        """
+        Convert an entire column (NumPy array) of encoded values to the in-memory representation.
+        """
+
+        column = numpy.asarray(column)
+
+        if self._integerColumns:
+            return self._scaleColumn(column, self._den, self._num, self.datatype)
+
+        column = column.astype(numpy.float64)
+
+        if self.scaler is not None:
+            column = column / self._scale
+
+        return self._castColumn(column, self.datatype)
+
+
+class PidgenStringConversion():
+    """
+    Conversion between encoded string bytes and (in-memory) text.
+
+    Decoded packets contain the raw bytes of each string,
+    which are only decoded to text when they are converted to their in-memory representation.
+
+    Attributes:
+        charset - Python codec used to encode / decode the text
+        terminated - True if the encoded bytes are NUL-terminated (fixed-capacity strings)
+    """
+
+    datatype = Data.DATA_STR
+    encoding = Data.DATA_STR
+    scaler = None
+
+    def __init__(self, charset="utf-8", terminated=False):
+
+        self.charset = charset
+        self.terminated = terminated
+
+    def __repr__(self):
+        return "<Conversion {m} -> {e} ({c})>".format(m=self.datatype, e=self.encoding, c=self.charset)
+
+    def encode(self, value):
+        """ Convert a single string to its encoded bytes """
+
+        if isinstance(value, str):
+            return value.encode(self.charset)
+
+        return bytes(value)
+
+    def decode(self, value):
+        """ Convert encoded bytes to a string (discarding anything after a NUL terminator) """
+
+        if self.terminated:
+            value = value.partition(b"\x00")[0]
+
+        return value.decode(self.charset, errors="replace")
+
+    def encodeColumn(self, column):
+        """ Encode an entire column of strings to a NumPy bytes array """
+        return numpy.char.encode(numpy.asarray(column, dtype=str), self.charset)
+
+    def decodeColumn(self, column):
+        """
+        Decode an entire column (NumPy bytes array) to a NumPy string array.
+        Trailing NUL bytes are discarded by NumPy.
+        """
+
+        return numpy.char.decode(numpy.asarray(column), self.charset, errors="replace")
+
+
+def parseScaler(data):
+    """
+    Return the 'scaler' for a data element as a Fraction (or None if not specified).
+    """
+
+    value = data.get("scaler", None)
+
+    if value is None:
+        return None
+
+    try:
+        scaler = Fraction(value.strip().rstrip("fF"))
+    except (ValueError, ZeroDivisionError):
+        scaler = None
+
+    if scaler is None or scaler == 0:
+        debug.error("Invalid scaler '{s}' for '{n}' - {f}".format(
+            s=value,
+            n=data.name,
+            f=data.path
+        ))
+
+        return None
+
+    return scaler
+
+
+def compileConversion(data):
+    """
+    Compile the conversion for a data element.
+
+    Return:
+        PidgenConversion object, or None if the in-memory and encoded representations are identical.
+        String data always has a PidgenStringConversion (between bytes and text).
+    """
+
+    datatype = data.datatype
+    encoding = data.encoding
+
+    if datatype is None or encoding is None:
+        return None
+
+    if encoding == Data.DATA_STR:
+        return PidgenStringConversion(data.charset, terminated=data.stringPrefix is None)
+
+    scaler = parseScaler(data)
+
+    if datatype == encoding and (scaler is None or scaler == 1):
+        return None
+
+    return PidgenConversion(datatype, encoding, scaler)
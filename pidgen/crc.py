@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""
+CRC and checksum algorithms, for the framing layer.
+
+CRCs are table-driven, using slicing-by-N: the data is split into 32-bit words (in a single unpack operation),
+and each word is processed with N = 4 table lookups (rather than processing one byte at a time).
+Algorithms which are available in the standard library (zlib / binascii) use the C implementation instead.
+
+Batches of frames (of equal length) can be checked at once with NumPy (if installed),
+where each table lookup is applied to an entire column of frames.
+"""
+
+import binascii
+import struct
+import zlib
+
+from . import debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PidgenCRC():
+    """
+    Table-driven CRC.
+
+    Attributes:
+        name - Name of the algorithm
+        width - Width of the CRC (bits)
+        poly - Generator polynomial (normal representation)
+        init - Initial value of the register
+        reflect - True if the input and output are reflected (LSB first)
+        xorout - Value XORed with the final register
+        size - Encoded size of the CRC (bytes)
+    """
+
+    # Number of bytes processed by each step of the table-driven algorithm
+    SLICES = 4
+
+    def __init__(self, name, width, poly, init=0, reflect=False, xorout=0, native=None):
+        """
+        kwargs:
+            native - Equivalent function from the standard library (function(data, value)), if available
+        """
+
+        self.name = name
+        self.width = width
+        self.poly = poly
+        self.init = init
+        self.reflect = reflect
+        self.xorout = xorout
+        self.size = (width + 7) // 8
+
+        self.mask = (1 << width) - 1
+
+        self._native = native
+
+        self.tables = self._buildTables()
+
+        self._arrays = None
+
+    def __repr__(self):
+        return "<CRC '{n}'>".format(n=self.name)
+
+    def _buildTables(self):
+        """
+        Build the lookup tables for slicing-by-N.
+        Non-reflected CRCs are computed in a 32-bit register (aligned to the most significant bit).
+        """
+
+        table = []
+
+        if self.reflect:
+            poly = int("{p:0{w}b}".format(p=self.poly, w=self.width)[::-1], 2)
+
+            for idx in range(256):
+                crc = idx
+
+                for _ in range(8):
+                    crc = (crc >> 1) ^ poly if crc & 1 else crc >> 1
+
+                table.append(crc)
+
+            tables = [table]
+
+            for _ in range(self.SLICES - 1):
+                previous = tables[-1]
+                tables.append([(crc >> 8) ^ table[crc & 0xFF] for crc in previous])
+
+        else:
+            poly = self.poly << (32 - self.width)
+
+            for idx in range(256):
+                crc = idx << 24
+
+                for _ in range(8):
+                    crc = ((crc << 1) ^ poly if crc & 0x80000000 else crc << 1) & 0xFFFFFFFF
+
+                table.append(crc)
+
+            tables = [table]
+
+            for _ in range(self.SLICES - 1):
+                previous = tables[-1]
+                tables.append([((crc << 8) & 0xFFFFFFFF) ^ table[crc >> 24] for crc in previous])
+
+        return tables
+
+    def compute(self, data):
+        """
+        Compute the CRC of a bytes-like object.
+
+        Return:
+            CRC value (int)
+        """
+
+        if self._native is not None:
+            return self._native(data)
+
+        view = memoryview(data).cast("B")
+
+        words = len(view) // 4
+
+        t0, t1, t2, t3 = self.tables
+
+        if self.reflect:
+            crc = self.init
+
+            for word in struct.unpack_from("<{n}I".format(n=words), view):
+                crc ^= word
+                crc = t3[crc & 0xFF] ^ t2[(crc >> 8) & 0xFF] ^ t1[(crc >> 16) & 0xFF] ^ t0[crc >> 24]
+
+            for byte in view[words * 4:]:
+                crc = t0[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+
+        else:
+            shift = 32 - self.width
+
+            crc = self.init << shift
+
+            for word in struct.unpack_from(">{n}I".format(n=words), view):
+                crc ^= word
+                crc = t3[crc >> 24] ^ t2[(crc >> 16) & 0xFF] ^ t1[(crc >> 8) & 0xFF] ^ t0[crc & 0xFF]
+
+            for byte in view[words * 4:]:
+                crc = t0[(crc >> 24) ^ byte] ^ ((crc << 8) & 0xFFFFFFFF)
+
+            crc >>= shift
+
+        return (crc ^ self.xorout) & self.mask
+
+    def computeBatch(self, frames):
+        """
+        Compute the CRC of each row of a 2D NumPy array (one frame per row, all of the same length).
+        Each step processes (up to) 4 bytes of every frame at once.
+
+        Return:
+            NumPy array of CRC values
+        """
+
+        if numpy is None:
+            debug.error("NumPy is required for batch CRC computation")
+            return None
+
+        if self._arrays is None:
+            self._arrays = [numpy.array(table, dtype=numpy.uint64) for table in self.tables]
+
+        t0, t1, t2, t3 = self._arrays
+
+        frames = numpy.asarray(frames, dtype=numpy.uint64)
+
+        count, length = frames.shape
+
+        words = length // 4
+
+        if self.reflect:
+            crc = numpy.full(count, self.init, dtype=numpy.uint64)
+
+            for idx in range(0, words * 4, 4):
+                crc ^= frames[:, idx] | (frames[:, idx + 1] << 8) | (frames[:, idx + 2] << 16) | (frames[:, idx + 3] << 24)
+                crc = t3[crc & 0xFF] ^ t2[(crc >> 8) & 0xFF] ^ t1[(crc >> 16) & 0xFF] ^ t0[crc >> 24]
+
+            for idx in range(words * 4, length):
+                crc = t0[(crc ^ frames[:, idx]) & 0xFF] ^ (crc >> 8)
+
+        else:
+            shift = 32 - self.width
+
+            crc = numpy.full(count, self.init << shift, dtype=numpy.uint64)
+
+            for idx in range(0, words * 4, 4):
+                crc ^= (frames[:, idx] << 24) | (frames[:, idx + 1] << 16) | (frames[:, idx + 2] << 8) | frames[:, idx + 3]
+                crc = t3[crc >> 24] ^ t2[(crc >> 16) & 0xFF] ^ t1[(crc >> 8) & 0xFF] ^ t0[crc & 0xFF]
+
+            for idx in range(words * 4, length):
+                crc = t0[(crc >> 24) ^ frames[:, idx]] ^ ((crc << 8) & 0xFFFFFFFF)
+
+            crc >>= shift
+
+        return (crc ^ self.xorout) & self.mask
+
+
+class PidgenChecksum():
+    """
+    Simple 8-bit checksum (sum or XOR of every byte).
+    Provides the same interface as PidgenCRC.
+    """
+
+    size = 1
+
+    def __init__(self, name, xor=False):
+
+        self.name = name
+        self.xor = xor
+
+    def __repr__(self):
+        return "<Checksum '{n}'>".format(n=self.name)
+
+    def compute(self, data):
+
+        view = memoryview(data).cast("B")
+
+        if not self.xor:
+            return sum(view) & 0xFF
+
+        value = 0
+
+        for byte in view:
+            value ^= byte
+
+        return value
+
+    def computeBatch(self, frames):
+
+        if numpy is None:
+            debug.error("NumPy is required for batch checksum computation")
+            return None
+
+        frames = numpy.asarray(frames, dtype=numpy.uint8)
+
+        if self.xor:
+            return numpy.bitwise_xor.reduce(frames, axis=1)
+
+        return frames.sum(axis=1, dtype=numpy.uint64) & 0xFF
+
+
+# Supported algorithms (by lower-case name)
+ALGORITHMS = {
+    "crc8": lambda: PidgenCRC("crc8", 8, 0x07),
+    "crc16-ccitt": lambda: PidgenCRC("crc16-ccitt", 16, 0x1021, init=0xFFFF, native=lambda data: binascii.crc_hqx(data, 0xFFFF)),
+    "crc16-xmodem": lambda: PidgenCRC("crc16-xmodem", 16, 0x1021, native=lambda data: binascii.crc_hqx(data, 0)),
+    "crc16-modbus": lambda: PidgenCRC("crc16-modbus", 16, 0x8005, init=0xFFFF, reflect=True),
+    "crc32": lambda: PidgenCRC("crc32", 32, 0x04C11DB7, init=0xFFFFFFFF, reflect=True, xorout=0xFFFFFFFF, native=zlib.crc32),
+    "crc32c": lambda: PidgenCRC("crc32c", 32, 0x1EDC6F41, init=0xFFFFFFFF, reflect=True, xorout=0xFFFFFFFF),
+    "sum8": lambda: PidgenChecksum("sum8"),
+    "xor8": lambda: PidgenChecksum("xor8", xor=True),
+}
+
+_CACHE = {}
+
+
+def getAlgorithm(name):
+    """
+    Return the CRC (or checksum) algorithm with the given name.
+    Lookup tables are built once for each algorithm.
+
+    Return:
+        PidgenCRC (or PidgenChecksum) object, or None if the algorithm is not supported
+    """
+
+    name = name.strip().lower()
+
+    if name not in _CACHE:
+
+        factory = ALGORITHMS.get(name, None)
+
+        if factory is None:
+            return None
+
+        _CACHE[name] = factory()
+
+    return _CACHE[name]
@@ -13,19 +13,31 @@ class PidgenDataElement(PidgenElement):
         datatype - Native datatype of this entry
         encoding - "On the wire" encoding of this entry (optional)
         units - Natural units of the represented data
+
+    String data (datatype='string') is encoded either:
+        - With a fixed capacity, padded with NUL bytes (length='16')
+        - With a length prefix, followed by the string bytes (lengthPrefix='u8')
+          (an optional 'length' then specifies the maximum length)
+
+    Integer data can be packed into a number of bits (bits='3').
+    Consecutive bitfields share a storage word (of the encoded datatype), as C bitfields do.
     """
 
     ALLOWED_KEYS = [
         "array",
+        "bits",
+        "charset",
         "constant",
         "checkconstant",
-        "default", "defaultvalue",
-        "dependson", "requires",  # Synonymous
-        "datatype", "inmemorytype",  # Synonymous
-        "encoding", "encodedtype",  # Synonymous
-        "initial", "initvalue", "initialvalue",
-        "maxvalue", "verifymaxvalue",
-        "minvalue", "verifyminvalue",
+        ("default", "defaultvalue"),
+        ("dependson", "requires"),
+        ("datatype", "inmemorytype"),
+        ("encoding", "encodedtype"),
+        ("initial", "initvalue", "initialvalue"),
+        "length",
+        "lengthprefix",
+        ("maxvalue", "verifymaxvalue"),
+        ("minvalue", "verifyminvalue"),
         "notes",
         "range",
         "scaler",
@@ -37,6 +49,10 @@ class PidgenDataElement(PidgenElement):
         "name",
     ]
 
+    # Targets of the 'struct' and 'dependsOn' references (resolved by the link pass)
+    structTarget = None
+    dependencyTarget = None
+
     # Allowable datatypes
     DATA_U8 = 'U8'          # Unsigned integer, 8 bits
     DATA_S8 = "S8"          # Signed integer, 8 bits
@@ -86,6 +102,52 @@ class PidgenDataElement(PidgenElement):
         DATA_F64: 64,
     }
 
+    # struct format character for each data type
+    _STRUCT_FORMAT = {
+        DATA_U8: "B",
+        DATA_S8: "b",
+        DATA_U16: "H",
+        DATA_S16: "h",
+        DATA_U32: "I",
+        DATA_S32: "i",
+        DATA_U64: "Q",
+        DATA_S64: "q",
+        DATA_F16: "e",
+        DATA_F32: "f",
+        DATA_F64: "d",
+    }
+
+    # NumPy dtype (without byte order) for each data type
+    _NUMPY_FORMAT = {
+        DATA_U8: "u1",
+        DATA_S8: "i1",
+        DATA_U16: "u2",
+        DATA_S16: "i2",
+        DATA_U32: "u4",
+        DATA_S32: "i4",
+        DATA_U64: "u8",
+        DATA_S64: "i8",
+        DATA_F16: "f2",
+        DATA_F32: "f4",
+        DATA_F64: "f8",
+    }
+
+    # C type for each (encoded) data type - half-precision floats are stored as raw 16-bit values
+    _C_TYPE = {
+        DATA_U8: "uint8_t",
+        DATA_S8: "int8_t",
+        DATA_U16: "uint16_t",
+        DATA_S16: "int16_t",
+        DATA_U32: "uint32_t",
+        DATA_S32: "int32_t",
+        DATA_U64: "uint64_t",
+        DATA_S64: "int64_t",
+        DATA_F16: "uint16_t",
+        DATA_F32: "float",
+        DATA_F64: "double",
+        DATA_STR: "char",
+    }
+
     def __init__(self, parent, **kwargs):
 
         PidgenElement.__init__(self, parent, **kwargs)
@@ -155,6 +217,9 @@ class PidgenDataElement(PidgenElement):
         for opt in options:
             enc = self.get(opt)
 
+            if enc:
+                break
+
         # Default to the internal datatype
         if enc is None:
             enc = self.datatype
@@ -185,6 +250,277 @@ class PidgenDataElement(PidgenElement):
 
         return None
 
+    @property
+    def arraySize(self):
+        """
+        Return the number of elements for an array field (specified with the 'array' key).
+        Returns None if this data element is not an array.
+        """
+
+        count = self.get("array", None)
+
+        if count is None:
+            return None
+
+        try:
+            count = self.parseInt(count)
+        except ValueError:
+            count = 0
+
+        if count < 1:
+            debug.error("Invalid array size '{n}' for '{name}' - {f}".format(
+                n=self.get("array"),
+                name=self.name,
+                f=self.path
+            ))
+
+            return None
+
+        return count
+
+    @property
+    def bitWidth(self):
+        """
+        Return the number of bits for a bitfield (specified with the 'bits' key).
+        Returns None if this data element is not a bitfield.
+        """
+
+        bits = self.get("bits", None)
+
+        if bits is None:
+            return None
+
+        encoding = self.encoding
+
+        width = self._DATA_WIDTH_BITS.get(encoding, None)
+
+        if width is None or encoding in [self.DATA_F16, self.DATA_F32, self.DATA_F64]:
+            debug.error("Bitfield '{name}' must have an integer encoding - {f}".format(
+                name=self.name,
+                f=self.path
+            ))
+
+            return None
+
+        try:
+            bits = self.parseInt(bits)
+        except ValueError:
+            bits = 0
+
+        if bits < 1 or bits > width:
+            debug.error("Invalid number of bits '{n}' for '{name}' - must be between 1 and {w} - {f}".format(
+                n=self.get("bits"),
+                name=self.name,
+                w=width,
+                f=self.path
+            ))
+
+            return None
+
+        return bits
+
+    @property
+    def structName(self):
+        """ Return the name of the struct referenced by this data element (if any) """
+        return self.get("struct", None)
+
+    @property
+    def referencedStruct(self):
+        """
+        Return the struct object referenced by this data element (using the 'struct' key).
+        Returns None if no struct is referenced (or the struct cannot be found).
+        """
+
+        name = self.structName
+
+        if name is None:
+            return None
+
+        if self.structTarget is not None:
+            return self.structTarget
+
+        return self.findItemByName("PidgenStruct", name)
+
+    @property
+    def dependsOn(self):
+        """ Return the (raw) 'dependsOn' value for this data element """
+        return self.get(["dependson", "requires"], None)
+
+    @property
+    def dependency(self):
+        """
+        Return the field which controls whether this data element is present (using the 'dependsOn' key).
+
+        The 'dependsOn' value is either:
+        - The name of the controlling field - the element is present if the field is non-zero
+        - name=value[,value...] - the element is present if the field matches one of the values
+
+        Return:
+            (name, values) tuple, where values is a list of (raw) values, or None.
+            Returns None if there is no dependency.
+        """
+
+        raw = self.dependsOn
+
+        if raw is None:
+            return None
+
+        name, sep, values = raw.partition("=")
+
+        name = name.strip()
+
+        if not sep:
+            return name, None
+
+        values = [v.strip() for v in values.lstrip("=").split(",") if len(v.strip()) > 0]
+
+        return name, values
+
+    def link(self, linker):
+
+        if self.structName is not None:
+            self.structTarget = linker.resolve(self, "struct", "struct", self.structName)
+
+        dependency = self.dependency
+
+        if dependency is not None:
+            self.dependencyTarget = self.resolveField(linker, dependency[0])
+
+    def resolveField(self, linker, name):
+        """
+        Resolve the name of a field which is referenced by this data element.
+        The field is searched for in the enclosing struct, and then any further enclosing structs.
+        """
+
+        choices = []
+
+        scope = self.parent
+
+        while scope is not None and hasattr(scope, "layoutVersion"):
+
+            for child in scope.children:
+                if child is self or not isinstance(child, PidgenDataElement):
+                    continue
+
+                if child.name is None:
+                    continue
+
+                if child.name.lower() == name.lower():
+                    return child
+
+                choices.append(child.name.lower())
+
+            scope = scope.parent
+
+        linker.missing(self, "dependsOn", name, choices)
+
+        return None
+
+    # Character sets which are supported for string data
+    CHARSETS = {
+        "ascii": "ascii",
+        "utf8": "utf-8",
+        "utf-8": "utf-8",
+    }
+
+    @property
+    def isString(self):
+        """ Return True if this data element is encoded as a string """
+        return self.encoding == self.DATA_STR
+
+    @property
+    def stringLength(self):
+        """
+        Return the capacity (bytes) of a string data element (specified with the 'length' key).
+        Returns None if no length is specified.
+        """
+
+        length = self.get("length", None)
+
+        if length is None:
+            return None
+
+        try:
+            length = self.parseInt(length)
+        except ValueError:
+            length = 0
+
+        if length < 1:
+            debug.error("Invalid string length '{n}' for '{name}' - {f}".format(
+                n=self.get("length"),
+                name=self.name,
+                f=self.path
+            ))
+
+            return None
+
+        return length
+
+    @property
+    def stringPrefix(self):
+        """
+        Return the (unsigned integer) datatype of the length prefix for a string data element.
+        Returns None if the string has a fixed capacity (and no length prefix).
+
+        Strings without a 'length' key are always length-prefixed (u8 by default).
+        """
+
+        prefix = self.get("lengthprefix", None)
+
+        if prefix is None:
+            return None if self.stringLength is not None else self.DATA_U8
+
+        prefix = prefix.lower()
+
+        for key in [self.DATA_U8, self.DATA_U16, self.DATA_U32]:
+            if prefix in self._DATATYPE_KEYS[key]:
+                return key
+
+        debug.error("Invalid length prefix '{p}' for '{name}' - must be u8, u16 or u32 - {f}".format(
+            p=prefix,
+            name=self.name,
+            f=self.path
+        ))
+
+        return self.DATA_U8
+
+    @property
+    def charset(self):
+        """ Return the character set of a string data element ('utf-8' by default) """
+
+        charset = self.get("charset", "utf-8")
+
+        codec = self.CHARSETS.get(charset.lower(), None)
+
+        if codec is None:
+            debug.warning("Unsupported charset '{c}' for '{name}' - {f}".format(
+                c=charset,
+                name=self.name,
+                f=self.path
+            ))
+
+            codec = "utf-8"
+
+        return codec
+
+    @property
+    def encodedWidth(self):
+        """
+        Return the encoded width (in bits) of a single value of this data element,
+        or None if the encoding does not have a fixed width.
+        Fixed-capacity strings have a width of (8 * capacity) bits.
+        """
+
+        encoding = self.encoding
+
+        if encoding == self.DATA_STR:
+            if self.stringPrefix is not None:
+                return None
+
+            return self.stringLength * 8
+
+        return self._DATA_WIDTH_BITS.get(encoding, None)
+
     @property
     def units(self):
         """ Return the units of this data element """
@@ -202,6 +538,67 @@ class PidgenDataElement(PidgenElement):
 
         return self.get(['maxvalue', 'verifymaxvalue'], None)
 
+    @property
+    def limits(self):
+        """
+        Return the (minimum, maximum) validation limits for this data element, as numbers.
+        Either limit may be None (unbounded).
+
+        Limits are specified with the 'minValue' / 'maxValue' keys,
+        or with the 'range' key (e.g. range='0,100' or range='-1:1')
+        """
+
+        lo = self.minValue
+        hi = self.maxValue
+
+        value = self.get('range', None)
+
+        if value is not None:
+            for sep in [',', ':', '..']:
+                if sep in value:
+                    lo, hi = [x.strip() or None for x in value.split(sep, 1)]
+                    break
+            else:
+                debug.warning("Invalid range '{r}' for '{name}' - {f}".format(
+                    r=value,
+                    name=self.name,
+                    f=self.path
+                ))
+
+        return self._parseLimit(lo), self._parseLimit(hi)
+
+    def _parseLimit(self, value):
+        """
+        Convert a limit value (e.g. '12', '0x10', '12.5f') to a number
+        """
+
+        if value is None:
+            return None
+
+        value = value.strip()
+
+        try:
+            return int(value, 0)
+        except ValueError:
+            pass
+
+        # Floating point values may have a (C style) 'f' suffix, e.g. '12.5f'
+        number = value
+
+        if number[-1:] in ['f', 'F'] and not number.lower().endswith('inf'):
+            number = number[:-1]
+
+        try:
+            return float(number)
+        except ValueError:
+            debug.warning("Invalid limit '{v}' for '{name}' - {f}".format(
+                v=value,
+                name=self.name,
+                f=self.path
+            ))
+
+            return None
+
     @property
     def initialValue(self):
         """
@@ -216,7 +613,7 @@ class PidgenDataElement(PidgenElement):
         Return True if this data object has any validators.
         """
 
-        return self.minValue is not None or self.maxValue is not None
+        return self.minValue is not None or self.maxValue is not None or self.get('range') is not None
 
     def hasInitializers(self):
         """
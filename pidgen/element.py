@@ -6,9 +6,102 @@ import os
 from rapidfuzz import fuzz
 
 from . import debug
+from . import timing
+from .xmlparser import CompactElement
 
 
-class PidgenElement():
+# Compiled schema for each PidgenElement class (by class name)
+SCHEMAS = {}
+
+
+class PidgenSchema():
+    """
+    Key and child validation tables for a PidgenElement class.
+
+    The tables are compiled once (when the class is created) from the
+    BASIC_KEYS, ALLOWED_KEYS, REQUIRED_KEYS, ALLOWED_CHILDREN and REQUIRED_CHILDREN class attributes.
+
+    Each entry in these lists is either a name, or a tuple of synonymous names
+    (the first name in the tuple is the canonical name).
+
+    Attributes:
+        allowedKeys - frozenset of (lower-case) allowed keys (including required keys)
+        requiredKeys - frozenset of (lower-case) required keys
+        allowedChildren - frozenset of (lower-case) allowed child tags
+        requiredChildren - frozenset of (lower-case) required child tags
+        keySynonyms - Map of (lower-case) key -> canonical key
+        childSynonyms - Map of (lower-case) child tag -> canonical tag
+    """
+
+    def __init__(self, cls):
+
+        self.keySynonyms = {}
+        self.childSynonyms = {}
+
+        self.requiredKeys = self._compile(getattr(cls, "REQUIRED_KEYS", []), self.keySynonyms)
+
+        self.allowedKeys = self._compile(
+            list(getattr(cls, "BASIC_KEYS", [])) + list(getattr(cls, "ALLOWED_KEYS", [])),
+            self.keySynonyms
+        ) | self.requiredKeys
+
+        self.requiredChildren = self._compile(getattr(cls, "REQUIRED_CHILDREN", []), self.childSynonyms)
+
+        self.allowedChildren = self._compile(getattr(cls, "ALLOWED_CHILDREN", []), self.childSynonyms) | self.requiredChildren
+
+    @staticmethod
+    def _compile(entries, synonyms):
+        """
+        Compile a list of names (or tuples of synonymous names) into a frozenset of lower-case names.
+        Any synonyms are added to the provided synonym map.
+        """
+
+        names = set()
+
+        for entry in entries:
+
+            if type(entry) not in [list, tuple]:
+                entry = [entry]
+
+            entry = [name.lower() for name in entry]
+
+            for name in entry:
+                names.add(name)
+                synonyms[name] = entry[0]
+
+        return frozenset(names)
+
+    def canonicalKey(self, key):
+        """ Return the canonical (lower-case) name for a key """
+
+        key = key.lower()
+
+        return self.keySynonyms.get(key, key)
+
+    def canonicalChild(self, tag):
+        """ Return the canonical (lower-case) name for a child tag """
+
+        tag = tag.lower()
+
+        return self.childSynonyms.get(tag, tag)
+
+
+class PidgenElementType(type):
+    """
+    Metaclass for PidgenElement classes,
+    which compiles the schema for each class when it is created.
+    """
+
+    def __init__(cls, name, bases, namespace):
+
+        super().__init__(name, bases, namespace)
+
+        cls.SCHEMA = PidgenSchema(cls)
+
+        SCHEMAS[name] = cls.SCHEMA
+
+
+class PidgenElement(metaclass=PidgenElementType):
     """
     Base level PidgenElement class.
     Provides low-level functionality inherited by all higher classes
@@ -25,6 +118,15 @@ class PidgenElement():
     _TRUE = ["y", "yes", "1", "true", "on"]
     _FALSE = ["n", "no", "0", "false", "off"]
 
+    # Options for specifying the byte order (the 'endian' key / setting), and the matching struct prefix
+    _ENDIAN = {
+        "little": "<",
+        "le": "<",
+        "big": ">",
+        "be": ">",
+        "network": ">",
+    }
+
     def __repr__(self):
         return "{f}:{line} - <{tag}>:{name}".format(
             f=self.path,
@@ -45,6 +147,8 @@ class PidgenElement():
             path - Filepath of this object
         """
 
+        constructed = timing.start()
+
         if not hasattr(self, 'xml'):
             self.xml = kwargs.get("xml", None)
 
@@ -58,11 +162,22 @@ class PidgenElement():
         # Store a copy of the kwargs
         self.kwargs = kwargs
 
+        started = timing.start()
+
         self.validateKeys()
         self.validateChildren()
 
+        if started is not None:
+            timing.stop("validate", started, key=self.__class__.__name__, path=self.path)
+
         self._parse()
 
+        if self.getSetting("compact"):
+            self.compact()
+
+        if constructed is not None:
+            timing.stop("construct", constructed, key=self.__class__.__name__, path=self.path)
+
     def _parse(self):
         if self.xml is not None:
             debug.debug("Parsing", str(self))
@@ -73,6 +188,35 @@ class PidgenElement():
         """ Default implementation does nothing... """
         pass
 
+    def indexSymbols(self, index):
+        """
+        Add any named definitions provided by this element to the symbol index (see linker.py).
+        Default implementation does nothing...
+        """
+        pass
+
+    def link(self, linker):
+        """
+        Resolve any references made by this element (see linker.py).
+        Default implementation does nothing...
+        """
+        pass
+
+    def compact(self):
+        """
+        Release the XML data for this element (once it has been parsed).
+        Only the tag, attributes and line number are retained.
+        """
+
+        if self.xml is None or isinstance(self.xml, CompactElement):
+            return
+
+        self.xml = CompactElement(self.xml)
+
+        # The kwargs would otherwise keep a reference to the XML tree
+        # (A new dict is created, as dicts do not shrink when items are removed)
+        self.kwargs = dict((key, value) for key, value in self.kwargs.items() if key != "xml")
+
     def checkPath(self, path):
         """
         Check if the given path has already been parsed by the protocol.
@@ -116,9 +260,23 @@ class PidgenElement():
             - If multiple matches are found, issue an error and return None
         """
 
+        started = timing.start()
+
+        try:
+            return self._findItemByName(item_type, item_name, global_search, ignore_case)
+        finally:
+            if started is not None:
+                key = item_type if type(item_type) is str else getattr(item_type, "__name__", str(item_type))
+                timing.stop("lookup", started, key=key, path=self.path)
+
+    def _findItemByName(self, item_type, item_name, global_search, ignore_case):
+
         if global_search:
             # Search the entire protocol
             context = self.protocol
+
+            # Ensure the item has been loaded (if the protocol is being loaded lazily)
+            context.loadSymbol(item_name)
         else:
             # Search just the current object
             context = self
@@ -164,6 +322,14 @@ class PidgenElement():
 
         return None
 
+    def loadSymbol(self, name):
+        """
+        Ensure that the named symbol is loaded.
+        Only protocols which are loaded lazily need to do anything here.
+        """
+
+        return True
+
     def getChildren(self, pattern, traverse_children=False):
         """
         Return any children under this item which conform to the provided pattern.
@@ -204,10 +370,12 @@ class PidgenElement():
         until there are no higher parent objects.
         """
 
-        if not hasattr(self, 'parent') or self.parent is None:
-            return self
-        else:
-            return self.parent
+        element = self
+
+        while getattr(element, 'parent', None) is not None:
+            element = element.parent
+
+        return element
 
     @property
     def lineNumber(self):
@@ -387,67 +555,95 @@ class PidgenElement():
 
         self.kwargs[key] = value
 
-    @property
-    def required_keys(self):
-        """ Return a list of keys required for this element """
+    def applyEndian(self):
+        """
+        Apply the 'endian' key of this element (if specified) to the settings hierarchy,
+        so that the byte order is inherited by every element below this one.
+        A byte order which is passed directly to this element (as a setting) takes precedence.
+        """
 
-        if hasattr(self, "REQUIRED_KEYS"):
-            return set(self.REQUIRED_KEYS)
-        else:
-            return set()
+        if "endian" in self.kwargs:
+            return
+
+        value = self.get("endian", None)
+
+        if value is None:
+            return
+
+        value = value.strip().lower()
+
+        if value not in self._ENDIAN:
+            debug.error("Invalid endian value '{v}' for '{n}' - must be 'little' or 'big' - {f}".format(
+                v=value,
+                n=self.name,
+                f=self.path
+            ))
+
+            return
+
+        self.setSettings("endian", value)
 
     @property
-    def allowed_keys(self):
-        """ Return a list of keys allowed for this element """
+    def byteOrder(self):
+        """
+        Return the byte order of this element, as a struct format prefix ('<' or '>').
 
-        # These keys are "allowed" for any element
-        allowed = set(self.BASIC_KEYS)
+        The byte order is specified with the 'endian' setting (little-endian by default),
+        which is inherited from the enclosing packet, struct, file or protocol.
+        """
 
-        if hasattr(self, "ALLOWED_KEYS"):
-            for k in self.ALLOWED_KEYS:
-                allowed.add(k)
+        value = self.getSetting("endian")
 
-        # Required keys are also 'allowed'
-        for k in self.required_keys:
-            allowed.add(k)
-        
-        return allowed
+        if value is None:
+            return "<"
+
+        order = self._ENDIAN.get(str(value).lower(), None)
+
+        if order is None:
+            debug.error("Invalid endian setting '{v}' - must be 'little' or 'big'".format(v=value))
+            return "<"
+
+        return order
 
     @property
-    def required_children(self):
-        """ Return a list of child elements required for this element """
+    def required_keys(self):
+        """ Return a set of keys required for this element """
+        return self.SCHEMA.requiredKeys
 
-        if hasattr(self, "REQUIRED_CHILDREN"):
-            return set(self.REQUIRED_CHILDREN)
-        else:
-            return set()
+    @property
+    def allowed_keys(self):
+        """ Return a set of keys allowed for this element """
+        return self.SCHEMA.allowedKeys
 
     @property
-    def allowed_children(self):
-        """ Return a list of child elements allowed for this element """
+    def required_children(self):
+        """ Return a set of child elements required for this element """
+        return self.SCHEMA.requiredChildren
 
-        if hasattr(self, "ALLOWED_CHILDREN"):
-            return set(self.ALLOWED_CHILDREN)
-        else:
-            return set()
+    @property
+    def allowed_children(self):
+        """ Return a set of child elements allowed for this element """
+        return self.SCHEMA.allowedChildren
 
     def validateKeys(self):
         """
         Ensure that the tags provided under this element are valid.
         """
 
-        # Check that any required keys are provided
+        schema = self.SCHEMA
 
         provided = self.keys()
-        
-        for key in self.required_keys:
-            if key not in provided:
-                self.missingKey(key)
+        lowered = set(key.lower() for key in provided)
+
+        # Check that any required keys are provided
+        for key in sorted(schema.requiredKeys - lowered):
+            self.missingKey(key)
 
         # Check for unknown keys
-        for el in provided:
-            if el.lower() not in self.allowed_keys:
-                self.unknownKey(el)
+        if lowered - schema.allowedKeys:
+            for key in provided:
+                if key.lower() not in schema.allowedKeys:
+                    self.unknownKey(key)
 
     def validateChildren(self):
         """
@@ -457,12 +653,18 @@ class PidgenElement():
         if self.xml is None:
             return
 
-        for child in self.xml.getchildren():
+        schema = self.SCHEMA
 
-            tag = child.tag.lower()
+        children = list(self.xml)
+        tags = set(child.tag.lower() for child in children)
 
-            if tag not in self.allowed_children:
-                self.unknownChild(child.tag, line=child._start_line_number)
+        for tag in sorted(schema.requiredChildren - tags):
+            self.missingChild(tag)
+
+        if tags - schema.allowedChildren:
+            for child in children:
+                if child.tag.lower() not in schema.allowedChildren:
+                    self.unknownChild(child.tag, line=child._start_line_number)
 
     @property
     def level(self):
@@ -603,7 +805,7 @@ class PidgenElement():
         allowed = self.allowed_keys
 
         if len(allowed) > 0:
-            warning += " (Allowed elements = '" + ", ".join([k for k in allowed]) + "')"
+            warning += " (Allowed elements = '" + ", ".join(sorted(allowed)) + "')"
 
         debug.warning(warning)
 
@@ -623,6 +825,20 @@ class PidgenElement():
 
             debug.warning(did_you_mean)
 
+    def missingChild(self, element):
+        """
+        Display an error about a missing child element
+        """
+
+        error = "{f}{line} - Missing child element '{e}' in <{t}> '{n}'".format(
+            f=self.path,
+            line=":{n}".format(n=self.lineNumber) if self.lineNumber > 0 else "",
+            e=element,
+            t=self.tag,
+            n=self.name)
+
+        debug.error(error)
+
     def unknownChild(self, element, line=0):
         """
         Display a warning about an unknown child element.
@@ -639,7 +855,7 @@ class PidgenElement():
         allowed = self.allowed_children
 
         if len(allowed) > 0:
-            warning += " (Allowed elements = '" + ", ".join([k for k in allowed]) + "')"
+            warning += " (Allowed elements = '" + ", ".join(sorted(allowed)) + "')"
         
         debug.warning(warning)
 
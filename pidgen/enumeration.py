@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from enum import IntEnum
+
 from .element import PidgenElement
 from . import debug
 
@@ -22,8 +24,15 @@ class PidgenEnumerationValue(PidgenElement):
 
     def __init__(self, parent, **kwargs):
 
+        # Computed value (set when the parent enumeration is calculated)
+        self.value = None
+
         PidgenElement.__init__(self, parent, **kwargs)
 
+    def value_raw(self):
+        """ Return the raw (unparsed) value string for this element, if provided """
+        return self.get("value", None)
+
     @property
     def prefix(self):
         if self.isSet("ignoreprefix"):
@@ -68,10 +77,30 @@ class PidgenEnumeration(PidgenElement):
         "value"
     ]
 
+    # Use a dense (list) lookup table if the span of values is no more than this multiple of the number of values
+    DENSE_RATIO = 2
+
     def __init__(self, parent, **kwargs):
 
+        # Computed values, and lookup tables (calculated on demand)
+        self._computed = None
+        self._forward = None
+        self._reverse = None
+        self._reverse_offset = 0
+        self._int_enum = None
+
         PidgenElement.__init__(self, parent, **kwargs)
 
+    def addChild(self, child):
+        """ Add a new child object, which invalidates any computed values """
+
+        PidgenElement.addChild(self, child)
+
+        self._computed = None
+        self._forward = None
+        self._reverse = None
+        self._int_enum = None
+
     @property
     def values(self):
         """ Return all the values under this enumeration """
@@ -84,7 +113,7 @@ class PidgenEnumeration(PidgenElement):
     def parse(self):
 
         # Look for all the 'value' objects
-        for child in self.xml.getchildren():
+        for child in self.xml:
             tag = child.tag.lower()
 
             if tag == "value":
@@ -95,8 +124,13 @@ class PidgenEnumeration(PidgenElement):
     def calculate(self):
         """
         Calculate the enumerated values
+
+        Return:
+            List of (PidgenEnumerationValue, value) pairs, in declaration order
         """
 
+        results = []
+
         # Seed the iterator index
         idx = 0
 
@@ -163,6 +197,189 @@ class PidgenEnumeration(PidgenElement):
 
             debug.debug("Found enumeration value:", item.name, "->", value)
 
+            item.value = value
+
+            results.append((item, value))
+
+        self._computed = results
+
+        return results
+
+    @property
+    def computedValues(self):
+        """
+        Return the computed (PidgenEnumerationValue, value) pairs for this enumeration.
+        Values are calculated once, on demand.
+        """
+
+        if self._computed is None:
+            self.calculate()
+
+        return self._computed
+
+    def _buildTables(self):
+        """
+        Build the forward (name -> value) and reverse (value -> name) lookup tables.
+
+        The reverse table is a dense list (indexed by value - minimum) if the values are compact,
+        otherwise it is a dict. Where values are duplicated, the first name is used.
+        """
+
+        values = self.computedValues
+
+        forward = {}
+
+        for item, value in values:
+            forward.setdefault(item.enum_title, value)
+            forward.setdefault(item.name, value)
+
+        reverse = {}
+
+        for item, value in values:
+            reverse.setdefault(value, item.enum_title)
+
+        self._reverse_offset = 0
+
+        if len(reverse) > 0:
+            lo = min(reverse)
+            hi = max(reverse)
+
+            if hi - lo + 1 <= max(16, self.DENSE_RATIO * len(reverse)):
+                table = [None] * (hi - lo + 1)
+
+                for value, title in reverse.items():
+                    table[value - lo] = title
+
+                reverse = table
+                self._reverse_offset = lo
+
+        self._forward = forward
+        self._reverse = reverse
+
+    @property
+    def isDense(self):
+        """ Return True if the reverse lookup table is a dense list """
+
+        if self._reverse is None:
+            self._buildTables()
+
+        return type(self._reverse) is list
+
+    def indexSymbols(self, index):
+
+        index.add("enumeration", self.name, self)
+
+        for item, value in self.computedValues:
+            index.add("value", item.enum_title, item)
+            index.add("value", item.name, item)
+
+    def valueOf(self, name):
+        """
+        Return the value for the given name (either the rendered title, e.g. 'STATUS_OK_VALUES', or the plain name).
+        Returns None if the name is not part of this enumeration.
+        """
+
+        if self._forward is None:
+            self._buildTables()
+
+        return self._forward.get(name, None)
+
+    def nameOf(self, value):
+        """
+        Return the (rendered) name for the given value, or None if the value is not part of this enumeration.
+        """
+
+        if self._reverse is None:
+            self._buildTables()
+
+        if type(self._reverse) is list:
+            idx = value - self._reverse_offset
+
+            if 0 <= idx < len(self._reverse):
+                return self._reverse[idx]
+
+            return None
+
+        return self._reverse.get(value, None)
+
+    def intEnum(self):
+        """
+        Return a Python IntEnum class for this enumeration.
+        Duplicated values become aliases of the first name with that value.
+        """
+
+        if self._int_enum is None:
+            self._int_enum = IntEnum(self.name, [(item.enum_title, value) for item, value in self.computedValues])
+
+        return self._int_enum
+
+    def renderC(self):
+        """
+        Render C code for this enumeration:
+        - An enum definition
+        - A value-to-string function, using an array lookup (dense values) or a switch statement
+
+        Return:
+            C source code (string)
+        """
+
+        name = self.name
+
+        lines = [
+            "typedef enum",
+            "{",
+        ]
+
+        for item, value in self.computedValues:
+            comment = " //!< {c}".format(c=item.comment) if item.comment else ""
+            lines.append("    {t} = {v},{c}".format(t=item.enum_title, v=value, c=comment))
+
+        lines += [
+            "}} {n};".format(n=name),
+            "",
+            "//! Return the name of a {n} value".format(n=name),
+            "const char* {n}_toString(int value)".format(n=name),
+            "{",
+        ]
+
+        if self.isDense:
+            lo = self._reverse_offset
+
+            lines.append("    static const char* const names[{n}] =".format(n=len(self._reverse)))
+            lines.append("    {")
+
+            for title in self._reverse:
+                lines.append("        {t},".format(t='"{s}"'.format(s=title) if title is not None else "0"))
+
+            lines += [
+                "    };",
+                "",
+                "    const unsigned int idx = (unsigned int)(value - ({lo}));".format(lo=lo),
+                "",
+                "    if ((idx < {n}) && (names[idx] != 0))".format(n=len(self._reverse)),
+                "        return names[idx];",
+                "",
+                "    return \"\";",
+            ]
+
+        else:
+            lines.append("    switch (value)")
+            lines.append("    {")
+
+            for value in sorted(self._reverse):
+                lines.append("    case {v}:".format(v=value))
+                lines.append("        return \"{t}\";".format(t=self._reverse[value]))
+
+            lines += [
+                "    default:",
+                "        return \"\";",
+                "    }",
+            ]
+
+        lines.append("}")
+
+        return "\n".join(lines) + "\n"
+
     @property
     def prefix(self):
         """ Return the prefix for this enumeration """
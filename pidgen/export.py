@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar export of decoded captures.
+
+A capture (a file containing a stream of encoded frames) is decoded in fixed-size chunks,
+and the decoded values are written to a columnar store for each packet type:
+
+    <output>/<Packet>/<field>.npy  - One NumPy array for each field (one row per packet)
+    <output>/<Packet>/metadata.json - Packet ID, number of packets, and the datatype and units of each field
+
+Alternatively, each store can be bundled into a single <output>/<Packet>.npz file once the capture is decoded,
+where the metadata is stored as a JSON string in the 'metadata' array.
+
+Columns are appended to (and only the .npy header is rewritten when the file is closed),
+so the memory used is bounded by the chunk size rather than the size of the capture.
+
+Packets with a fixed size are gathered from each chunk and decoded with a single vectorized operation per packet type.
+Packets without a fixed size (conditional fields, or length-prefixed strings) are decoded one at a time.
+For each conditional field, the store also contains a '<field>__present' column.
+"""
+
+import json
+import os
+import shutil
+import struct
+import zipfile
+
+from .data import PidgenDataElement as Data
+from .stream import PidgenStream
+from . import debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Default size (bytes) of each chunk read from the capture
+CHUNK_SIZE = 1 << 20
+
+
+class PidgenColumnWriter():
+    """
+    Writes a single column to a .npy file, one block of rows at a time.
+
+    The size of the .npy header is reserved when the file is created,
+    and the header is rewritten (with the final number of rows) when the file is closed.
+
+    If a block is appended with a wider datatype (e.g. a longer string), the rows already written are
+    converted to the wider datatype (the file is rewritten once, rather than for every block).
+
+    Attributes:
+        path - Path to the .npy file
+        dtype - Datatype of each row
+        shape - Shape of each row (e.g. (3, ) for a three element array field)
+        count - Number of rows written
+    """
+
+    # Reserved size of the .npy header (bytes, including the magic string)
+    HEADER_SIZE = 256
+
+    # Number of rows converted at once, when widening the column
+    BLOCK_ROWS = 1 << 16
+
+    def __init__(self, path):
+
+        self.path = path
+        self.dtype = None
+        self.shape = None
+        self.count = 0
+
+        self._file = None
+
+    def __repr__(self):
+        return "<Column '{p}' {d} x {n}>".format(p=self.path, d=self.dtype, n=self.count)
+
+    def _header(self, count):
+        """ Return the .npy (version 1.0) header for the given number of rows, padded to HEADER_SIZE """
+
+        header = "{{'descr': {d}, 'fortran_order': False, 'shape': {s}, }}".format(
+            d=repr(numpy.lib.format.dtype_to_descr(self.dtype)),
+            s=repr((count, ) + self.shape)
+        )
+
+        prefix = numpy.lib.format.MAGIC_PREFIX + b"\x01\x00"
+
+        length = self.HEADER_SIZE - len(prefix) - 2
+
+        header = header.ljust(length - 1) + "\n"
+
+        if len(header) > length:
+            raise ValueError("Column header is too long - {p}".format(p=self.path))
+
+        return prefix + struct.pack("<H", length) + header.encode("latin1")
+
+    def append(self, column):
+        """
+        Append a block of rows to the column.
+
+        Args:
+            column - NumPy array (or sequence), with one row per packet
+        """
+
+        column = numpy.asarray(column)
+
+        if self._file is None:
+            self.dtype = column.dtype
+            self.shape = column.shape[1:]
+
+            self._file = open(self.path, "wb")
+            self._file.write(self._header(0))
+
+        if column.shape[1:] != self.shape:
+            raise ValueError("Column shape {a} does not match {b} - {p}".format(a=column.shape[1:], b=self.shape, p=self.path))
+
+        if column.dtype != self.dtype:
+            dtype = numpy.promote_types(self.dtype, column.dtype)
+
+            if dtype != self.dtype:
+                self._widen(dtype)
+
+            column = column.astype(self.dtype)
+
+        self._file.write(numpy.ascontiguousarray(column).tobytes())
+
+        self.count += len(column)
+
+    def _widen(self, dtype):
+        """ Convert the rows which have already been written to a wider datatype """
+
+        self._file.close()
+
+        original = self.path + ".tmp"
+
+        os.replace(self.path, original)
+
+        rows = numpy.memmap(original, dtype=self.dtype, mode="r", offset=self.HEADER_SIZE, shape=(self.count, ) + self.shape) if self.count > 0 else []
+
+        self.dtype = dtype
+
+        self._file = open(self.path, "wb")
+        self._file.write(self._header(0))
+
+        for idx in range(0, self.count, self.BLOCK_ROWS):
+            self._file.write(numpy.ascontiguousarray(rows[idx:idx + self.BLOCK_ROWS], dtype=dtype).tobytes())
+
+        del rows
+
+        os.remove(original)
+
+    def close(self):
+        """ Finish the column, writing the final number of rows into the header """
+
+        if self._file is None:
+            return
+
+        self._file.seek(0)
+        self._file.write(self._header(self.count))
+        self._file.close()
+
+        self._file = None
+
+
+class PidgenPacketStore():
+    """
+    Columnar store of the decoded values for a single packet type.
+
+    Attributes:
+        packet - PidgenPacket object
+        plan - Codec plan of the packet
+        directory - Directory containing the column files
+        names - Names of the columns (in encoded order)
+        dtypes - In-memory NumPy dtype of each field (None where the dtype is inferred from the values, e.g. strings)
+        count - Number of packets written
+    """
+
+    def __init__(self, directory, packet, plan):
+
+        self.packet = packet
+        self.plan = plan
+        self.directory = directory
+        self.count = 0
+
+        self.elements = fieldElements(plan.layout)
+
+        # In-memory NumPy dtype of each field, for packets which are decoded one at a time (None for strings)
+        self.dtypes = dict((name, Data._NUMPY_FORMAT.get(element.datatype, None)) for name, element in self.elements.items())
+
+        # Conditional fields (present only in some packets), see PidgenConditionalPlan.fields
+        self.conditional = []
+
+        if isinstance(plan.fields, dict):
+            self.conditional = [name for name in plan.names if name in plan.fields]
+
+        self.names = list(plan.names) + [name + "__present" for name in self.conditional]
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.columns = dict((name, PidgenColumnWriter(os.path.join(directory, name + ".npy"))) for name in self.names)
+
+    def __repr__(self):
+        return "<Store '{n}' ({c} packets)>".format(n=self.packet.name, c=self.count)
+
+    def appendColumns(self, columns):
+        """ Append a block of decoded columns (dict of field name -> array) """
+
+        count = None
+
+        for name in self.names:
+            column = columns[name]
+            self.columns[name].append(column)
+
+            count = len(column)
+
+        self.count += count or 0
+
+    def appendRecords(self, records):
+        """ Append a block of decoded packets (list of dicts of field name -> value) """
+
+        if len(records) == 0:
+            return
+
+        columns = {}
+
+        for name in self.plan.names:
+
+            values = [record.get(name, None) for record in records]
+
+            if name in self.conditional:
+                present = [value is not None for value in values]
+                columns[name + "__present"] = numpy.array(present, dtype=bool)
+
+                if not all(present):
+                    values = self._fillMissing(name, values)
+
+            columns[name] = numpy.array(values, dtype=self.dtypes.get(name, None))
+
+        self.appendColumns(columns)
+
+    def _fillMissing(self, name, values):
+        """ Replace the values of conditional fields which are not present with zero (or an empty string) """
+
+        writer = self.columns[name]
+
+        template = next((value for value in values if value is not None), None)
+
+        if template is None:
+            if writer.dtype is not None:
+                return numpy.zeros((len(values), ) + writer.shape, dtype=writer.dtype)
+
+            return [0] * len(values)
+
+        blank = numpy.zeros_like(numpy.asarray(template)).tolist()
+
+        return [blank if value is None else value for value in values]
+
+    @property
+    def metadata(self):
+        """ Return a JSON-compatible description of the store """
+
+        fields = {}
+
+        for name in self.names:
+
+            writer = self.columns[name]
+            element = self.elements.get(name, None)
+
+            fields[name] = {
+                "dtype": None if writer.dtype is None else writer.dtype.str,
+                "shape": list(writer.shape or ()),
+                "units": getattr(element, "units", None),
+                "datatype": getattr(element, "datatype", None),
+            }
+
+        return {
+            "packet": self.packet.name,
+            "id": self.packet.packetIdValue,
+            "count": self.count,
+            "fields": fields,
+        }
+
+    def close(self):
+        """ Finish every column, and write the metadata file """
+
+        for writer in self.columns.values():
+
+            # Columns which were never written are stored as empty arrays
+            if writer.dtype is None:
+                writer.append(numpy.zeros(0))
+
+            writer.close()
+
+        with open(os.path.join(self.directory, "metadata.json"), "w") as f:
+            json.dump(self.metadata, f, indent=2)
+
+    def bundle(self, filename):
+        """
+        Bundle the store into a single (uncompressed) .npz file, and remove the column files.
+        Must be called after close().
+        """
+
+        with zipfile.ZipFile(filename, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+
+            for name in self.names:
+                archive.write(self.columns[name].path, name + ".npy")
+
+            with archive.open("metadata.npy", "w", force_zip64=True) as f:
+                numpy.lib.format.write_array(f, numpy.array(json.dumps(self.metadata)))
+
+        shutil.rmtree(self.directory)
+
+
+def fieldElements(layout, prefix=""):
+    """
+    Return a dict of the (dotted) field names of a layout (as decoded by a codec plan) to the data elements which define them.
+    """
+
+    elements = {}
+
+    for field in layout.fields:
+
+        name = prefix + field.name
+
+        if not field.isStruct:
+            elements[name] = field.element
+            continue
+
+        for idx in range(field.count):
+            item_name = name
+
+            if field.isArray:
+                item_name += "[{i}]".format(i=idx)
+
+            elements.update(fieldElements(field.layout, item_name + "."))
+
+    return elements
+
+
+def loadStore(path):
+    """
+    Load a packet store (either a directory, or a .npz file).
+
+    Return:
+        (columns, metadata) tuple, where columns is a dict of field name -> NumPy array.
+        Columns in a directory store are memory-mapped.
+    """
+
+    if os.path.isdir(path):
+        with open(os.path.join(path, "metadata.json"), "r") as f:
+            metadata = json.load(f)
+
+        columns = dict((name, numpy.load(os.path.join(path, name + ".npy"), mmap_mode="r")) for name in metadata["fields"])
+
+        return columns, metadata
+
+    with numpy.load(path) as archive:
+        metadata = json.loads(str(archive["metadata"]))
+
+        columns = dict((name, archive[name]) for name in metadata["fields"])
+
+    return columns, metadata
+
+
+def exportCapture(packets, capture, directory, stream=None, chunk_size=CHUNK_SIZE, npz=False, packed=True):
+    """
+    Decode a capture file, and write the decoded values to a columnar store for each packet type.
+
+    Args:
+        packets - List of PidgenPacket objects which may appear in the capture
+        capture - Path to the capture file
+        directory - Output directory
+
+    kwargs:
+        stream - Stream used to split the capture into frames (default = PidgenStream)
+        chunk_size - Number of bytes decoded at once
+        npz - If True, bundle each store into a single .npz file
+        packed - Use the packed (default) or aligned packet layouts
+
+    Return:
+        Dict of packet name -> number of packets decoded (or None if the capture could not be decoded)
+    """
+
+    if numpy is None:
+        debug.error("NumPy is required to export captures")
+        return None
+
+    if not os.path.isfile(capture):
+        debug.error("Capture file '{f}' does not exist".format(f=capture))
+        return None
+
+    if stream is None:
+        stream = PidgenStream(packets, packed=packed)
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    stores = {}
+
+    def store(packet_id):
+
+        if packet_id not in stores:
+            packet = stream.packets[packet_id]
+            stores[packet_id] = PidgenPacketStore(os.path.join(directory, packet.name), packet, stream.plans[packet_id])
+
+        return stores[packet_id]
+
+    buffer = bytearray()
+
+    with open(capture, "rb") as f:
+
+        while True:
+
+            chunk = f.read(chunk_size)
+
+            buffer += chunk
+
+            # Offsets of the fixed size packets, and the decoded variable size packets, in this chunk
+            offsets = {}
+            records = {}
+
+            for packet_id, plan, offset in stream.frames(buffer):
+                if plan.size is not None:
+                    offsets.setdefault(packet_id, []).append(offset)
+                else:
+                    records.setdefault(packet_id, []).append(plan.decode(buffer, offset, convert=True))
+
+            data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+
+            for packet_id, positions in offsets.items():
+                plan = stream.plans[packet_id]
+
+                # Gather the packets into a contiguous block (one row per packet), and decode every column at once
+                rows = data[numpy.array(positions, dtype=numpy.int64)[:, None] + numpy.arange(plan.size)]
+
+                store(packet_id).appendColumns(plan.decodeColumns(rows, count=len(positions)))
+
+            for packet_id, values in records.items():
+                store(packet_id).appendRecords(values)
+
+            # Release the view of the buffer, so that the decoded data can be discarded
+            del data
+            del buffer[:stream.consumed]
+
+            if len(chunk) == 0:
+                break
+
+    if len(buffer) > 0:
+        debug.warning("Incomplete frame at end of capture ({n} bytes) - {f}".format(n=len(buffer), f=capture))
+
+    counts = {}
+
+    for s in stores.values():
+        s.close()
+
+        if npz:
+            s.bundle(os.path.join(directory, s.packet.name + ".npz"))
+
+        counts[s.packet.name] = s.count
+
+    return counts
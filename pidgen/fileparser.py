@@ -4,16 +4,193 @@
 File parsing
 """
 
+import fnmatch
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from .element import PidgenElement
 from .struct import PidgenStruct
 from .packet import PidgenPacket
 from .enumeration import PidgenEnumeration
-from .xmlparser import parseXML
+from .framing import PidgenFraming
+from .xmlparser import parseXML, scanXML
 from . import debug
 
 
+def compileIgnoreMatcher(patterns):
+    """
+    Compile a list of 'ignore' patterns into a single matching function.
+
+    Plain names are checked against a set, and any glob patterns
+    (e.g. '*.png') are combined into a single regular expression,
+    so that each directory entry is tested exactly once.
+    Matching is case-insensitive.
+
+    Args:
+        patterns - List of names / glob patterns (or a comma-separated string)
+
+    Return:
+        Function which accepts an entry name, and returns True if it should be ignored
+    """
+
+    if patterns is None:
+        patterns = []
+
+    if type(patterns) is str:
+        patterns = patterns.split(",")
+
+    names = set()
+    globs = []
+
+    for pattern in patterns:
+        pattern = str(pattern).strip().lower()
+
+        if not pattern:
+            continue
+
+        if any(c in pattern for c in "*?["):
+            globs.append(fnmatch.translate(pattern))
+        else:
+            names.add(pattern)
+
+    regex = re.compile("|".join(globs)) if len(globs) > 0 else None
+
+    def match(name):
+        name = name.lower()
+
+        if name in names:
+            return True
+
+        return regex is not None and regex.match(name) is not None
+
+    return match
+
+
+def scanDirectory(path, ignore=None):
+    """
+    Scan a single directory for protocol files and sub-directories.
+
+    Each entry is inspected using os.scandir(), so the file type information
+    is obtained from the directory listing itself (no separate stat() calls).
+    Non-XML files are discarded on their name alone.
+
+    Args:
+        path - Directory to scan
+        ignore - Matching function (see compileIgnoreMatcher)
+
+    Return:
+        (files, dirs) tuple of sorted absolute paths
+    """
+
+    files = []
+    dirs = []
+
+    try:
+        entries = os.scandir(path)
+    except OSError as e:
+        debug.error("Could not scan directory '{d}' : {e}".format(d=path, e=e))
+        return files, dirs
+
+    with entries:
+        for entry in entries:
+
+            if ignore is not None and ignore(entry.name):
+                debug.info("Skipping {f}".format(f=entry.path))
+                continue
+
+            try:
+                if entry.name.lower().endswith(".xml"):
+                    if entry.is_file():
+                        files.append(os.path.abspath(entry.path))
+
+                elif entry.is_dir(follow_symlinks=False):
+                    dirs.append(os.path.abspath(entry.path))
+
+            except OSError:
+                continue
+
+    files.sort()
+    dirs.sort()
+
+    return files, dirs
+
+
+def walkDirectory(path, ignore=None, max_workers=None):
+    """
+    Walk an entire directory tree, scanning directories in parallel threads.
+
+    Directory listing is I/O bound, so sub-directories are submitted to a thread pool
+    as soon as they are discovered. The protocol elements themselves are constructed
+    afterwards (in the calling thread) from the returned listing, in sorted order.
+
+    Args:
+        path - Root directory of the tree
+        ignore - Matching function (see compileIgnoreMatcher)
+        max_workers - Maximum number of scanning threads (default = ThreadPoolExecutor default)
+
+    Return:
+        Dict mapping each absolute directory path to a (files, dirs) tuple
+    """
+
+    listing = {}
+
+    path = os.path.abspath(path)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+        pending = {pool.submit(scanDirectory, path, ignore): path}
+
+        while len(pending) > 0:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                dirpath = pending.pop(future)
+                files, dirs = future.result()
+
+                listing[dirpath] = (files, dirs)
+
+                for d in dirs:
+                    pending[pool.submit(scanDirectory, d, ignore)] = d
+
+    return listing
+
+
+def loadProtocolFile(parent, path):
+    """
+    Load a protocol file from disk, and construct a PidgenFileParser under the given parent.
+
+    Args:
+        parent - Parent element for the new file
+        path - Absolute path of the file
+
+    Return:
+        The new PidgenFileParser object, or None if the file is not a protocol file
+    """
+
+    if parent.getSetting("lazy"):
+        # Lazy loading - only scan the file for top-level definitions
+        root_tag, entries = scanXML(path)
+
+        if root_tag.lower() == 'protocol':
+            return PidgenFileParser(parent, path=path, symbols=entries)
+
+    else:
+        doc = parseXML(path)
+        root = doc.getroot()
+        root_tag = root.tag
+
+        if root_tag.lower() == 'protocol':
+            return PidgenFileParser(parent, xml=root, path=path)
+
+    debug.warning("File '{f}' has root tag '{t}' - skipping.".format(
+        f=path,
+        t=root_tag
+    ))
+
+    return None
+
+
 class PidgenDirectoryParser(PidgenElement):
     """
     Class for parsing a directory of protocol definition files.
@@ -30,38 +207,34 @@ class PidgenDirectoryParser(PidgenElement):
         """ Parse the current directory.
         - Look for any subdirectories
         - Look for any protocol files (.xml)
-        - Note: .xml files prefixed with _ character are treated differently.
+
+        The entire directory tree is scanned (in parallel) by the top-most directory parser,
+        and the resulting listing is shared with any sub-directory parsers via the settings hierarchy.
         """
 
         debug.info("Parsing directory:", self.path)
 
-        listing = os.listdir(self.path)
-
-        files = []
-        dirs = []
-
-        ignore_list = self.getConfigValue("ignore", [])
+        abspath = os.path.abspath(self.path)
 
-        if type(ignore_list) not in [list, tuple]:
-            debug.warning("'ignore' values in {f}protocol.xml must be a list".format(f=self.path))
-            ignore_list = []
+        listing = self.getSetting("listing")
 
-        # Ignore values should be case-insensitive
-        ignore = [x.lower() for x in ignore_list]
+        if listing is None or abspath not in listing:
 
-        for item in listing:
+            ignore = self.getSetting("ignore")
 
-            path = os.path.join(self.path, item)
+            if ignore is not None and type(ignore) not in [str, list, tuple]:
+                debug.warning("'ignore' values for directory '{d}' must be a list".format(d=self.path))
+                ignore = None
 
-            if item.lower() in ignore:
-                debug.info("Skipping {f}".format(f=path))
-                continue
+            listing = walkDirectory(
+                abspath,
+                ignore=compileIgnoreMatcher(ignore),
+                max_workers=self.getSetting("max_workers")
+            )
 
-            if os.path.isdir(path):
-                dirs.append(item)
+            self.setSettings("listing", listing)
 
-            if os.path.isfile(path) and item.endswith(".xml"):
-                files.append(path)
+        files, dirs = listing[abspath]
 
         # Parse any files first
         self.parseFiles(files)
@@ -80,13 +253,14 @@ class PidgenDirectoryParser(PidgenElement):
         # Parse all protocol files
         for f in files:
 
-            self.includePath(self, f)
+            if self.checkPath(f):
+                loadProtocolFile(self, f)
 
     def parseSubDirs(self, dirs):
         for d in dirs:
 
             # Create a new DirectoryParser instance
-            PidgenDirectoryParser(self, os.path.join(self.path, d))
+            PidgenDirectoryParser(self, d)
 
     @property
     def files(self):
@@ -104,53 +278,148 @@ class PidgenFileParser(PidgenElement):
     Class for representing a single protocol file.
     """
 
+    ALLOWED_KEYS = [
+        "endian",
+    ]
+
     ALLOWED_CHILDREN = [
-        "pkt", "packet",  # Synonymous
-        "struct", "structure",  # Synonymous
-        "enum", "enumeration",  # Synonymous
+        ("packet", "pkt"),
+        ("struct", "structure"),
+        ("enumeration", "enum"),
+        "framing",
         "require",
     ]
 
+    # Top-level tags which define a named symbol (canonical names)
+    SYMBOL_TAGS = [
+        "packet",
+        "struct",
+        "enumeration",
+    ]
+
     def __init__(self, parent, **kwargs):
 
+        # Index of top-level (tag, attributes, line) entries, for a lazily loaded file
+        self.symbols = kwargs.pop("symbols", None)
+
         PidgenElement.__init__(self, parent, **kwargs)
 
     def parse(self):
         """
         Parse an individual protocol file.
         The root-node has been checked by the directory parser, so we know this file is valid.
+
+        If the file is being loaded lazily (no xml data yet), only the symbol index is processed.
         """
 
-        children = self.xml.getchildren()
+        if self.xml is None:
+            self.parseSymbols()
+            return
+
+        self.applyEndian()
+
+        children = list(self.xml)
 
         for child in children:
             # Iterate through each top-level structure in the XML file
             tag = child.tag.lower()
 
-            if tag in ["enum", "enumeration"]:
-                # Construct an Enumeration under this file
-                PidgenEnumeration(self, xml=child)
-
-            elif tag in ["pkt", "packet"]:
-                # Construct a Packet under this file
-                PidgenPacket(self, xml=child)
-
-            elif tag in ["struct", "structure"]:
-                # Construct a struct under this file
-                PidgenStruct(self, xml=child)
-            
-            elif tag in ['require']:
-
-                # Loop through all keys, rather than using get()
-                # This is to circumvent case-sensitive search
-                for key in child.keys():
-                    if key.lower() in ['file']:
-                        self.includeFile(child.get(key))
+            if tag in ['require']:
+                self.parseRequire(child)
+            else:
+                self.parseDefinition(child)
+
+    def parseDefinition(self, child):
+        """
+        Construct the element for a single top-level definition in this file.
+        """
+
+        tag = self.SCHEMA.canonicalChild(child.tag)
+
+        if tag == "enumeration":
+            # Construct an Enumeration under this file
+            PidgenEnumeration(self, xml=child)
+
+        elif tag == "packet":
+            # Construct a Packet under this file
+            PidgenPacket(self, xml=child)
+
+        elif tag == "struct":
+            # Construct a struct under this file
+            PidgenStruct(self, xml=child)
+
+        elif tag == "framing":
+            # Frame format for packets in this protocol
+            PidgenFraming(self, xml=child)
+
+    def parseRequire(self, child):
+        """
+        Process a <Require> element, which includes another file or directory.
+
+        Args:
+            child - The <Require> element (either an xml element, or a dict of attributes)
+        """
+
+        # Loop through all keys, rather than using get()
+        # This is to circumvent case-sensitive search
+        for key in child.keys():
+            if key.lower() in ['file']:
+                self.includeFile(child.get(key))
+                break
+
+            elif key.lower() in ['dir', 'directory']:
+                self.includeDirectory(child.get(key), ignore=self.getIgnoreList(child))
+                break
+
+    def parseSymbols(self):
+        """
+        Process the symbol index of a lazily loaded file.
+        - Any required files are indexed immediately
+        - Any named definitions are registered against the protocol, to be loaded on demand
+        """
+
+        for tag, attributes, line in self.symbols:
+
+            tag = self.SCHEMA.canonicalChild(tag)
+
+            if tag in ['require']:
+                self.parseRequire(attributes)
+
+            elif tag in self.SYMBOL_TAGS:
+                for key in attributes:
+                    if key.lower() == 'name':
+                        self.protocol.indexSymbol(attributes[key], self)
                         break
 
-                    elif key.lower() in ['dir', 'directory']:
-                        # TODO - Include relative directories
-                        pass
+    @property
+    def isLoaded(self):
+        """ Return True if the contents of this file have been parsed """
+        return self.xml is not None
+
+    def load(self):
+        """
+        Fully parse a file which has been loaded lazily.
+        Any <Require> elements have already been processed when the file was indexed.
+        """
+
+        if self.isLoaded:
+            return
+
+        debug.info("Loading file - {f}".format(f=self.path))
+
+        self.xml = parseXML(self.path).getroot()
+
+        self.validateKeys()
+        self.validateChildren()
+
+        self.applyEndian()
+
+        for child in self.xml:
+            if child.tag.lower() not in ['require']:
+                self.parseDefinition(child)
+
+        if self.getSetting("compact"):
+            self.compact()
 
     @property
     def enumerations(self):
@@ -158,6 +427,8 @@ class PidgenFileParser(PidgenElement):
         Return a list of enumerations which exist under this file.
         """
 
+        self.load()
+
         return self.getChildren(PidgenEnumeration)
 
     @property
@@ -166,6 +437,8 @@ class PidgenFileParser(PidgenElement):
         Return a list of packets which exist under this file.
         """
 
+        self.load()
+
         return self.getChildren(PidgenPacket)
         
     @property
@@ -174,8 +447,29 @@ class PidgenFileParser(PidgenElement):
         Return a list of structs which exist under this file
         """
 
+        self.load()
+
         return self.getChildren(PidgenStruct)
 
+    @property
+    def framing(self):
+        """
+        Return the PidgenFraming element defined in this file (or any file it includes), or None
+        """
+
+        self.load()
+
+        for framing in self.getChildren(PidgenFraming):
+            return framing
+
+        for f in self.getChildren(PidgenFileParser, traverse_children=True):
+            f.load()
+
+            for framing in f.getChildren(PidgenFraming):
+                return framing
+
+        return None
+
     def includeFile(self, filename):
         """
         Include a file relative to this one.
@@ -189,17 +483,55 @@ class PidgenFileParser(PidgenElement):
             return False
 
         if os.path.isfile(abspath):
+            loadProtocolFile(self, os.path.abspath(abspath))
 
-            doc = parseXML(abspath)
-            root = doc.getroot()
+    def includeDirectory(self, dirname, ignore=None):
+        """
+        Include an entire directory (recursively) relative to this file.
 
-            if root.tag.lower() == 'protocol':
-                
-                # Load the file
-                PidgenFileParser(self, xml=root, path=abspath)
+        Args:
+            dirname - Directory path, relative to this file
 
-            else:
-                debug.warning("File '{f}' has root tag '{t}' - skipping.".format(
-                    f=filename,
-                    t=root.tag
-                ))
+        kwargs:
+            ignore - List of names / glob patterns to skip within the directory
+        """
+
+        debug.info("{f} - Including directory '{p}'".format(f=self.path, p=dirname))
+
+        abspath = os.path.join(self.directory, dirname)
+
+        if not self.checkPath(abspath):
+            return False
+
+        if not os.path.isdir(abspath):
+            debug.error("{f} - Path '{p}' is not a directory".format(f=self.path, p=abspath))
+            return False
+
+        kwargs = {}
+
+        if ignore is not None:
+            kwargs['ignore'] = ignore
+
+        PidgenDirectoryParser(self, os.path.abspath(abspath), **kwargs)
+
+    def getIgnoreList(self, xml):
+        """
+        Return the combined 'ignore' list for a <Require> element.
+        Patterns are inherited from the settings hierarchy,
+        and can be extended with a comma-separated 'ignore' attribute.
+        """
+
+        ignore = self.getSetting("ignore")
+
+        if ignore is None:
+            ignore = []
+        elif type(ignore) is str:
+            ignore = ignore.split(",")
+        else:
+            ignore = list(ignore)
+
+        for key in xml.keys():
+            if key.lower() == 'ignore':
+                ignore += xml.get(key).split(",")
+
+        return ignore
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+
+"""
+Framing layer, configured in the protocol XML with a <Framing> element:
+
+    <Framing sync='0xEB90' id='u16' length='u16' crc='crc16-ccitt'/>
+
+Each frame then consists of:
+
+    [ sync word ][ packet ID ][ payload length ][ payload ... ][ CRC ]
+
+- sync - Sync word (hex bytes, in transmitted order), optional
+- id - Datatype of the packet ID (u8 / u16 / u32, default = u16)
+- length - Datatype of the payload length (u8 / u16 / u32, default = u16), or 'none'
+- crc - CRC (or checksum) algorithm (see crc.ALGORITHMS), or 'none' (default)
+
+The CRC covers the packet ID, length and payload (everything after the sync word).
+Header fields and the CRC use the byte order of the framing element ('endian' key, inherited from the protocol).
+
+When a corrupted frame is encountered, the stream is resynchronized by scanning for the next sync word
+(using bytes.find), rather than stepping through the stream one byte at a time.
+"""
+
+import struct
+
+from .data import PidgenDataElement as Data
+from .element import PidgenElement
+from .stream import PidgenStream
+from .crc import getAlgorithm, ALGORITHMS
+from . import debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PidgenFraming(PidgenElement):
+    """
+    Framing configuration for a protocol.
+    """
+
+    ALLOWED_KEYS = [
+        "sync",
+        "id",
+        "length",
+        "crc",
+        "endian",
+    ]
+
+    # Datatypes which can be used for header fields
+    _HEADER_TYPES = [Data.DATA_U8, Data.DATA_U16, Data.DATA_U32]
+
+    def parse(self):
+
+        self.applyEndian()
+
+    @property
+    def syncWord(self):
+        """ Return the sync word (bytes), or an empty bytes object if there is no sync word """
+
+        value = self.get("sync", None)
+
+        if value is None:
+            return b""
+
+        digits = value.strip().replace(" ", "")
+
+        if digits.lower().startswith("0x"):
+            digits = digits[2:]
+
+        if len(digits) % 2 == 1:
+            digits = "0" + digits
+
+        try:
+            return bytes.fromhex(digits)
+        except ValueError:
+            debug.error("Invalid sync word '{s}' - {f}".format(s=value, f=self.path))
+            return b""
+
+    def _headerType(self, key, default):
+
+        value = self.get(key, default)
+
+        if value.strip().lower() in ["none", ""]:
+            return None
+
+        value = value.strip().lower()
+
+        for datatype in self._HEADER_TYPES:
+            if value in Data._DATATYPE_KEYS[datatype]:
+                return datatype
+
+        debug.error("Invalid framing {k} type '{v}' - must be u8, u16 or u32 - {f}".format(k=key, v=value, f=self.path))
+
+        return default.upper()
+
+    @property
+    def idType(self):
+        """ Return the datatype of the packet ID """
+        return self._headerType("id", Data.DATA_U16) or Data.DATA_U16
+
+    @property
+    def lengthType(self):
+        """ Return the datatype of the payload length, or None if frames do not contain a length """
+        return self._headerType("length", Data.DATA_U16)
+
+    @property
+    def crc(self):
+        """ Return the CRC algorithm (PidgenCRC / PidgenChecksum), or None if frames do not contain a CRC """
+
+        name = self.get("crc", "none")
+
+        if name.strip().lower() in ["none", ""]:
+            return None
+
+        algorithm = getAlgorithm(name)
+
+        if algorithm is None:
+            debug.error("Unsupported CRC '{c}' (supported: {s}) - {f}".format(
+                c=name,
+                s=", ".join(sorted(ALGORITHMS.keys())),
+                f=self.path
+            ))
+
+        return algorithm
+
+
+class PidgenFramedStream(PidgenStream):
+    """
+    Encodes packets into frames (see PidgenFraming), and decodes frames from a (possibly corrupted) byte stream.
+
+    Attributes:
+        plans - Dict of packet ID -> codec plan
+        errors - Number of frames which could not be decoded (unknown packet ID, or incorrect length)
+        crcErrors - Number of frames which failed the CRC check
+        resyncs - Number of times the stream was resynchronized
+        discarded - Number of bytes discarded while resynchronizing
+    """
+
+    def __init__(self, packets, framing, packed=True):
+        """
+        Args:
+            packets - List of PidgenPacket objects which may appear in the stream
+            framing - PidgenFraming object
+
+        kwargs:
+            packed - Use the packed (default) or aligned packet layouts
+        """
+
+        PidgenStream.__init__(self, packets, packed=packed)
+
+        self.framing = framing
+
+        order = framing.byteOrder
+
+        id_type = framing.idType
+        length_type = framing.lengthType
+
+        self.sync = framing.syncWord
+        self.crc = framing.crc
+
+        self.hasLength = length_type is not None
+
+        fmt = order + Data._STRUCT_FORMAT[id_type]
+
+        if self.hasLength:
+            fmt += Data._STRUCT_FORMAT[length_type]
+
+        self.header = struct.Struct(fmt)
+
+        self.crcCodec = None
+
+        if self.crc is not None:
+            self.crcCodec = struct.Struct(order + {1: "B", 2: "H", 4: "I"}[self.crc.size])
+
+        # Fixed overhead of each frame (bytes)
+        self.overhead = len(self.sync) + self.header.size + (0 if self.crc is None else self.crc.size)
+
+        # Largest valid payload length (longer frames are assumed to be corrupt)
+        self.maxLength = 0
+
+        for plan in self.plans.values():
+            if plan.maxSize is None:
+                self.maxLength = (1 << (8 * struct.calcsize(Data._STRUCT_FORMAT[length_type or Data.DATA_U32]))) - 1
+                break
+
+            self.maxLength = max(self.maxLength, plan.maxSize)
+
+        self.crcErrors = 0
+        self.resyncs = 0
+        self.discarded = 0
+
+    def encode(self, packet_id, values, convert=False):
+        """
+        Encode a single frame.
+
+        Args:
+            packet_id - Numeric packet ID
+            values - Dict of field values
+
+        Return:
+            Encoded frame (bytes)
+        """
+
+        payload = self.plans[packet_id].encode(values, convert=convert)
+
+        if self.hasLength:
+            frame = self.header.pack(packet_id, len(payload)) + payload
+        else:
+            frame = self.header.pack(packet_id) + payload
+
+        if self.crc is not None:
+            frame += self.crcCodec.pack(self.crc.compute(frame))
+
+        return self.sync + frame
+
+    def _resync(self, buffer, start):
+        """
+        Return the position of the next frame after a corrupted frame at 'start'.
+        Without a sync word, the stream can only be stepped one byte at a time.
+        """
+
+        self.resyncs += 1
+
+        if self.metrics is not None:
+            self.metrics.resyncs += 1
+
+        return start + 1
+
+    def frames(self, buffer):
+        """
+        Iterate over the complete (valid) frames in a buffer.
+        Corrupted frames are skipped, by scanning for the next sync word.
+
+        Args:
+            buffer - bytes or bytearray
+
+        Yields:
+            (packet_id, plan, offset) for each frame, where offset is the start of the packet data
+
+        The number of bytes consumed is available as self.consumed once iteration stops.
+        """
+
+        sync = self.sync
+        sync_size = len(sync)
+        header = self.header
+        header_end = sync_size + header.size
+        has_length = self.hasLength
+        crc = self.crc
+        crc_size = 0 if crc is None else crc.size
+        plans = self.plans
+
+        length = len(buffer)
+        idx = 0
+
+        self.consumed = 0
+
+        while True:
+
+            if sync_size > 0:
+                start = buffer.find(sync, idx)
+
+                if start < 0:
+                    # Retain any trailing bytes which may be the start of a sync word
+                    end = max(idx, length - sync_size + 1)
+                    self.discarded += end - idx
+                    idx = end
+                    break
+
+                if start > idx:
+                    self.discarded += start - idx
+
+                idx = start
+
+            if idx + header_end > length:
+                break
+
+            if has_length:
+                packet_id, size = header.unpack_from(buffer, idx + sync_size)
+                plan = plans.get(packet_id, None)
+
+                if size > self.maxLength:
+                    idx = self._resync(buffer, idx)
+                    continue
+
+            else:
+                packet_id = header.unpack_from(buffer, idx + sync_size)[0]
+                plan = plans.get(packet_id, None)
+
+                if plan is None:
+                    # Without a length, the frame size is unknown
+                    idx = self._resync(buffer, idx)
+                    continue
+
+                size = plan.size
+
+                if size is None:
+                    size = plan.sizeOf(buffer, idx + header_end)
+
+                    if size is None:
+                        break
+
+            end = idx + header_end + size + crc_size
+
+            if end > length:
+                break
+
+            if crc is not None:
+                stored = self.crcCodec.unpack_from(buffer, end - crc_size)[0]
+
+                if crc.compute(memoryview(buffer)[idx + sync_size:end - crc_size]) != stored:
+                    self.crcErrors += 1
+
+                    if self.metrics is not None:
+                        self.metrics.crcErrors += 1
+
+                    idx = self._resync(buffer, idx)
+                    continue
+
+            if plan is None or (plan.size is not None and plan.size != size):
+                debug.warning("Invalid frame in stream - packet ID {i}, length {n}".format(i=packet_id, n=size))
+                self.countError(packet_id)
+                idx = end
+                continue
+
+            yield packet_id, plan, idx + header_end
+
+            idx = end
+
+        self.consumed = idx
+
+    def scan(self, buffer):
+        """
+        Locate the frames in a buffer (e.g. a capture file), without checking their CRC.
+        Requires a length field.
+
+        Return:
+            (starts, sizes, ids) tuple of NumPy arrays, with the start offset, total size and packet ID of each frame
+        """
+
+        if numpy is None:
+            debug.error("NumPy is required for batch frame validation")
+            return None
+
+        if not self.hasLength:
+            debug.error("Scanning frames requires a length field")
+            return None
+
+        sync = self.sync
+        sync_size = len(sync)
+        header = self.header
+        header_end = sync_size + header.size
+        overhead = self.overhead
+
+        starts = []
+        sizes = []
+        ids = []
+
+        length = len(buffer)
+        idx = 0
+
+        while True:
+
+            if sync_size > 0:
+                idx = buffer.find(sync, idx)
+
+                if idx < 0:
+                    break
+
+            if idx + header_end > length:
+                break
+
+            packet_id, size = header.unpack_from(buffer, idx + sync_size)
+
+            if size > self.maxLength or idx + overhead + size > length:
+                idx += 1
+                continue
+
+            starts.append(idx)
+            sizes.append(overhead + size)
+            ids.append(packet_id)
+
+            idx += overhead + size
+
+        return numpy.array(starts, dtype=numpy.int64), numpy.array(sizes, dtype=numpy.int64), numpy.array(ids, dtype=numpy.int64)
+
+    def validateBatch(self, buffer, starts, sizes):
+        """
+        Check the CRC of many frames at once.
+        Frames of equal size are checked together, with each CRC step applied to every frame at once.
+
+        Args:
+            buffer - Buffer containing the frames
+            starts - Array of the start offset of each frame
+            sizes - Array of the total size of each frame
+
+        Return:
+            NumPy boolean array (True for each frame with a valid CRC)
+        """
+
+        if numpy is None:
+            debug.error("NumPy is required for batch frame validation")
+            return None
+
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        sizes = numpy.asarray(sizes, dtype=numpy.int64)
+
+        if self.crc is None:
+            return numpy.ones(len(starts), dtype=bool)
+
+        data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+
+        sync_size = len(self.sync)
+        crc_size = self.crc.size
+
+        valid = numpy.zeros(len(starts), dtype=bool)
+
+        for size in numpy.unique(sizes):
+
+            selected = numpy.nonzero(sizes == size)[0]
+
+            offsets = starts[selected]
+
+            body = data[offsets[:, None] + numpy.arange(sync_size, size - crc_size)]
+
+            stored = data[offsets[:, None] + numpy.arange(size - crc_size, size)].astype(numpy.uint64)
+
+            if self.framing.byteOrder == ">":
+                stored = stored[:, ::-1]
+
+            value = numpy.zeros(len(selected), dtype=numpy.uint64)
+
+            for idx in range(crc_size):
+                value |= stored[:, idx] << numpy.uint64(8 * idx)
+
+            valid[selected] = self.crc.computeBatch(body) == value
+
+        return valid
@@ -0,0 +1,553 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact binary intermediate representation (IR) of a parsed protocol.
+
+The IR is a fully resolved model of the protocol (packets, structs, data types,
+offsets, enumerations with computed values and source locations) stored as plain
+lists / dicts, which can be written to a versioned binary file.
+
+Downstream tools can then load the IR with a single file read,
+without any XML parsing or PidgenElement construction.
+
+File format:
+    Header  - magic (8 bytes), IR version (u16), reserved (u16), payload length (u32), payload CRC32 (u32)
+    Payload - msgpack encoded model
+"""
+
+import struct
+import zlib
+
+from .version import PIDGEN_VERSION
+from .data import PidgenDataElement
+from .struct import PidgenStruct
+from .packet import PidgenPacket
+from .enumeration import PidgenEnumeration
+from . import debug
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Increment this if the structure of the IR model changes
+IR_VERSION = 6
+
+IR_MAGIC = b"PIDGENIR"
+
+_HEADER = struct.Struct("<8sHHII")
+
+
+def _pack(obj, out):
+    """
+    Encode an object into msgpack format (subset: nil, bool, int, float, str, bytes, list, dict)
+    """
+
+    if obj is None:
+        out.append(b"\xc0")
+
+    elif obj is True:
+        out.append(b"\xc3")
+
+    elif obj is False:
+        out.append(b"\xc2")
+
+    elif type(obj) is int:
+        if 0 <= obj < 0x80:
+            out.append(struct.pack("B", obj))
+        elif -32 <= obj < 0:
+            out.append(struct.pack("b", obj))
+        elif 0 <= obj <= 0xFFFFFFFF:
+            out.append(struct.pack(">BI", 0xce, obj))
+        elif 0 <= obj <= 0xFFFFFFFFFFFFFFFF:
+            out.append(struct.pack(">BQ", 0xcf, obj))
+        elif -0x80000000 <= obj < 0:
+            out.append(struct.pack(">Bi", 0xd2, obj))
+        else:
+            out.append(struct.pack(">Bq", 0xd3, obj))
+
+    elif type(obj) is float:
+        out.append(struct.pack(">Bd", 0xcb, obj))
+
+    elif type(obj) is str:
+        data = obj.encode("utf-8")
+        n = len(data)
+
+        if n < 32:
+            out.append(struct.pack("B", 0xa0 | n))
+        elif n < 0x100:
+            out.append(struct.pack(">BB", 0xd9, n))
+        elif n < 0x10000:
+            out.append(struct.pack(">BH", 0xda, n))
+        else:
+            out.append(struct.pack(">BI", 0xdb, n))
+
+        out.append(data)
+
+    elif type(obj) is bytes:
+        n = len(obj)
+
+        if n < 0x100:
+            out.append(struct.pack(">BB", 0xc4, n))
+        elif n < 0x10000:
+            out.append(struct.pack(">BH", 0xc5, n))
+        else:
+            out.append(struct.pack(">BI", 0xc6, n))
+
+        out.append(obj)
+
+    elif type(obj) in [list, tuple]:
+        n = len(obj)
+
+        if n < 16:
+            out.append(struct.pack("B", 0x90 | n))
+        elif n < 0x10000:
+            out.append(struct.pack(">BH", 0xdc, n))
+        else:
+            out.append(struct.pack(">BI", 0xdd, n))
+
+        for item in obj:
+            _pack(item, out)
+
+    elif type(obj) is dict:
+        n = len(obj)
+
+        if n < 16:
+            out.append(struct.pack("B", 0x80 | n))
+        elif n < 0x10000:
+            out.append(struct.pack(">BH", 0xde, n))
+        else:
+            out.append(struct.pack(">BI", 0xdf, n))
+
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+
+    else:
+        raise TypeError("Cannot encode type '{t}' in IR".format(t=type(obj).__name__))
+
+
+# Fixed-size msgpack types: code -> (struct format, size)
+_FIXED = {
+    0xca: (">f", 4),
+    0xcb: (">d", 8),
+    0xcc: (">B", 1),
+    0xcd: (">H", 2),
+    0xce: (">I", 4),
+    0xcf: (">Q", 8),
+    0xd0: (">b", 1),
+    0xd1: (">h", 2),
+    0xd2: (">i", 4),
+    0xd3: (">q", 8),
+}
+
+# Length prefix for variable-size msgpack types: code -> (struct format, size)
+_LENGTH = {
+    0xc4: (">B", 1), 0xc5: (">H", 2), 0xc6: (">I", 4),  # bin
+    0xd9: (">B", 1), 0xda: (">H", 2), 0xdb: (">I", 4),  # str
+    0xdc: (">H", 2), 0xdd: (">I", 4),  # array
+    0xde: (">H", 2), 0xdf: (">I", 4),  # map
+}
+
+
+def _unpack(data, idx):
+    """
+    Decode a single msgpack object from the buffer, starting at the given index.
+
+    Return:
+        (object, next_index)
+    """
+
+    code = data[idx]
+    idx += 1
+
+    if code < 0x80:
+        return code, idx
+
+    if code >= 0xe0:
+        return code - 0x100, idx
+
+    if code in _FIXED:
+        fmt, size = _FIXED[code]
+        return struct.unpack_from(fmt, data, idx)[0], idx + size
+
+    if code == 0xc0:
+        return None, idx
+    if code == 0xc2:
+        return False, idx
+    if code == 0xc3:
+        return True, idx
+
+    if 0xa0 <= code <= 0xbf:
+        n = code & 0x1f
+        kind = "str"
+    elif 0x90 <= code <= 0x9f:
+        n = code & 0x0f
+        kind = "array"
+    elif 0x80 <= code <= 0x8f:
+        n = code & 0x0f
+        kind = "map"
+    elif code in _LENGTH:
+        fmt, size = _LENGTH[code]
+        n = struct.unpack_from(fmt, data, idx)[0]
+        idx += size
+
+        if code <= 0xc6:
+            kind = "bin"
+        elif code <= 0xdb:
+            kind = "str"
+        elif code <= 0xdd:
+            kind = "array"
+        else:
+            kind = "map"
+    else:
+        raise ValueError("Invalid IR data code 0x{c:02X}".format(c=code))
+
+    if kind == "str":
+        return str(data[idx:idx + n], "utf-8"), idx + n
+
+    if kind == "bin":
+        return bytes(data[idx:idx + n]), idx + n
+
+    if kind == "array":
+        items = []
+
+        for _ in range(n):
+            item, idx = _unpack(data, idx)
+            items.append(item)
+
+        return items, idx
+
+    result = {}
+
+    for _ in range(n):
+        key, idx = _unpack(data, idx)
+        value, idx = _unpack(data, idx)
+        result[key] = value
+
+    return result, idx
+
+
+def packIR(model):
+    """ Encode an IR model into a msgpack byte string """
+
+    if msgpack is not None:
+        return msgpack.packb(model, use_bin_type=True)
+
+    out = []
+    _pack(model, out)
+
+    return b"".join(out)
+
+
+def unpackIR(data):
+    """ Decode an IR model from a msgpack byte string """
+
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    model, idx = _unpack(memoryview(data), 0)
+
+    return model
+
+
+class PidgenIR():
+    """
+    The PidgenIR class is a lightweight wrapper around a (decoded) IR model.
+
+    Attributes:
+        model - The underlying model (plain lists / dicts)
+    """
+
+    def __init__(self, model):
+
+        self.model = model
+
+        # Name lookup tables (case-insensitive)
+        self._lookup = {}
+
+        for key in ["packets", "structs", "enumerations"]:
+            for item in model.get(key, []):
+                self._lookup.setdefault(key, {})[item["name"].lower()] = item
+
+    @property
+    def name(self):
+        return self.model["protocol"]["name"]
+
+    @property
+    def version(self):
+        return self.model["protocol"]["version"]
+
+    @property
+    def files(self):
+        return self.model["files"]
+
+    @property
+    def packets(self):
+        return self.model["packets"]
+
+    @property
+    def structs(self):
+        return self.model["structs"]
+
+    @property
+    def enumerations(self):
+        return self.model["enumerations"]
+
+    def find(self, kind, name):
+        """
+        Lookup an item in the IR by name.
+
+        Args:
+            kind - 'packets', 'structs' or 'enumerations'
+            name - Name of the item (case-insensitive)
+        """
+
+        return self._lookup.get(kind, {}).get(name.lower(), None)
+
+    def source(self, item):
+        """ Return the (filename, line) source location for an item in the IR """
+
+        idx, line = item["source"]
+
+        return self.files[idx], line
+
+    def save(self, filename):
+        """ Write the IR to a binary file """
+
+        payload = packIR(self.model)
+
+        header = _HEADER.pack(IR_MAGIC, IR_VERSION, 0, len(payload), zlib.crc32(payload) & 0xFFFFFFFF)
+
+        with open(filename, "wb") as ir_file:
+            ir_file.write(header + payload)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load an IR from a binary file (with a single read).
+
+        Return:
+            PidgenIR object, or None if the file is not a valid IR file
+        """
+
+        with open(filename, "rb") as ir_file:
+            data = ir_file.read()
+
+        if len(data) < _HEADER.size:
+            debug.error("IR file '{f}' is truncated".format(f=filename))
+            return None
+
+        magic, version, _, length, crc = _HEADER.unpack_from(data, 0)
+
+        if magic != IR_MAGIC:
+            debug.error("File '{f}' is not a Pidgen IR file".format(f=filename))
+            return None
+
+        if version != IR_VERSION:
+            debug.error("IR file '{f}' has version {v} (expected {e})".format(f=filename, v=version, e=IR_VERSION))
+            return None
+
+        payload = memoryview(data)[_HEADER.size:_HEADER.size + length]
+
+        if len(payload) != length or zlib.crc32(payload) & 0xFFFFFFFF != crc:
+            debug.error("IR file '{f}' is corrupt".format(f=filename))
+            return None
+
+        return cls(unpackIR(payload))
+
+
+class _IRBuilder():
+    """
+    Walks a parsed protocol and constructs the IR model.
+    """
+
+    def __init__(self, protocol):
+
+        self.protocol = protocol
+
+        # Map of file paths to indices in the 'files' table
+        self.files = {}
+
+    def source(self, element):
+        """ Return a compact [file index, line] source location for an element """
+
+        path = element.path
+
+        if path not in self.files:
+            self.files[path] = len(self.files)
+
+        return [self.files[path], element.lineNumber]
+
+    def enumeration(self, enum):
+
+        values = []
+
+        for item, value in enum.computedValues:
+            values.append({
+                "name": item.name,
+                "title": item.enum_title,
+                "value": value,
+                "comment": item.comment,
+            })
+
+        return {
+            "name": enum.name,
+            "prefix": enum.prefix,
+            "suffix": enum.suffix,
+            "private": enum.isPrivate(),
+            "comment": enum.comment,
+            "source": self.source(enum),
+            "values": values,
+        }
+
+    def field(self, field):
+        """
+        Construct the IR for a single field, from its layout.
+        """
+
+        element = field.element
+
+        result = {
+            "name": field.name,
+            "offset": field.offset,
+            "size": field.size,
+            "count": field.count if field.isArray else None,
+            "padding": field.padding,
+            "bits": field.bits,
+            "bitOffset": field.bitOffset if field.isBitfield else None,
+            "comment": element.comment,
+            "source": self.source(element),
+        }
+
+        if field.isStruct and not isinstance(element, PidgenDataElement):
+            # Nested struct definition
+            result["kind"] = "struct"
+            result["fields"] = [self.field(f) for f in field.layout.fields]
+            return result
+
+        if field.isStruct:
+            # Reference to another struct
+            result["kind"] = "struct"
+            result["struct"] = field.layout.struct.name
+            datatype = None
+        else:
+            result["kind"] = "data"
+            datatype = element.datatype
+
+        result.update({
+            "datatype": datatype,
+            "encoding": field.encoding,
+            "scaler": element.get("scaler"),
+            "units": element.units,
+            "minimum": element.minValue,
+            "maximum": element.maxValue,
+            "initial": element.initialValue,
+            "default": element.get(["default", "defaultvalue"]),
+            "dependsOn": element.dependsOn,
+            "string": None,
+        })
+
+        if field.encoding == PidgenDataElement.DATA_STR:
+            result["string"] = {
+                "length": element.stringLength,
+                "lengthPrefix": element.stringPrefix,
+                "charset": element.charset,
+            }
+
+        return result
+
+    def struct(self, struct):
+        """
+        Construct the IR for a struct (or packet).
+        Offsets are computed for the packed (on-the-wire) encoding.
+        """
+
+        layout = struct.layout()
+
+        result = {
+            "name": struct.name,
+            "title": struct.title,
+            "comment": struct.comment,
+            "size": layout.size,
+            "endian": "big" if struct.byteOrder == ">" else "little",
+            "source": self.source(struct),
+            "fields": [self.field(f) for f in layout.fields],
+        }
+
+        if isinstance(struct, PidgenPacket):
+            result["id"] = struct.packetId
+
+        return result
+
+    def build(self):
+
+        protocol = self.protocol
+
+        # Lazily loaded protocols must be completely loaded
+        protocol.loadAll()
+
+        self.source(protocol)
+
+        structs = []
+        packets = []
+
+        for struct in protocol.getChildren(PidgenStruct, traverse_children=True):
+
+            # Nested structs are described within their parent
+            if isinstance(struct.parent, PidgenStruct):
+                continue
+
+            if isinstance(struct, PidgenPacket):
+                packets.append(self.struct(struct))
+            else:
+                structs.append(self.struct(struct))
+
+        enumerations = [self.enumeration(e) for e in protocol.getChildren(PidgenEnumeration, traverse_children=True)]
+
+        files = [None] * len(self.files)
+
+        for path, idx in self.files.items():
+            files[idx] = path
+
+        return {
+            "generator": "pidgen-{v}".format(v=PIDGEN_VERSION),
+            "protocol": {
+                "name": protocol.name,
+                "version": protocol.version,
+            },
+            "files": files,
+            "packets": packets,
+            "structs": structs,
+            "enumerations": enumerations,
+        }
+
+
+def buildIR(protocol):
+    """
+    Construct the IR for a parsed protocol.
+
+    Args:
+        protocol - PidgenProtocolParser object
+
+    Return:
+        PidgenIR object
+    """
+
+    return PidgenIR(_IRBuilder(protocol).build())
+
+
+def exportIR(protocol, filename):
+    """ Construct the IR for a parsed protocol, and write it to a binary file """
+
+    ir = buildIR(protocol)
+    ir.save(filename)
+
+    return ir
+
+
+def importIR(filename):
+    """ Load a protocol IR from a binary file """
+
+    return PidgenIR.load(filename)
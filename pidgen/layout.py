@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+"""
+Struct layout engine.
+
+Computes the byte offset, size, alignment and padding of every field in a struct
+(or packet), for either a packed or a naturally aligned encoding.
+
+Layouts are computed from the "on the wire" encoding of each data element.
+"""
+
+from .data import PidgenDataElement
+from . import debug
+
+
+class PidgenFieldLayout():
+    """
+    Layout of a single field within a struct.
+
+    Attributes:
+        name - Name of the field
+        element - The PidgenDataElement (or nested PidgenStruct) which defines this field
+        offset - Byte offset of the field from the start of the struct (None if not fixed)
+        itemSize - Size (bytes) of a single item (None for variable-length items)
+        count - Number of items (1, unless this is an array field)
+        array - True if this is an array field
+        alignment - Alignment (bytes) of this field
+        padding - Number of padding bytes inserted before this field
+        encoding - Encoded datatype of the field (None for struct fields)
+        layout - PidgenStructLayout of the field, for struct fields (None otherwise)
+        conditional - True if the presence of this field depends on another field (the 'dependsOn' key)
+        bits - Number of bits, for a bitfield (None otherwise)
+        bitOffset - Position (bits, from the least significant bit) of a bitfield within its storage word
+
+    Bitfields which share a storage word have the same offset (and itemSize is the size of the storage word).
+    """
+
+    def __init__(self, name, element, itemSize, count=1, array=False, alignment=1, encoding=None, layout=None, conditional=False, bits=None):
+
+        self.name = name
+        self.element = element
+        self.itemSize = itemSize
+        self.count = count
+        self.array = array
+        self.alignment = alignment
+        self.encoding = encoding
+        self.layout = layout
+        self.conditional = conditional
+        self.bits = bits
+
+        self.offset = None
+        self.padding = 0
+        self.bitOffset = 0
+
+    def __repr__(self):
+        return "<{name} offset={o} size={s}>".format(name=self.name, o=self.offset, s=self.size)
+
+    @property
+    def size(self):
+        """ Total size (bytes) of this field, or None if the field does not have a fixed size """
+
+        if self.itemSize is None:
+            return None
+
+        return self.itemSize * self.count
+
+    @property
+    def isArray(self):
+        return self.array
+
+    @property
+    def isStruct(self):
+        return self.layout is not None
+
+    @property
+    def isBitfield(self):
+        return self.bits is not None
+
+    def sharesWord(self, field):
+        """ Return True if a bitfield can be packed into the same storage word as this (bitfield) field """
+
+        if not self.isBitfield or not field.isBitfield or self.conditional or field.conditional:
+            return False
+
+        if self.offset is None or self.itemSize != field.itemSize:
+            return False
+
+        return self.bitOffset + self.bits + field.bits <= self.itemSize * 8
+
+
+class PidgenStructLayout():
+    """
+    Layout of a struct (or packet).
+
+    Attributes:
+        struct - The PidgenStruct object described by this layout
+        packed - True if the layout is packed (no alignment padding)
+        fields - Ordered list of PidgenFieldLayout objects
+        size - Total encoded size (bytes), or None if the struct does not have a fixed size
+        alignment - Alignment of the struct (largest alignment of any field)
+        padding - Number of trailing padding bytes
+        conditional - True if any field is conditional (in which case the size is not fixed)
+    """
+
+    def __init__(self, struct, packed=True):
+
+        self.struct = struct
+        self.packed = packed
+        self.fields = []
+        self.size = 0
+        self.alignment = 1
+        self.padding = 0
+        self.conditional = False
+
+        # List of (struct, layout version) pairs which this layout depends on
+        self.dependencies = []
+
+    def __repr__(self):
+        return "<Layout '{name}' ({mode}) size={s}>".format(
+            name=self.struct.name,
+            mode="packed" if self.packed else "aligned",
+            s=self.size
+        )
+
+    @property
+    def isFixed(self):
+        """ Return True if this struct has a fixed size """
+        return self.size is not None
+
+    def isValid(self):
+        """ Return True if none of the structs this layout depends on have changed """
+
+        for struct, version in self.dependencies:
+            if struct.layoutVersion != version:
+                return False
+
+        return True
+
+    def field(self, name):
+        """ Return the layout of the named field (case-insensitive), or None """
+
+        name = name.lower()
+
+        for f in self.fields:
+            if f.name.lower() == name:
+                return f
+
+        return None
+
+    def addField(self, field):
+        """
+        Append a field to the layout, inserting alignment padding as required.
+        A bitfield is packed into the storage word of the previous field, if it fits.
+        """
+
+        field.bitOffset = 0
+
+        if len(self.fields) > 0 and self.fields[-1].sharesWord(field):
+            previous = self.fields[-1]
+
+            field.offset = previous.offset
+            field.padding = 0
+            field.bitOffset = previous.bitOffset + previous.bits
+
+            self.fields.append(field)
+            return
+
+        if not self.packed:
+            self.alignment = max(self.alignment, field.alignment)
+
+        if self.size is not None:
+            if not self.packed:
+                field.padding = (-self.size) % field.alignment
+
+            field.offset = self.size + field.padding
+
+            if field.size is None or field.conditional:
+                self.size = None
+            else:
+                self.size = field.offset + field.size
+
+        if field.conditional:
+            self.conditional = True
+
+        self.fields.append(field)
+
+    def finish(self):
+        """
+        Add any trailing padding, so that the size of the struct is a multiple of its alignment.
+        """
+
+        if self.size is not None and not self.packed:
+            self.padding = (-self.size) % self.alignment
+            self.size += self.padding
+
+
+def computeLayout(struct, packed=True, stack=None):
+    """
+    Compute the layout of a struct.
+    Use PidgenStruct.layout() rather than calling this directly, so that the result is cached.
+
+    Args:
+        struct - PidgenStruct (or PidgenPacket) object
+
+    kwargs:
+        packed - If True, fields are packed with no padding.
+                 Otherwise, each field is naturally aligned.
+        stack - List of structs currently being laid out (used to detect circular references)
+
+    Return:
+        PidgenStructLayout object
+    """
+
+    if stack is None:
+        stack = []
+
+    layout = PidgenStructLayout(struct, packed=packed)
+    layout.dependencies.append((struct, struct.layoutVersion))
+
+    stack = stack + [struct]
+
+    for child in struct.children:
+
+        if isinstance(child, PidgenDataElement):
+            field = _dataLayout(child, packed, stack)
+        elif hasattr(child, "layoutVersion"):
+            # Nested struct definition
+            sub = child.layout(packed=packed, stack=stack)
+            field = _structField(child.name, child, sub)
+        else:
+            continue
+
+        if field is None:
+            continue
+
+        if isinstance(child, PidgenDataElement) and child.dependency is not None:
+            field.conditional = True
+
+        if field.layout is not None:
+            layout.dependencies += field.layout.dependencies
+
+        layout.addField(field)
+
+    layout.finish()
+
+    return layout
+
+
+def _structField(name, element, sub, count=None):
+    """ Construct a field which contains a struct """
+
+    return PidgenFieldLayout(
+        name,
+        element,
+        sub.size,
+        count=count if count is not None else 1,
+        array=count is not None,
+        alignment=sub.alignment,
+        layout=sub
+    )
+
+
+def _dataLayout(data, packed, stack):
+    """ Construct the layout of a single data element """
+
+    count = data.arraySize
+
+    # Data element which refers to another struct
+    if data.structName is not None:
+
+        ref = data.referencedStruct
+
+        if ref is None:
+            return None
+
+        if ref in stack:
+            debug.error("Circular struct reference '{s}' in '{name}' - {f}".format(
+                s=data.structName,
+                name=data.name,
+                f=data.path
+            ))
+
+            return None
+
+        sub = ref.layout(packed=packed, stack=stack)
+
+        return _structField(data.name, data, sub, count=count)
+
+    encoding = data.encoding
+
+    # Fixed-capacity strings have a fixed width, length-prefixed strings do not
+    width = data.encodedWidth
+
+    if width is None:
+        size = None
+        alignment = 1
+    else:
+        size = width // 8
+        alignment = 1 if encoding == PidgenDataElement.DATA_STR else size
+
+    bits = data.bitWidth
+
+    if bits is not None and count is not None:
+        debug.error("Bitfield '{name}' cannot be an array - {f}".format(
+            name=data.name,
+            f=data.path
+        ))
+
+        bits = None
+
+    return PidgenFieldLayout(
+        data.name,
+        data,
+        size,
+        count=count if count is not None else 1,
+        array=count is not None,
+        alignment=alignment,
+        encoding=encoding,
+        bits=bits
+    )
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""
+Link pass, which resolves the cross-references between protocol elements.
+
+References which are resolved:
+- <Data struct='...'> - Name of a struct
+- <Data dependsOn='...'> - Name of another data element in the same struct (or an enclosing struct)
+- <Packet id='...'> - Name of an enumeration value (unless the id is a number)
+
+Every reference is resolved in a single sweep of the element tree,
+against a symbol index which is built up-front (rather than searching the tree for each name).
+The resolved target objects are recorded against the elements (e.g. PidgenDataElement.structTarget).
+
+Any references which cannot be resolved are reported together (as a single error),
+with a "did-you-mean" suggestion for each.
+"""
+
+from rapidfuzz import fuzz, process
+
+from . import debug
+
+
+# Minimum score for a "did-you-mean" suggestion
+SUGGESTION_SCORE = 65
+
+
+class PidgenSymbolIndex():
+    """
+    Index of every named definition in a protocol.
+
+    Symbols are stored (by lower-case name) for each kind of definition:
+    - struct - PidgenStruct objects (not including packets)
+    - packet - PidgenPacket objects
+    - enumeration - PidgenEnumeration objects
+    - value - PidgenEnumerationValue objects (by both the rendered title and the plain name)
+    """
+
+    KINDS = ["struct", "packet", "enumeration", "value"]
+
+    def __init__(self, protocol):
+
+        self.symbols = dict((kind, {}) for kind in self.KINDS)
+
+        for element in protocol.getDescendants([]):
+            element.indexSymbols(self)
+
+    def add(self, kind, name, element):
+        """ Add a named element to the index """
+
+        if name is None:
+            return
+
+        elements = self.symbols[kind].setdefault(name.lower(), [])
+
+        if element not in elements:
+            elements.append(element)
+
+    def lookup(self, kind, name):
+        """
+        Return a list of the elements of the given kind which match the name (case-insensitive)
+        """
+
+        return self.symbols[kind].get(name.lower(), [])
+
+    def names(self, kind):
+        """ Return the (lower-case) names of all symbols of the given kind """
+
+        return list(self.symbols[kind].keys())
+
+
+class PidgenLinker():
+    """
+    Resolves the references of every element in a protocol against a symbol index.
+
+    Attributes:
+        index - PidgenSymbolIndex for the protocol
+        unresolved - List of (element, key, name, choices) for each reference which could not be resolved
+        ambiguous - List of (element, key, name, matches) for each reference which matched multiple symbols
+    """
+
+    def __init__(self, protocol):
+
+        self.protocol = protocol
+
+        self.index = PidgenSymbolIndex(protocol)
+
+        self.unresolved = []
+        self.ambiguous = []
+
+    def link(self):
+        """
+        Resolve every reference in the protocol.
+
+        Return:
+            List of unresolved references
+        """
+
+        for element in self.protocol.getDescendants([]):
+            element.link(self)
+
+        self.report()
+
+        return self.unresolved
+
+    def resolve(self, element, key, kind, name):
+        """
+        Resolve a reference to a named symbol.
+
+        Args:
+            element - The element which makes the reference
+            key - The key which contains the reference (e.g. 'struct')
+            kind - Kind of symbol which is referenced (see PidgenSymbolIndex.KINDS)
+            name - Name of the referenced symbol
+
+        Return:
+            The referenced object, or None if it could not be resolved
+        """
+
+        matches = self.index.lookup(kind, name)
+
+        if len(matches) == 1:
+            return matches[0]
+
+        if len(matches) > 1:
+            # Enumeration values may share a plain name, as long as they have the same value
+            if kind == "value" and len(set(match.value for match in matches)) == 1:
+                return matches[0]
+
+            self.ambiguous.append((element, key, name, matches))
+        else:
+            self.unresolved.append((element, key, name, self.index.names(kind)))
+
+        return None
+
+    def missing(self, element, key, name, choices):
+        """
+        Record a reference which could not be resolved (outside of the symbol index).
+
+        Args:
+            choices - Names which would have been valid (for suggestions)
+        """
+
+        self.unresolved.append((element, key, name, choices))
+
+    def suggestions(self):
+        """
+        Compute a "did-you-mean" suggestion for each unresolved reference.
+
+        Return:
+            List of suggested names (or None), matching the order of self.unresolved
+        """
+
+        result = []
+
+        for element, key, name, choices in self.unresolved:
+
+            match = None
+
+            if len(choices) > 0:
+                match = process.extractOne(name.lower(), choices, scorer=fuzz.partial_ratio, score_cutoff=SUGGESTION_SCORE)
+
+            result.append(match[0] if match is not None else None)
+
+        return result
+
+    def report(self):
+        """
+        Report any unresolved (or ambiguous) references, as a single error.
+        """
+
+        if len(self.unresolved) == 0 and len(self.ambiguous) == 0:
+            return
+
+        lines = ["{n} unresolved references:".format(n=len(self.unresolved) + len(self.ambiguous))]
+
+        for (element, key, name, choices), suggestion in zip(self.unresolved, self.suggestions()):
+
+            line = "    {f}:{line} - <{t}> '{e}' : {k}='{n}' not found".format(
+                f=element.path,
+                line=element.lineNumber,
+                t=element.tag,
+                e=element.name,
+                k=key,
+                n=name
+            )
+
+            if suggestion is not None:
+                line += " (did you mean '{s}'?)".format(s=suggestion)
+
+            lines.append(line)
+
+        for element, key, name, matches in self.ambiguous:
+            lines.append("    {f}:{line} - <{t}> '{e}' : {k}='{n}' is ambiguous ({m} matches)".format(
+                f=element.path,
+                line=element.lineNumber,
+                t=element.tag,
+                e=element.name,
+                k=key,
+                n=name,
+                m=len(matches)
+            ))
+
+        debug.error("\n".join(lines))
+
+
+def linkProtocol(protocol):
+    """
+    Resolve every reference in a protocol.
+    Use PidgenProtocolParser.link() rather than calling this directly.
+
+    Return:
+        PidgenLinker object (containing the symbol index, and any unresolved references)
+    """
+
+    linker = PidgenLinker(protocol)
+    linker.link()
+
+    return linker
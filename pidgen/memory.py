@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Memory usage reporting.
+
+The total memory allocated while parsing a protocol is measured with tracemalloc.
+
+The breakdown by element type is an estimate, rather than a tracemalloc measurement.
+It is calculated by walking the element tree and summing the shallow size (sys.getsizeof)
+of the objects owned by each element:
+
+- The element object itself (and its attribute dict)
+- The stored kwargs dict and children list
+- The XML node (and its attributes) associated with the element
+- Any other containers / strings directly referenced by the element
+
+Objects which are shared between elements (e.g. interned strings) are only counted once.
+Anything else which is allocated while parsing (e.g. caches, or objects nested more deeply) is not
+attributed to an element type, so the total of the breakdown is lower than the traced memory.
+"""
+
+import sys
+import tracemalloc
+
+from .xmlparser import CompactElement
+
+
+def trace(function, *args, **kwargs):
+    """
+    Call a function, and measure the memory allocated while it runs.
+
+    Return:
+        (result, current, peak) tuple, where current and peak are the traced sizes (bytes)
+    """
+
+    was_tracing = tracemalloc.is_tracing()
+
+    if not was_tracing:
+        tracemalloc.start()
+
+    tracemalloc.clear_traces()
+
+    try:
+        result = function(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return result, current, peak
+
+
+def _sizeOf(obj, seen):
+    """ Return the size of an object (if it has not already been counted) """
+
+    if obj is None or id(obj) in seen:
+        return 0
+
+    seen.add(id(obj))
+
+    return sys.getsizeof(obj)
+
+
+def _xmlSize(node, seen):
+    """ Return the size of an XML node (excluding any child nodes) """
+
+    size = _sizeOf(node, seen)
+
+    if node is None or isinstance(node, CompactElement):
+        attrib = getattr(node, "attrib", None)
+    else:
+        attrib = node.attrib
+
+        # Text content is retained by the full XML tree
+        size += _sizeOf(node.text, seen)
+        size += _sizeOf(node.tail, seen)
+
+    if attrib is not None:
+        size += _sizeOf(attrib, seen)
+
+        for key, value in attrib.items():
+            size += _sizeOf(key, seen)
+            size += _sizeOf(value, seen)
+
+    return size
+
+
+def elementSize(element, seen):
+    """
+    Return the memory (bytes) owned by a single element.
+
+    Args:
+        element - PidgenElement object
+        seen - Set of object IDs which have already been counted
+    """
+
+    size = _sizeOf(element, seen)
+
+    attributes = getattr(element, "__dict__", {})
+
+    size += _sizeOf(attributes, seen)
+
+    for name, value in attributes.items():
+
+        if name == "parent":
+            # The parent is counted separately
+            continue
+
+        if name == "xml":
+            size += _xmlSize(value, seen)
+            continue
+
+        if type(value) not in [str, bytes, list, tuple, dict, set]:
+            continue
+
+        # Containers are counted, but not their contents (e.g. the list of children)
+        size += _sizeOf(value, seen)
+
+        if name == "kwargs":
+            for key, item in value.items():
+                size += _sizeOf(key, seen)
+
+                if key == "xml":
+                    size += _xmlSize(item, seen)
+                elif type(item) in [str, bytes]:
+                    size += _sizeOf(item, seen)
+
+    return size
+
+
+def measure(protocol):
+    """
+    Estimate the memory used by each type of element in a protocol
+    (the shallow size of the objects owned by each element, see elementSize).
+
+    Return:
+        Dict of element type -> {'count': elements, 'bytes': total size}
+    """
+
+    seen = set()
+
+    stats = {}
+
+    for element in [protocol] + protocol.getDescendants([]):
+
+        name = element.__class__.__name__
+
+        entry = stats.setdefault(name, {'count': 0, 'bytes': 0})
+
+        entry['count'] += 1
+        entry['bytes'] += elementSize(element, seen)
+
+    return stats
+
+
+def report(stats, current=None, peak=None):
+    """
+    Format memory statistics as a human-readable report.
+
+    Args:
+        stats - Statistics returned by measure()
+
+    kwargs:
+        current - Traced memory retained after parsing (bytes)
+        peak - Peak traced memory during parsing (bytes)
+
+    Return:
+        Report text (string)
+    """
+
+    lines = [
+        "{t:<32}{c:>10}{b:>14}{e:>14}".format(t="Memory (by type, estimated)", c="Count", b="Bytes", e="Per element"),
+    ]
+
+    for name, entry in sorted(stats.items(), key=lambda item: item[1]['bytes'], reverse=True):
+        lines.append("{n:<32}{c:>10}{b:>14}{e:>14.0f}".format(
+            n=name,
+            c=entry['count'],
+            b=entry['bytes'],
+            e=entry['bytes'] / entry['count']
+        ))
+
+    total = sum(entry['bytes'] for entry in stats.values())
+
+    lines.append("{n:<32}{c:>10}{b:>14}".format(
+        n="total",
+        c=sum(entry['count'] for entry in stats.values()),
+        b=total
+    ))
+
+    lines.append("")
+    lines.append("Sizes by type are estimated from the shallow size (sys.getsizeof) of the objects owned by each element")
+
+    if current is not None:
+        lines.append("")
+        lines.append("Traced memory (retained) : {n:.1f} kB".format(n=current / 1024.0))
+        lines.append("Not attributed to a type : {n:.1f} kB".format(n=max(0, current - total) / 1024.0))
+
+    if peak is not None:
+        lines.append("Traced memory (peak)     : {n:.1f} kB".format(n=peak / 1024.0))
+
+    return "\n".join(lines)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runtime throughput counters for decoded packets.
+
+Metrics are disabled by default. Once enabled for a stream (see PidgenStream.enableMetrics),
+each packet type is assigned a slot, and the following counters are recorded for each slot:
+
+- frames - Number of packets decoded
+- bytes - Number of packet data bytes decoded
+- decodeErrors - Number of packets which could not be decoded
+- validationFailures - Number of decoded packets which violate their field limits
+- decodeTime - Total decode time, and a histogram of decode times
+
+Frames which cannot be assigned to a slot are counted for the stream as a whole
+(unknown packet IDs, and for framed streams, CRC failures and resynchronizations).
+
+Every counter is stored in an array which is preallocated when the metrics are enabled,
+so recording a packet is a handful of integer increments (no allocation or dict lookups).
+
+Decode times are measured in nanoseconds, and the histogram buckets are powers of two:
+bucket k counts decode times below 2**k ns (and at least 2**(k-1) ns).
+
+Snapshots are available as a dict (snapshot()), or in the Prometheus text format (prometheus()),
+which can be written to a file for the node exporter 'textfile' collector (writePrometheus()).
+"""
+
+import array
+import os
+
+
+class PidgenMetrics():
+    """
+    Per-packet-type counters, indexed by dispatch slot.
+
+    Attributes:
+        ids - Packet ID for each slot
+        names - Packet name for each slot
+        frames - Array of the number of packets decoded, for each slot
+        bytes - Array of the number of bytes decoded, for each slot
+        decodeErrors - Array of the number of decoding errors, for each slot
+        validationFailures - Array of the number of validation failures, for each slot
+        decodeTime - Array of the total decode time (ns), for each slot
+        histogram - Array of decode time histogram counts (BUCKETS entries for each slot)
+        unknown - Number of frames with an unknown packet ID (which cannot be assigned to a slot)
+        crcErrors - Number of frames which failed the CRC check (framed streams only)
+        resyncs - Number of times the stream was resynchronized (framed streams only)
+    """
+
+    # Number of histogram buckets (the last bucket counts every decode time of 2**(BUCKETS - 2) ns or longer)
+    BUCKETS = 32
+
+    def __init__(self, ids, names):
+        """
+        Args:
+            ids - List of packet IDs (in slot order)
+            names - List of packet names (in slot order)
+        """
+
+        self.ids = list(ids)
+        self.names = list(names)
+
+        count = len(self.ids)
+
+        self.frames = array.array("Q", bytes(8 * count))
+        self.bytes = array.array("Q", bytes(8 * count))
+        self.decodeErrors = array.array("Q", bytes(8 * count))
+        self.validationFailures = array.array("Q", bytes(8 * count))
+        self.decodeTime = array.array("Q", bytes(8 * count))
+        self.histogram = array.array("Q", bytes(8 * count * self.BUCKETS))
+
+        self.unknown = 0
+        self.crcErrors = 0
+        self.resyncs = 0
+
+        # Upper bound (seconds) of each histogram bucket (None for the last bucket)
+        self.bounds = [(1 << k) * 1e-9 for k in range(self.BUCKETS - 1)] + [None]
+
+    def __repr__(self):
+        return "<Metrics ({n} packet types, {f} frames)>".format(n=len(self.ids), f=sum(self.frames))
+
+    def record(self, slot, size, elapsed):
+        """
+        Record a decoded packet.
+
+        Args:
+            slot - Dispatch slot of the packet type
+            size - Size (bytes) of the packet data
+            elapsed - Decode time (ns)
+        """
+
+        self.frames[slot] += 1
+        self.bytes[slot] += size
+        self.decodeTime[slot] += elapsed
+
+        bucket = elapsed.bit_length()
+
+        if bucket >= self.BUCKETS:
+            bucket = self.BUCKETS - 1
+
+        self.histogram[slot * self.BUCKETS + bucket] += 1
+
+    def reset(self):
+        """ Zero every counter """
+
+        for counter in [self.frames, self.bytes, self.decodeErrors, self.validationFailures, self.decodeTime, self.histogram]:
+            for idx in range(len(counter)):
+                counter[idx] = 0
+
+        self.unknown = 0
+        self.crcErrors = 0
+        self.resyncs = 0
+
+    def buckets(self, slot):
+        """ Return the (non-cumulative) histogram counts for a slot """
+
+        start = slot * self.BUCKETS
+
+        return list(self.histogram[start:start + self.BUCKETS])
+
+    def snapshot(self):
+        """
+        Return a snapshot of every counter.
+
+        Return:
+            Dict of packet name -> dict of counters.
+            The 'histogram' of each packet is a list of (upper bound (seconds), count) for each non-empty bucket,
+            where the upper bound of the last bucket is None.
+        """
+
+        packets = {}
+
+        for slot, name in enumerate(self.names):
+
+            histogram = [(bound, count) for bound, count in zip(self.bounds, self.buckets(slot)) if count > 0]
+
+            packets[name] = {
+                "id": self.ids[slot],
+                "frames": self.frames[slot],
+                "bytes": self.bytes[slot],
+                "decodeErrors": self.decodeErrors[slot],
+                "validationFailures": self.validationFailures[slot],
+                "decodeTime": self.decodeTime[slot] * 1e-9,
+                "histogram": histogram,
+            }
+
+        return {
+            "packets": packets,
+            "unknown": self.unknown,
+            "crcErrors": self.crcErrors,
+            "resyncs": self.resyncs,
+        }
+
+    def prometheus(self, prefix="pidgen"):
+        """
+        Return a snapshot of every counter, in the Prometheus text exposition format.
+
+        kwargs:
+            prefix - Prefix for each metric name
+        """
+
+        lines = []
+
+        counters = [
+            ("frames_total", "Number of packets decoded", self.frames),
+            ("bytes_total", "Number of packet data bytes decoded", self.bytes),
+            ("decode_errors_total", "Number of packets which could not be decoded", self.decodeErrors),
+            ("validation_failures_total", "Number of decoded packets which violate their field limits", self.validationFailures),
+        ]
+
+        labels = ['packet="{n}",id="{i}"'.format(n=name, i=packet_id) for name, packet_id in zip(self.names, self.ids)]
+
+        for name, description, counter in counters:
+
+            lines.append("# HELP {p}_{n} {d}".format(p=prefix, n=name, d=description))
+            lines.append("# TYPE {p}_{n} counter".format(p=prefix, n=name))
+
+            for slot, label in enumerate(labels):
+                lines.append("{p}_{n}{{{l}}} {v}".format(p=prefix, n=name, l=label, v=counter[slot]))
+
+        totals = [
+            ("unknown_frames_total", "Number of frames with an unknown packet ID", self.unknown),
+            ("crc_errors_total", "Number of frames which failed the CRC check", self.crcErrors),
+            ("resyncs_total", "Number of times the stream was resynchronized", self.resyncs),
+        ]
+
+        for name, description, value in totals:
+            lines.append("# HELP {p}_{n} {d}".format(p=prefix, n=name, d=description))
+            lines.append("# TYPE {p}_{n} counter".format(p=prefix, n=name))
+            lines.append("{p}_{n} {v}".format(p=prefix, n=name, v=value))
+
+        lines.append("# HELP {p}_decode_seconds Packet decode time".format(p=prefix))
+        lines.append("# TYPE {p}_decode_seconds histogram".format(p=prefix))
+
+        for slot, label in enumerate(labels):
+
+            total = 0
+
+            for bound, count in zip(self.bounds, self.buckets(slot)):
+
+                total += count
+
+                lines.append('{p}_decode_seconds_bucket{{{l},le="{b}"}} {v}'.format(
+                    p=prefix,
+                    l=label,
+                    b="+Inf" if bound is None else repr(bound),
+                    v=total
+                ))
+
+            lines.append("{p}_decode_seconds_sum{{{l}}} {v!r}".format(p=prefix, l=label, v=self.decodeTime[slot] * 1e-9))
+            lines.append("{p}_decode_seconds_count{{{l}}} {v}".format(p=prefix, l=label, v=total))
+
+        return "\n".join(lines) + "\n"
+
+    def writePrometheus(self, path, prefix="pidgen"):
+        """
+        Write a snapshot (in the Prometheus text format) to a file.
+        The file is replaced atomically, so that it is never read while partially written.
+        """
+
+        temp = path + ".tmp"
+
+        with open(temp, "w") as f:
+            f.write(self.prometheus(prefix=prefix))
+
+        os.replace(temp, path)
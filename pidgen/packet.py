@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from .struct import PidgenStruct
+from .enumeration import PidgenEnumeration
+from . import debug
 
 
 class PidgenPacket(PidgenStruct):
@@ -9,8 +11,12 @@ class PidgenPacket(PidgenStruct):
     """
 
     ALLOWED_KEYS = [
+        "endian",
     ]
 
+    # Enumeration value named by the 'id' key (resolved by the link pass)
+    idTarget = None
+
     REQUIRED_KEYS = [
         "name",
         "id"
@@ -20,6 +26,63 @@ class PidgenPacket(PidgenStruct):
 
         PidgenStruct.__init__(self, parent, **kwargs)
 
+    @property
+    def packetId(self):
+        """ Return the (raw) 'id' value for this packet """
+        return self.get("id", None)
+
+    @property
+    def packetIdValue(self):
+        """
+        Return the numeric 'id' value for this packet.
+        The 'id' can be an integer, or the name of an enumeration value.
+
+        Returns None if the 'id' cannot be resolved.
+        """
+
+        raw = self.packetId
+
+        if raw is None:
+            return None
+
+        if self.idTarget is not None:
+            return self.idTarget.value
+
+        try:
+            return int(raw, 0)
+        except ValueError:
+            pass
+
+        for enum in self.protocol.getChildren(PidgenEnumeration, traverse_children=True):
+
+            value = enum.valueOf(raw)
+
+            if value is not None:
+                return value
+
+        debug.error("Could not resolve id '{i}' for packet '{n}' - {f}".format(
+            i=raw,
+            n=self.name,
+            f=self.path
+        ))
+
+        return None
+
+    def indexSymbols(self, index):
+        index.add("packet", self.name, self)
+
+    def link(self, linker):
+
+        raw = self.packetId
+
+        if raw is None:
+            return
+
+        try:
+            int(raw, 0)
+        except ValueError:
+            self.idTarget = linker.resolve(self, "id", "value", raw)
+
     def parse_packet(self):
         """
         Parse a packet object
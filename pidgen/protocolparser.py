@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import os
+from rapidfuzz import fuzz, process
 
 from .fileparser import PidgenFileParser
+from .linker import linkProtocol
 from .xmlparser import parseXML
 from . import debug
+from . import timing
 
 
 class PidgenProtocolParser(PidgenFileParser):
@@ -16,6 +19,13 @@ class PidgenProtocolParser(PidgenFileParser):
 
     Thus the PidgenProtocolParser is a subclass of the PidgenFileParser class.
 
+    kwargs:
+        lazy - If True, included files are only scanned for their top-level symbol names,
+               and are fully parsed when one of those symbols is requested (default = False)
+        compact - If True, the XML tree is released once each element has been parsed,
+                  reducing the memory used by the protocol (default = False)
+        endian - Default byte order ('little' or 'big') for every packet in the protocol.
+                 Overrides the 'endian' key of the protocol file (default = 'little')
 
     """
 
@@ -25,6 +35,7 @@ class PidgenProtocolParser(PidgenFileParser):
     ]
 
     ALLOWED_KEYS = [
+        "endian",
     ]
 
     def __init__(self, protocol_file, **kwargs):
@@ -40,6 +51,8 @@ class PidgenProtocolParser(PidgenFileParser):
         if not protocol_file.endswith(".xml"):
             debug.error("Protocol file '{f}' is not a .xml file".format(f=protocol_file), fail=True)
 
+        started = timing.start()
+
         # Read the data
         doc = parseXML(protocol_file)
         root = doc.getroot()
@@ -53,11 +66,24 @@ class PidgenProtocolParser(PidgenFileParser):
         # To ensure that files are not parsed multiple times
         self.files = []
 
+        # Map of (lower-case) symbol names to the lazily loaded files which define them
+        self.symbol_index = {}
+
         # Add the curent file
         self.checkPath(protocol_file)
 
+        # Symbol index and references (set by the link pass)
+        self.linker = None
+
         # The call to '__init__' here will call parse(), which then parses the file
-        PidgenFileParser.__init__(self, self, **kwargs)
+        # The protocol is the root of the element tree, and so has no parent
+        PidgenFileParser.__init__(self, None, **kwargs)
+
+        # Lazily loaded protocols are linked on request (linking requires every file to be loaded)
+        if not self.getSetting("lazy"):
+            self.link()
+
+        timing.stop("protocol", started)
 
     @property
     def version(self):
@@ -66,3 +92,76 @@ class PidgenProtocolParser(PidgenFileParser):
         """
 
         return self.get('version', None)
+
+    def indexSymbol(self, name, file):
+        """
+        Register a symbol defined in a lazily loaded file.
+
+        Args:
+            name - Name of the symbol (packet, struct or enumeration)
+            file - PidgenFileParser object which defines the symbol
+        """
+
+        files = self.symbol_index.setdefault(name.lower(), [])
+
+        if file not in files:
+            files.append(file)
+
+    def loadSymbol(self, name):
+        """
+        Ensure that any lazily loaded files which define the named symbol are parsed.
+
+        If no file defines the symbol, the file with the closest matching symbol is loaded instead,
+        so that a "did-you-mean" suggestion can still be made.
+
+        Return:
+            True if the symbol was found in the index
+        """
+
+        if len(self.symbol_index) == 0:
+            return False
+
+        key = name.lower()
+
+        found = key in self.symbol_index
+
+        if not found:
+            match = process.extractOne(key, self.symbol_index.keys(), scorer=fuzz.partial_ratio, score_cutoff=65)
+
+            if match is None:
+                return False
+
+            key = match[0]
+
+        for f in self.symbol_index[key]:
+            f.load()
+
+        return found
+
+    def link(self):
+        """
+        Resolve all references between the elements in the protocol (see linker.py).
+        Any unresolved references are reported as a single error.
+
+        Return:
+            List of (element, key, name, choices) for each unresolved reference
+        """
+
+        self.loadAll()
+
+        started = timing.start()
+
+        self.linker = linkProtocol(self)
+
+        timing.stop("link", started, path=self.path)
+
+        return self.linker.unresolved
+
+    def loadAll(self):
+        """
+        Ensure that every file in the protocol has been loaded.
+        Only has an effect if the protocol is being loaded lazily.
+        """
+
+        for f in self.getChildren(PidgenFileParser, traverse_children=True):
+            f.load()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reusable record objects for decoded packets.
+
+For each codec plan, a record class is generated with a __slots__ attribute for every field,
+so that a record can be decoded into (see PidgenCodecPlan.decodeInto) and reused, rather than
+allocating a new dict for every decoded packet.
+
+Field names are converted to attribute names by replacing any characters which are not valid
+in an identifier with '_', e.g. 'position.x' -> 'position_x', 'history[2].x' -> 'history_2__x'
+
+Names which would shadow a member of PidgenRecord (e.g. 'update'), or which collide with the attribute of
+an earlier field (e.g. 'position_x' after 'position.x'), have '_' appended until they are unique.
+The attribute name of each field is available from the ATTRIBUTES class attribute.
+
+Records can be recycled with a PidgenRecordPool, so that a long-running decode loop
+allocates a fixed number of records (however many packets are decoded).
+"""
+
+import keyword
+import re
+
+
+class PidgenRecord():
+    """
+    Base class for generated record classes.
+
+    Class attributes:
+        NAMES - Field names (in encoded order)
+        ATTRIBUTES - Attribute name for each field
+    """
+
+    __slots__ = ()
+
+    NAMES = ()
+    ATTRIBUTES = ()
+
+    def __repr__(self):
+        return "<{c} {v}>".format(c=self.__class__.__name__, v=self.asDict())
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.asDict() == other.asDict()
+
+    def asDict(self):
+        """ Return a dict of field names to values (fields which have not been set are None) """
+        return dict((name, getattr(self, attr, None)) for name, attr in zip(self.NAMES, self.ATTRIBUTES))
+
+    def update(self, values):
+        """ Set every field from a dict of field names to values (missing fields are set to None) """
+
+        for name, attr in zip(self.NAMES, self.ATTRIBUTES):
+            setattr(self, attr, values.get(name, None))
+
+        return self
+
+
+class PidgenRecordPool():
+    """
+    Pool of reusable records, for a single record class.
+
+    Attributes:
+        recordClass - Class of the records in the pool
+        limit - Maximum number of free records retained (None for no limit)
+        allocated - Number of records which have been allocated by the pool
+    """
+
+    def __init__(self, recordClass, size=0, limit=None):
+        """
+        Args:
+            recordClass - Record class (see compileRecordClass)
+
+        kwargs:
+            size - Number of records to preallocate
+            limit - Maximum number of free records retained (None for no limit)
+        """
+
+        self.recordClass = recordClass
+        self.limit = limit
+
+        self._free = [recordClass() for _ in range(size)]
+
+        self.allocated = size
+
+    def __repr__(self):
+        return "<Pool '{c}' ({n} free)>".format(c=self.recordClass.__name__, n=len(self._free))
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self):
+        """ Return a free record (a new record is allocated only if the pool is empty) """
+
+        if self._free:
+            return self._free.pop()
+
+        self.allocated += 1
+
+        return self.recordClass()
+
+    def release(self, record):
+        """ Return a record to the pool, once it is no longer required """
+
+        if self.limit is None or len(self._free) < self.limit:
+            self._free.append(record)
+
+
+def attributeName(name):
+    """ Return the record attribute name for a (dotted) field name """
+
+    attr = re.sub(r"\W", "_", name)
+
+    if attr[:1].isdigit() or keyword.iskeyword(attr):
+        attr = "_" + attr
+
+    return attr
+
+
+# Attribute names which are reserved for the members of PidgenRecord
+_RESERVED = frozenset(dir(PidgenRecord))
+
+
+def compileRecordClass(plan):
+    """
+    Generate the record class for a codec plan.
+    Use the recordClass property of the plan rather than calling this directly, so that the result is cached.
+    """
+
+    struct = plan.layout.struct
+
+    names = tuple(plan.names)
+    attributes = []
+
+    for name in names:
+        attr = attributeName(name)
+
+        while attr in _RESERVED or attr in attributes:
+            attr += "_"
+
+        attributes.append(attr)
+
+    attributes = tuple(attributes)
+
+    return type(attributeName(struct.name) + "Record", (PidgenRecord, ), {
+        "__slots__": attributes,
+        "NAMES": names,
+        "ATTRIBUTES": attributes,
+    })
@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared-memory ring buffers for encoded packets.
+
+A single shared memory segment (multiprocessing.shared_memory) contains a ring buffer for each packet type.
+One process writes packets (encoding each packet directly into its slot), and any number of processes
+read them, either decoded, or as zero-copy views (memoryview or NumPy arrays) over the slots.
+
+Segment layout (little-endian):
+
+    [ header ][ descriptor for each ring ][ ring data ... ]
+
+    header - magic (8 bytes), version (u32), number of rings (u32)
+    descriptor - packet ID (u32), slot size (u32), capacity (u32), flags (u32), data offset (u64), sequence (u64)
+
+The sequence of each ring is the total number of packets written to the ring.
+Packet n is written to slot (n % capacity), and the sequence is only advanced once the packet is complete.
+
+Packets with a fixed size occupy exactly one slot each.
+Packets without a fixed size (but with a maximum size) are stored with a u32 length prefix in each slot.
+
+While the sequence of a ring is S, the writer may already be writing packet S into the slot of packet (S - capacity),
+so readers can only read the most recent (capacity - 1) packets.
+Readers which fall further behind the writer skip the overwritten packets (see PidgenRingReader.lost).
+Zero-copy views remain valid only until the writer wraps around to the same slots (see PidgenRingReader.check).
+
+There must be a single writer for each segment.
+
+multiprocessing.shared_memory requires Python 3.8 or later. It is only imported when a ring is created or attached,
+so that the rest of pidgen can still be used with older versions.
+"""
+
+import struct
+
+from . import debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MAGIC = b"PIDGRING"
+VERSION = 1
+
+HEADER = struct.Struct("<8sII")
+DESCRIPTOR = struct.Struct("<IIIIQQ")
+SEQUENCE = struct.Struct("<Q")
+LENGTH = struct.Struct("<I")
+
+# Offset of the sequence within each descriptor
+SEQUENCE_OFFSET = 24
+
+# Alignment of the data for each ring (bytes)
+ALIGNMENT = 64
+
+# Descriptor flags
+FLAG_VARIABLE = 0x01
+
+
+def _sharedMemory():
+    """ Import the multiprocessing.shared_memory module (Python 3.8+) """
+
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise RuntimeError("Shared-memory ring buffers require Python 3.8 or later")
+
+    return shared_memory
+
+
+class PidgenSharedRing():
+    """
+    Shared memory segment containing a ring buffer for each packet type.
+
+    Attributes:
+        name - Name of the shared memory segment
+        plans - Dict of packet ID -> codec plan
+        capacity - Number of slots in each ring
+        slotSize - Dict of packet ID -> slot size (bytes)
+        offsets - Dict of packet ID -> offset of the first slot
+        variable - Set of packet IDs which are stored with a length prefix
+    """
+
+    def __init__(self, packets, name=None, capacity=1024, create=True, packed=True):
+        """
+        Args:
+            packets - List of PidgenPacket objects (the same packets must be provided by the writer and every reader)
+
+        kwargs:
+            name - Name of the shared memory segment (a unique name is generated if not provided when creating)
+            capacity - Number of slots in each ring (only used when creating the segment)
+            create - If True, create the segment (writer). Otherwise, attach to an existing segment (reader).
+            packed - Use the packed (default) or aligned packet layouts
+        """
+
+        self.plans = {}
+        self.packets = {}
+
+        for packet in packets:
+
+            packet_id = packet.packetIdValue
+
+            if packet_id is None or packet_id in self.plans:
+                continue
+
+            plan = packet.codecPlan(packed=packed)
+
+            if plan is None:
+                continue
+
+            if plan.size is None and plan.maxSize is None:
+                debug.warning("Packet '{n}' does not have a maximum size, and cannot be stored in a ring buffer".format(n=packet.name))
+                continue
+
+            self.plans[packet_id] = plan
+            self.packets[packet_id] = packet
+
+        self.creator = create
+
+        if create:
+            self._create(name, capacity)
+        else:
+            self._attach(name)
+
+        self.name = self.shm.name
+
+        # Sequence of each ring (only maintained by the writer)
+        self._sequences = dict((packet_id, 0) for packet_id in self.offsets)
+
+        self._records = {}
+
+    def __repr__(self):
+        return "<Ring '{n}' ({r} rings)>".format(n=self.name, r=len(self.offsets))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+        if self.creator:
+            self.unlink()
+
+    def _create(self, name, capacity):
+
+        # One slot is always reserved for the packet being written
+        if capacity < 2:
+            raise ValueError("Ring buffer capacity must be at least 2 (not {n})".format(n=capacity))
+
+        self.capacity = capacity
+
+        self.slotSize = {}
+        self.variable = set()
+
+        for packet_id, plan in self.plans.items():
+            if plan.size is None:
+                self.slotSize[packet_id] = LENGTH.size + plan.maxSize
+                self.variable.add(packet_id)
+            else:
+                self.slotSize[packet_id] = plan.size
+
+        ids = sorted(self.plans.keys())
+
+        offset = HEADER.size + DESCRIPTOR.size * len(ids)
+
+        self.offsets = {}
+        self._descriptors = {}
+
+        for idx, packet_id in enumerate(ids):
+            offset += (-offset) % ALIGNMENT
+
+            self.offsets[packet_id] = offset
+            self._descriptors[packet_id] = HEADER.size + DESCRIPTOR.size * idx
+
+            offset += self.slotSize[packet_id] * capacity
+
+        self.shm = _sharedMemory().SharedMemory(name=name, create=True, size=max(offset, 1))
+
+        buf = self.shm.buf
+
+        HEADER.pack_into(buf, 0, MAGIC, VERSION, len(ids))
+
+        for packet_id in ids:
+            DESCRIPTOR.pack_into(
+                buf,
+                self._descriptors[packet_id],
+                packet_id,
+                self.slotSize[packet_id],
+                capacity,
+                FLAG_VARIABLE if packet_id in self.variable else 0,
+                self.offsets[packet_id],
+                0
+            )
+
+    def _attach(self, name):
+
+        shared_memory = _sharedMemory()
+
+        try:
+            # Readers must not remove the segment when they exit (Python 3.13+)
+            self.shm = shared_memory.SharedMemory(name=name, create=False, track=False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=name, create=False)
+
+        buf = self.shm.buf
+
+        magic, version, count = HEADER.unpack_from(buf, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError("Shared memory segment '{n}' is not a Pidgen ring buffer".format(n=name))
+
+        self.slotSize = {}
+        self.variable = set()
+        self.offsets = {}
+        self._descriptors = {}
+
+        self.capacity = None
+
+        for idx in range(count):
+            position = HEADER.size + DESCRIPTOR.size * idx
+
+            packet_id, size, capacity, flags, offset, sequence = DESCRIPTOR.unpack_from(buf, position)
+
+            plan = self.plans.get(packet_id, None)
+
+            if plan is None:
+                continue
+
+            expected = plan.size if plan.size is not None else LENGTH.size + plan.maxSize
+
+            if size != expected:
+                debug.error("Packet '{n}' has slot size {a} in ring buffer '{r}' (expected {b})".format(
+                    n=self.packets[packet_id].name,
+                    a=size,
+                    r=name,
+                    b=expected
+                ))
+
+                continue
+
+            self.capacity = capacity
+            self.slotSize[packet_id] = size
+            self.offsets[packet_id] = offset
+            self._descriptors[packet_id] = position
+
+            if flags & FLAG_VARIABLE:
+                self.variable.add(packet_id)
+
+    def sequence(self, packet_id):
+        """ Return the number of packets which have been written to the ring for a packet type """
+        return SEQUENCE.unpack_from(self.shm.buf, self._descriptors[packet_id] + SEQUENCE_OFFSET)[0]
+
+    def write(self, packet_id, values, convert=False):
+        """
+        Encode a packet directly into the next slot of its ring.
+
+        Args:
+            packet_id - Numeric packet ID
+            values - Dict of field values
+
+        Return:
+            Sequence number of the packet
+        """
+
+        plan = self.plans[packet_id]
+
+        sequence = self._sequences[packet_id]
+
+        size = self.slotSize[packet_id]
+
+        offset = self.offsets[packet_id] + (sequence % self.capacity) * size
+
+        buf = self.shm.buf
+
+        if packet_id in self.variable:
+            data = plan.encode(values, convert=convert)
+
+            if len(data) > size - LENGTH.size:
+                raise struct.error("Packet {i} is too large for its slot ({n} > {m} bytes)".format(i=packet_id, n=len(data), m=size - LENGTH.size))
+
+            LENGTH.pack_into(buf, offset, len(data))
+            buf[offset + LENGTH.size:offset + LENGTH.size + len(data)] = data
+        else:
+            plan.encodeInto(buf, offset, values, convert=convert)
+
+        # Publish the packet
+        self._sequences[packet_id] = sequence + 1
+
+        SEQUENCE.pack_into(buf, self._descriptors[packet_id] + SEQUENCE_OFFSET, sequence + 1)
+
+        return sequence
+
+    def slot(self, packet_id, sequence):
+        """
+        Return a zero-copy view of the encoded packet with the given sequence number.
+        """
+
+        size = self.slotSize[packet_id]
+
+        offset = self.offsets[packet_id] + (sequence % self.capacity) * size
+
+        if packet_id in self.variable:
+            length = LENGTH.unpack_from(self.shm.buf, offset)[0]
+            return self.shm.buf[offset + LENGTH.size:offset + LENGTH.size + length]
+
+        return self.shm.buf[offset:offset + size]
+
+    def records(self, packet_id):
+        """
+        Return a (zero-copy) NumPy structured array over every slot in the ring for a packet type.
+        Only available for packets with a fixed size.
+        """
+
+        if packet_id not in self._records:
+
+            plan = self.plans[packet_id]
+
+            if numpy is None or packet_id in self.variable:
+                return None
+
+            self._records[packet_id] = numpy.ndarray(
+                shape=(self.capacity, ),
+                dtype=plan.dtype,
+                buffer=self.shm.buf,
+                offset=self.offsets[packet_id]
+            )
+
+        return self._records[packet_id]
+
+    def reader(self, packet_id, latest=False):
+        """
+        Return a reader for a packet type (see PidgenRingReader).
+
+        kwargs:
+            latest - If True, the reader starts from the current sequence (rather than the oldest packet in the ring)
+        """
+
+        return PidgenRingReader(self, packet_id, latest=latest)
+
+    def close(self):
+        """
+        Close this process's view of the segment.
+        Any NumPy arrays or memoryviews over the segment must be released first.
+        """
+
+        self._records.clear()
+
+        self.shm.close()
+
+    def unlink(self):
+        """ Remove the shared memory segment (once every process has closed it) """
+        self.shm.unlink()
+
+
+class PidgenRingReader():
+    """
+    Reads the packets of a single packet type from a PidgenSharedRing, in order.
+
+    Attributes:
+        ring - PidgenSharedRing object
+        packetId - Packet ID
+        position - Sequence number of the next packet to read
+        lost - Number of packets which were overwritten before they could be read
+    """
+
+    def __init__(self, ring, packet_id, latest=False):
+
+        self.ring = ring
+        self.packetId = packet_id
+        self.plan = ring.plans[packet_id]
+        self.lost = 0
+
+        sequence = ring.sequence(packet_id)
+
+        self.position = sequence if latest else max(0, sequence - (ring.capacity - 1))
+
+        # Sequence of the first packet returned by the last read
+        self._start = self.position
+
+    def __repr__(self):
+        return "<Reader {i} @ {p}>".format(i=self.packetId, p=self.position)
+
+    def pending(self):
+        """ Return the number of packets available to be read """
+        return min(self.ring.sequence(self.packetId) - self.position, self.ring.capacity - 1)
+
+    def _advance(self):
+        """ Return the (start, end) sequence numbers of the unread packets, and mark them as read """
+
+        end = self.ring.sequence(self.packetId)
+        start = self.position
+
+        # The slot after the most recent packet may be partially written
+        readable = self.ring.capacity - 1
+
+        if end - start > readable:
+            self.lost += end - start - readable
+            start = end - readable
+
+        self.position = end
+        self._start = start
+
+        return start, end
+
+    def check(self):
+        """ Return True if the packets returned by the last read have not been overwritten since """
+        return self.ring.sequence(self.packetId) - self._start < self.ring.capacity
+
+    def views(self):
+        """
+        Return zero-copy views (memoryview objects) of the unread packets.
+        The views are only valid until the writer wraps around to the same slots (see check).
+        """
+
+        start, end = self._advance()
+
+        return [self.ring.slot(self.packetId, sequence) for sequence in range(start, end)]
+
+    def arrays(self):
+        """
+        Return zero-copy NumPy structured arrays over the unread packets (for packets with a fixed size).
+        As the packets may wrap around the end of the ring, up to two arrays are returned.
+        The arrays are only valid until the writer wraps around to the same slots (see check).
+        """
+
+        records = self.ring.records(self.packetId)
+
+        if records is None:
+            return None
+
+        start, end = self._advance()
+
+        capacity = self.ring.capacity
+
+        first = start % capacity
+        count = end - start
+
+        head = min(count, capacity - first)
+
+        arrays = [records[first:first + head]]
+
+        if count > head:
+            arrays.append(records[:count - head])
+
+        return arrays
+
+    def read(self, convert=False):
+        """
+        Decode the unread packets.
+        Packets which are overwritten while they are being decoded are discarded (and counted as lost).
+
+        Return:
+            List of decoded packets (dicts of field names to values)
+        """
+
+        start, end = self._advance()
+
+        ring = self.ring
+        plan = self.plan
+        buf = ring.shm.buf
+
+        size = ring.slotSize[self.packetId]
+        base = ring.offsets[self.packetId]
+        capacity = ring.capacity
+
+        skip = LENGTH.size if self.packetId in ring.variable else 0
+
+        results = [plan.decode(buf, base + (sequence % capacity) * size + skip, convert=convert) for sequence in range(start, end)]
+
+        # Discard any packets which the writer may have overwritten during decoding
+        # (including the packet in the slot which is currently being written)
+        overwritten = ring.sequence(self.packetId) - capacity - start + 1
+
+        if overwritten > 0:
+            self.lost += min(overwritten, len(results))
+            results = results[overwritten:]
+
+        return results
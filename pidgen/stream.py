@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+
+"""
+Stream framing of encoded packets.
+
+Each frame in the stream consists of a header (the packet ID), followed by the encoded packet:
+
+    [ packet ID (u16) ][ packet data ... ]
+
+The packet ID is used to select the codec plan for the frame,
+and the size of each frame is determined by the plan:
+- Packets with conditional fields - the size is determined from the packet prefix
+- Packets with length-prefixed strings - the size is determined from the length prefixes only
+
+Small packets can be aggregated into transport frames (up to a maximum size, the MTU) with PidgenBatchStream.
+Each transport frame is simply a sequence of the frames above, and so is split back into packets in a single pass.
+"""
+
+import struct
+
+try:
+    from time import perf_counter_ns
+except ImportError:
+    # Python < 3.7
+    from time import perf_counter
+
+    def perf_counter_ns():
+        return int(perf_counter() * 1e9)
+
+from .metrics import PidgenMetrics
+from . import debug
+
+
+class PidgenStream():
+    """
+    Encodes packets into frames, and decodes frames from a (possibly fragmented) byte stream.
+
+    Attributes:
+        plans - Dict of packet ID -> PidgenCodecPlan
+        slots - Dict of packet ID -> dispatch slot (index of the packet type in the metrics arrays)
+        errors - Number of decoding errors encountered
+        metrics - PidgenMetrics object, or None if metrics are not enabled (see enableMetrics)
+    """
+
+    HEADER = struct.Struct("<H")
+
+    def __init__(self, packets, packed=True):
+        """
+        Args:
+            packets - List of PidgenPacket objects which may appear in the stream
+
+        kwargs:
+            packed - Use the packed (default) or aligned packet layouts
+        """
+
+        self.plans = {}
+        self.packets = {}
+
+        for packet in packets:
+
+            packet_id = packet.packetIdValue
+
+            if packet_id is None:
+                continue
+
+            if packet_id in self.plans:
+                debug.error("Duplicate packet ID {i} for '{a}' and '{b}'".format(
+                    i=packet_id,
+                    a=self.packets[packet_id].name,
+                    b=packet.name
+                ))
+
+                continue
+
+            plan = packet.codecPlan(packed=packed)
+
+            if plan is None:
+                continue
+
+            self.plans[packet_id] = plan
+            self.packets[packet_id] = packet
+
+        self.slots = dict((packet_id, slot) for slot, packet_id in enumerate(self.plans))
+
+        self.errors = 0
+
+        self.metrics = None
+
+        # Compiled validators for each packet ID (if validation is enabled)
+        self._validators = None
+
+        # Received data which does not (yet) form a complete frame
+        self._buffer = bytearray()
+
+    def encode(self, packet_id, values, convert=False):
+        """
+        Encode a single frame.
+
+        Args:
+            packet_id - Numeric packet ID
+            values - Dict of field values
+
+        Return:
+            Encoded frame (bytes)
+        """
+
+        plan = self.plans[packet_id]
+
+        return self.HEADER.pack(packet_id) + plan.encode(values, convert=convert)
+
+    def frames(self, buffer):
+        """
+        Iterate over the complete frames in a buffer.
+
+        Yields:
+            (packet_id, plan, offset) for each frame, where offset is the start of the packet data
+
+        The number of bytes consumed is available as self.consumed once iteration stops.
+        """
+
+        header = self.HEADER
+        header_size = header.size
+        plans = self.plans
+
+        length = len(buffer)
+        idx = 0
+
+        self.consumed = 0
+
+        while idx + header_size <= length:
+
+            packet_id = header.unpack_from(buffer, idx)[0]
+
+            plan = plans.get(packet_id, None)
+
+            if plan is None:
+                # Without a plan, the frame size is unknown - discard the remaining data
+                debug.warning("Unknown packet ID {i} in stream".format(i=packet_id))
+                self.countError(packet_id)
+                idx = length
+                break
+
+            size = plan.size
+
+            if size is None:
+                size = plan.sizeOf(buffer, idx + header_size)
+
+                if size is None:
+                    break
+
+            end = idx + header_size + size
+
+            if end > length:
+                break
+
+            yield packet_id, plan, idx + header_size
+
+            idx = end
+
+        self.consumed = idx
+
+    def decodeRecords(self, buffer, convert=False):
+        """
+        Decode all complete frames in a buffer into reusable records (see PidgenCodecPlan.decodeInto).
+        Records are acquired from the pool of each packet, and should be released once no longer required:
+
+            for packet_id, record in stream.decodeRecords(data):
+                ...
+                stream.plans[packet_id].pool.release(record)
+
+        Return:
+            List of (packet_id, record) tuples
+        """
+
+        return [(packet_id, plan.decodeInto(buffer, offset, convert=convert)) for packet_id, plan, offset in self.frames(buffer)]
+
+    def enableMetrics(self, enable=True, validate=False):
+        """
+        Enable (or disable) runtime metrics for each packet type (see PidgenMetrics).
+
+        kwargs:
+            validate - If True, decoded packets are also validated against their field limits
+                       (packets must be decoded with convert=True)
+
+        Return:
+            PidgenMetrics object (or None if metrics are disabled)
+        """
+
+        if not enable:
+            self.metrics = None
+        elif self.metrics is None:
+            self.metrics = PidgenMetrics(
+                list(self.slots.keys()),
+                [self.packets[packet_id].name for packet_id in self.slots]
+            )
+
+        self._validators = None
+
+        if validate:
+            self._validators = dict((packet_id, plan.validator) for packet_id, plan in self.plans.items())
+
+        return self.metrics
+
+    def countError(self, packet_id):
+        """ Record a frame which could not be decoded """
+
+        self.errors += 1
+
+        if self.metrics is not None:
+            slot = self.slots.get(packet_id, None)
+
+            if slot is None:
+                self.metrics.unknown += 1
+            else:
+                self.metrics.decodeErrors[slot] += 1
+
+    def decode(self, buffer, convert=False):
+        """
+        Decode all complete frames in a buffer.
+
+        Return:
+            List of (packet_id, values) tuples
+        """
+
+        if self.metrics is not None:
+            return self._decodeMetrics(buffer, convert)
+
+        return [(packet_id, plan.decode(buffer, offset, convert=convert)) for packet_id, plan, offset in self.frames(buffer)]
+
+    def _decodeMetrics(self, buffer, convert):
+        """
+        Decode all complete frames in a buffer, recording metrics for each frame.
+        Frames which cannot be decoded are counted (and skipped), rather than raising an error.
+        """
+
+        metrics = self.metrics
+        slots = self.slots
+        validators = self._validators if convert else None
+
+        # Counters are updated inline (rather than with metrics.record) to keep the overhead low
+        frames = metrics.frames
+        sizes = metrics.bytes
+        times = metrics.decodeTime
+        histogram = metrics.histogram
+        buckets = metrics.BUCKETS
+        last = buckets - 1
+
+        results = []
+
+        for packet_id, plan, offset in self.frames(buffer):
+
+            slot = slots[packet_id]
+
+            started = perf_counter_ns()
+
+            try:
+                values, size = plan.decodeSized(buffer, offset, convert=convert)
+            except (struct.error, ValueError, OverflowError):
+                self.countError(packet_id)
+                continue
+
+            elapsed = perf_counter_ns() - started
+
+            frames[slot] += 1
+            sizes[slot] += size
+            times[slot] += elapsed
+
+            bucket = elapsed.bit_length()
+            histogram[slot * buckets + (bucket if bucket < last else last)] += 1
+
+            if validators is not None:
+                validator = validators[packet_id]
+
+                if validator is not None and validator(values) is not None:
+                    metrics.validationFailures[slot] += 1
+
+            results.append((packet_id, values))
+
+        return results
+
+    def feed(self, data, convert=False):
+        """
+        Add received data to the stream, and decode any complete frames.
+        Any trailing partial frame is retained until more data is received.
+
+        Return:
+            List of (packet_id, values) tuples
+        """
+
+        self._buffer += data
+
+        results = self.decode(self._buffer, convert=convert)
+
+        del self._buffer[:self.consumed]
+
+        return results
+
+
+class PidgenBatchStream(PidgenStream):
+    """
+    Aggregates many packets into each transport frame, up to a maximum frame size (MTU).
+
+    Packets are encoded (with pack_into) directly into a preallocated frame buffer,
+    and the frame is only copied out once it is full (or flushed).
+
+    Attributes:
+        mtu - Maximum size (bytes) of each transport frame
+        count - Number of packets in the current (unsent) frame
+    """
+
+    def __init__(self, packets, mtu, packed=True):
+        """
+        Args:
+            packets - List of PidgenPacket objects which may appear in the stream
+            mtu - Maximum size (bytes) of each transport frame
+
+        kwargs:
+            packed - Use the packed (default) or aligned packet layouts
+        """
+
+        PidgenStream.__init__(self, packets, packed=packed)
+
+        self.mtu = mtu
+
+        for packet_id, plan in self.plans.items():
+            if plan.maxSize is not None and self.HEADER.size + plan.maxSize > mtu:
+                debug.warning("Packet '{name}' may not fit within a {n} byte frame".format(
+                    name=self.packets[packet_id].name,
+                    n=mtu
+                ))
+
+        self._frame = bytearray(mtu)
+        self._offset = 0
+
+        # Packets which do not fit in the current frame are encoded here first
+        self._scratch = bytearray(mtu)
+
+        self.count = 0
+
+    def add(self, packet_id, values, convert=False):
+        """
+        Add a packet to the current frame.
+        If the packet does not fit within the current frame, the current frame is completed first.
+
+        Args:
+            packet_id - Numeric packet ID
+            values - Dict of field values
+
+        Return:
+            The completed frame (bytes), or None if the current frame is not yet full
+        """
+
+        plan = self.plans[packet_id]
+
+        header = self.HEADER
+
+        size = plan.size
+        data = None
+
+        if size is None:
+            data = plan.encode(values, convert=convert)
+            size = len(data)
+
+        total = header.size + size
+
+        if total > self.mtu:
+            raise struct.error("Packet {i} is too large for the frame ({n} > {m} bytes)".format(i=packet_id, n=total, m=self.mtu))
+
+        completed = None
+
+        if self._offset + total > self.mtu:
+            # Encode the packet before completing the frame,
+            # so that the buffered packets are not lost if the packet cannot be encoded
+            if data is None:
+                plan.encodeInto(self._scratch, 0, values, convert=convert)
+                data = memoryview(self._scratch)[:size]
+
+            completed = self.flush()
+
+        frame = self._frame
+        offset = self._offset
+
+        header.pack_into(frame, offset, packet_id)
+
+        if data is None:
+            plan.encodeInto(frame, offset + header.size, values, convert=convert)
+        else:
+            frame[offset + header.size:offset + total] = data
+
+        self._offset = offset + total
+        self.count += 1
+
+        return completed
+
+    def flush(self):
+        """
+        Complete the current frame.
+
+        Return:
+            The completed frame (bytes), or None if the current frame is empty
+        """
+
+        if self._offset == 0:
+            return None
+
+        frame = bytes(memoryview(self._frame)[:self._offset])
+
+        self._offset = 0
+        self.count = 0
+
+        return frame
+
+    def encodeFrames(self, packets, convert=False):
+        """
+        Encode a sequence of packets into as few transport frames as possible (in order).
+        Any packets already added to the current frame are sent first.
+
+        Args:
+            packets - Iterable of (packet_id, values) tuples
+
+        Return:
+            List of frames (bytes)
+        """
+
+        frames = []
+
+        for packet_id, values in packets:
+            frame = self.add(packet_id, values, convert=convert)
+
+            if frame is not None:
+                frames.append(frame)
+
+        frame = self.flush()
+
+        if frame is not None:
+            frames.append(frame)
+
+        return frames
+
+    def decodeFrame(self, frame, convert=False):
+        """
+        Split a transport frame back into its packets (in a single pass).
+
+        Return:
+            List of (packet_id, values) tuples
+        """
+
+        results = self.decode(frame, convert=convert)
+
+        if self.consumed != len(frame):
+            debug.warning("Incomplete packet at end of frame ({n} bytes)".format(n=len(frame) - self.consumed))
+            self.errors += 1
+
+        return results
@@ -2,6 +2,44 @@
 
 from .element import PidgenElement
 from .data import PidgenDataElement
+from .layout import computeLayout
+from .codec import compilePlan
+from . import debug
+
+
+# Byte order helpers shared by the rendered C code of every struct (see PidgenStruct.renderC)
+C_HELPERS = """#ifndef PIDGEN_BYTE_ORDER_HELPERS
+#define PIDGEN_BYTE_ORDER_HELPERS
+
+#include <stdint.h>
+#include <string.h>
+
+#if defined(__BYTE_ORDER__) && (__BYTE_ORDER__ == __ORDER_BIG_ENDIAN__)
+#define PIDGEN_HOST_BIG_ENDIAN 1
+#else
+#define PIDGEN_HOST_BIG_ENDIAN 0
+#endif
+
+//! Copy a value of 'size' bytes, reversing the byte order if 'swap' is non-zero
+static inline void pidgenCopy(void* dest, const void* src, unsigned int size, int swap)
+{
+    const uint8_t* s = (const uint8_t*) src;
+    uint8_t* d = (uint8_t*) dest;
+    unsigned int i;
+
+    if (swap)
+    {
+        for (i = 0; i < size; i++)
+            d[i] = s[size - 1 - i];
+    }
+    else
+    {
+        memcpy(dest, src, size);
+    }
+}
+
+#endif // PIDGEN_BYTE_ORDER_HELPERS
+"""
 
 
 class PidgenStruct(PidgenElement):
@@ -15,6 +53,7 @@ class PidgenStruct(PidgenElement):
     """
 
     ALLOWED_KEYS = [
+        "endian",
     ]
 
     REQUIRED_KEYS = [
@@ -22,30 +61,41 @@ class PidgenStruct(PidgenElement):
     ]
 
     ALLOWED_CHILDREN = [
-        "data"
+        "data",
+        ("struct", "structure"),
     ]
 
     def __init__(self, parent, **kwargs):
 
+        # Cached layouts (packed / aligned), invalidated whenever the struct changes
+        self._layouts = {}
+        self._plans = {}
+        self.layoutVersion = 0
+
         PidgenElement.__init__(self, parent, **kwargs)
 
     def parse(self):
 
-        for child in self.xml.getchildren():
+        self.applyEndian()
+
+        for child in self.xml:
 
-            tag = child.tag.lower()
+            tag = self.SCHEMA.canonicalChild(child.tag)
 
             if tag == "data":
 
                 # Create a new data value
                 PidgenDataElement(self, xml=child)
             
-            elif tag in ["struct", "structure"]:
+            elif tag == "struct":
 
                 # Create a new sub-struct
                 # TODO - What does it mean to have a struct inside a struct?
                 PidgenStruct(self, xml=child)
 
+    def indexSymbols(self, index):
+        index.add("struct", self.name, self)
+
     @property
     def data(self):
         """ Return all data elements in this struct """
@@ -87,3 +137,245 @@ class PidgenStruct(PidgenElement):
                 return True
 
         return False
+
+    def addChild(self, child):
+        """ Add a new child object, which invalidates the layout of this struct """
+
+        PidgenElement.addChild(self, child)
+
+        self.invalidateLayout()
+
+    def invalidateLayout(self):
+        """
+        Discard any cached layout for this struct.
+        Any layouts which include this struct (nested or by reference) are also invalidated.
+        """
+
+        self.layoutVersion += 1
+        self._layouts = {}
+        self._plans = {}
+
+    def layout(self, packed=True, stack=None):
+        """
+        Return the layout (field offsets, sizes and padding) of this struct.
+        The layout is computed once, and cached until the struct (or any struct it includes) changes.
+
+        kwargs:
+            packed - If True (default), return the packed layout. Otherwise, return the naturally aligned layout.
+
+        Return:
+            PidgenStructLayout object
+        """
+
+        packed = bool(packed)
+
+        layout = self._layouts.get(packed, None)
+
+        if layout is None or not layout.isValid():
+            layout = computeLayout(self, packed=packed, stack=stack)
+            self._layouts[packed] = layout
+
+        return layout
+
+    @property
+    def encodedSize(self):
+        """ Return the packed encoded size (bytes) of this struct, or None if it is not fixed """
+
+        return self.layout().size
+
+    def renderC(self):
+        """
+        Render C code for this struct (or packet):
+        - A struct definition, containing the encoded value of each field
+        - Encode / decode functions, which copy each field to / from the packed encoding
+          (swapping bytes if the byte order of the struct differs from the host)
+
+        Only structs with a fixed layout can be rendered.
+
+        Return:
+            C source code (string), or None if the struct does not have a fixed layout
+        """
+
+        plan = self.codecPlan()
+
+        if plan is None or plan.size is None:
+            debug.error("Cannot render C code for '{n}' - layout does not have a fixed size - {f}".format(
+                n=self.name,
+                f=self.path
+            ))
+
+            return None
+
+        name = self.name
+        macro = name.upper()
+        big = plan.byteOrder == ">"
+
+        lines = [
+            C_HELPERS,
+            "typedef struct",
+            "{",
+        ]
+
+        lines += self._renderFieldsC(self.layout(), "    ")
+
+        lines += [
+            "}} {n};".format(n=name),
+            "",
+            "//! Encoded size (bytes) of {n}".format(n=name),
+            "#define {m}_SIZE {s}".format(m=macro, s=plan.size),
+            "",
+            "//! {n} is encoded {o}-endian".format(n=name, o="big" if big else "little"),
+            "#define {m}_SWAP ({h})".format(m=macro, h="PIDGEN_HOST_BIG_ENDIAN == 0" if big else "PIDGEN_HOST_BIG_ENDIAN != 0"),
+            "",
+        ]
+
+        for function, signature in [
+            ("encode", "void {n}_encode(const {n}* value, uint8_t* data)"),
+            ("decode", "void {n}_decode(const uint8_t* data, {n}* value)"),
+        ]:
+
+            lines.append("//! {f} {n} ({m}_SIZE bytes)".format(f=function.capitalize(), n=name, m=macro))
+            lines.append(signature.format(n=name))
+            lines.append("{")
+
+            if any(field.count is not None for field in plan.fields):
+                lines.append("    unsigned int i;")
+                lines.append("")
+
+            for word, fields in plan.words:
+                if fields[0].bits is None:
+                    lines += self._renderCopyC(fields[0], macro, function == "encode")
+                else:
+                    lines += self._renderBitsC(fields, macro, function == "encode")
+
+            lines.append("}")
+            lines.append("")
+
+        return "\n".join(lines)
+
+    def _renderFieldsC(self, layout, indent):
+        """ Render the C definition of each field in a layout """
+
+        lines = []
+
+        for field in layout.fields:
+
+            element = field.element
+
+            array = "[{n}]".format(n=field.count) if field.isArray else ""
+
+            comment = " //!< {c}".format(c=element.comment) if element.comment else ""
+
+            if field.isStruct and not isinstance(element, PidgenDataElement):
+                # Nested struct definition
+                lines.append(indent + "struct")
+                lines.append(indent + "{")
+                lines += self._renderFieldsC(field.layout, indent + "    ")
+                lines.append(indent + "}} {n}{a};{c}".format(n=field.name, a=array, c=comment))
+
+            elif field.isStruct:
+                lines.append(indent + "{t} {n}{a};{c}".format(t=field.layout.struct.name, n=field.name, a=array, c=comment))
+
+            elif field.encoding == PidgenDataElement.DATA_STR:
+                lines.append(indent + "char {n}{a}[{s}];{c}".format(n=field.name, a=array, s=field.itemSize, c=comment))
+
+            elif field.isBitfield:
+                lines.append(indent + "{t} {n} : {b};{c}".format(t=PidgenDataElement._C_TYPE[field.encoding], n=field.name, b=field.bits, c=comment))
+
+            else:
+                lines.append(indent + "{t} {n}{a};{c}".format(t=PidgenDataElement._C_TYPE[field.encoding], n=field.name, a=array, c=comment))
+
+        return lines
+
+    def _renderBitsC(self, fields, macro, encode):
+        """ Render the C code which encodes (or decodes) the bitfields which share a storage word """
+
+        size = fields[0].field.itemSize
+        offset = fields[0].offset
+
+        # The storage word is handled as an unsigned value
+        storage = PidgenDataElement._C_TYPE[[PidgenDataElement.DATA_U8, PidgenDataElement.DATA_U16, None, PidgenDataElement.DATA_U32, None, None, None, PidgenDataElement.DATA_U64][size - 1]]
+
+        lines = ["    {"]
+
+        if encode:
+            lines.append("        {t} bits = 0;".format(t=storage))
+
+            for f in fields:
+                lines.append("        bits |= ({t})(((({t}) value->{n}) & 0x{m:X}) << {s});".format(t=storage, n=f.name, m=f.mask, s=f.shift))
+
+            lines.append("        pidgenCopy(data + {o}, &bits, {w}, {m}_SWAP);".format(o=offset, w=size, m=macro))
+        else:
+            lines.append("        {t} bits;".format(t=storage))
+            lines.append("        pidgenCopy(&bits, data + {o}, {w}, {m}_SWAP);".format(o=offset, w=size, m=macro))
+
+            for f in fields:
+                value = "(bits >> {s}) & 0x{m:X}".format(s=f.shift, m=f.mask)
+
+                if f.signed:
+                    half = 1 << (f.bits - 1)
+                    value = "(int64_t)(({v}) ^ 0x{h:X}) - 0x{h:X}".format(v=value, h=half)
+
+                lines.append("        value->{n} = {v};".format(n=f.name, v=value))
+
+        lines.append("    }")
+
+        return lines
+
+    def _renderCopyC(self, field, macro, encode):
+        """ Render the C code which encodes (or decodes) a single (flattened) codec field """
+
+        width = field.field.itemSize
+
+        member = "value->" + field.name
+
+        if width == 1 or field.field.encoding == PidgenDataElement.DATA_STR:
+            # Single bytes (and strings) are copied directly, with no byte order
+            address = member if field.count is not None or field.field.encoding == PidgenDataElement.DATA_STR else "&" + member
+
+            if encode:
+                return ["    memcpy(data + {o}, {a}, {s});".format(o=field.offset, a=address, s=field.size)]
+            else:
+                return ["    memcpy({a}, data + {o}, {s});".format(o=field.offset, a=address, s=field.size)]
+
+        if field.count is None:
+            encoded = "data + {o}".format(o=field.offset)
+            address = "&" + member
+            indent = "    "
+            lines = []
+        else:
+            encoded = "data + {o} + i * {w}".format(o=field.offset, w=width)
+            address = "&{m}[i]".format(m=member)
+            indent = "        "
+            lines = ["    for (i = 0; i < {n}; i++)".format(n=field.count)]
+
+        if encode:
+            lines.append(indent + "pidgenCopy({d}, {s}, {w}, {m}_SWAP);".format(d=encoded, s=address, w=width, m=macro))
+        else:
+            lines.append(indent + "pidgenCopy({d}, {s}, {w}, {m}_SWAP);".format(d=address, s=encoded, w=width, m=macro))
+
+        return lines
+
+    def codecPlan(self, packed=True):
+        """
+        Return the (flattened) codec plan used to encode and decode this struct.
+        The plan is compiled once, and cached for as long as the layout is valid.
+
+        kwargs:
+            packed - If True (default), use the packed layout. Otherwise, use the naturally aligned layout.
+
+        Return:
+            PidgenCodecPlan object, or None if this struct cannot be encoded with a fixed layout
+        """
+
+        packed = bool(packed)
+
+        layout = self.layout(packed=packed)
+
+        plan = self._plans.get(packed, None)
+
+        if plan is None or plan.layout is not layout:
+            plan = compilePlan(self, packed=packed)
+            self._plans[packed] = plan
+
+        return plan
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lightweight timing instrumentation.
+
+Timing is disabled by default. When disabled, each instrumented section costs
+a single function call (start() returns None, and stop() returns immediately).
+
+Usage:
+    started = timing.start()
+    ...
+    timing.stop("xml", started, key=filename, path=filename)
+
+Sections may be nested. For each phase, both the total (inclusive) time and the
+'self' time (excluding any nested sections) are recorded.
+
+Optionally, each section can be:
+- Attributed to a key within the phase (e.g. the element class), see details()
+- Attributed to a file path (the self time is added to that file), see files()
+"""
+
+from time import perf_counter
+
+# Timing is OFF by default
+ENABLED = False
+
+# Accumulated [total time, self time, call count] for each phase
+_PHASES = {}
+
+# Accumulated [total time, self time, call count] for each key, within each phase
+_DETAILS = {}
+
+# Accumulated self time for each file path
+_FILES = {}
+
+# Stack of currently open sections - [start time, time spent in nested sections]
+_STACK = []
+
+
+def enable(on=True):
+    """ Turn timing instrumentation on (or off) """
+
+    global ENABLED
+    ENABLED = bool(on)
+
+
+def reset():
+    """ Discard any accumulated timing information """
+
+    _PHASES.clear()
+    _DETAILS.clear()
+    _FILES.clear()
+    del _STACK[:]
+
+
+def start():
+    """
+    Start timing a section.
+
+    Return:
+        Handle for the section (to be passed to stop()), or None if timing is disabled
+    """
+
+    if ENABLED:
+        section = [perf_counter(), 0.0]
+        _STACK.append(section)
+        return section
+
+    return None
+
+
+def _accumulate(table, name, elapsed, own):
+
+    entry = table.get(name, None)
+
+    if entry is None:
+        table[name] = [elapsed, own, 1]
+    else:
+        entry[0] += elapsed
+        entry[1] += own
+        entry[2] += 1
+
+
+def stop(phase, started, key=None, path=None):
+    """
+    Finish timing a section, and add the elapsed time to the given phase.
+
+    Args:
+        phase - Name of the phase
+        started - Value returned by start()
+
+    kwargs:
+        key - Optional key to attribute the time to (within the phase)
+        path - Optional file path to attribute the (self) time to
+    """
+
+    if started is None:
+        return
+
+    elapsed = perf_counter() - started[0]
+
+    # Close the section (and any sections left open by an exception)
+    while _STACK:
+        if _STACK.pop() is started:
+            break
+
+    own = elapsed - started[1]
+
+    # Time spent in this section is excluded from the self time of the enclosing section
+    if _STACK:
+        _STACK[-1][1] += elapsed
+
+    _accumulate(_PHASES, phase, elapsed, own)
+
+    if key is not None:
+        _accumulate(_DETAILS.setdefault(phase, {}), key, elapsed, own)
+
+    if path is not None:
+        _FILES[path] = _FILES.get(path, 0) + own
+
+
+def _entries(table):
+    return dict((name, {'time': entry[0], 'self': entry[1], 'count': entry[2]}) for name, entry in table.items())
+
+
+def results():
+    """
+    Return the accumulated timing information.
+
+    Return:
+        Dict of phase name -> {'time': seconds, 'self': seconds, 'count': calls}
+    """
+
+    return _entries(_PHASES)
+
+
+def details(phase):
+    """
+    Return the accumulated timing information for each key within a phase.
+
+    Return:
+        Dict of key -> {'time': seconds, 'self': seconds, 'count': calls}
+    """
+
+    return _entries(_DETAILS.get(phase, {}))
+
+
+def files():
+    """
+    Return the accumulated (self) time attributed to each file.
+
+    Return:
+        Dict of file path -> seconds
+    """
+
+    return dict(_FILES)
+
+
+def report(slowest=10):
+    """
+    Format the accumulated timing information as a human-readable report.
+
+    kwargs:
+        slowest - Number of slowest files to list
+
+    Return:
+        Report text (string)
+    """
+
+    lines = []
+
+    def table(title, entries):
+
+        lines.append("")
+        lines.append("{t:<32}{c:>10}{tot:>14}{s:>14}".format(t=title, c="Calls", tot="Total (ms)", s="Self (ms)"))
+
+        ordered = sorted(entries.items(), key=lambda item: item[1]['self'], reverse=True)
+
+        for name, entry in ordered:
+            lines.append("{n:<32}{c:>10}{tot:>14.2f}{s:>14.2f}".format(
+                n=str(name),
+                c=entry['count'],
+                tot=entry['time'] * 1000,
+                s=entry['self'] * 1000
+            ))
+
+    # Self times partition the total time, so they are reported for each phase
+    phases = sorted(_PHASES.items(), key=lambda item: item[1][1], reverse=True)
+
+    lines.append("{t:<32}{c:>10}{s:>14}".format(t="Phase", c="Calls", s="Time (ms)"))
+
+    for phase, entry in phases:
+        lines.append("{n:<32}{c:>10}{s:>14.2f}".format(n=phase, c=entry[2], s=entry[1] * 1000))
+
+    lines.append("{n:<32}{c:>10}{s:>14.2f}".format(n="total", c="", s=sum(entry[1] for _, entry in phases) * 1000))
+
+    for phase in ["construct", "validate", "lookup"]:
+        if phase in _DETAILS:
+            table("{p} (by type)".format(p=phase.capitalize()), details(phase))
+
+    construct = details("construct")
+
+    if construct:
+        lines.append("")
+        lines.append("{t:<32}{c:>10}".format(t="Elements (by type)", c="Count"))
+
+        for name, entry in sorted(construct.items(), key=lambda item: item[1]['count'], reverse=True):
+            lines.append("{n:<32}{c:>10}".format(n=name, c=entry['count']))
+
+    xml = details("xml")
+
+    if _FILES:
+        lines.append("")
+        lines.append("{t:<56}{x:>12}{tot:>12}".format(t="Slowest files", x="XML (ms)", tot="Total (ms)"))
+
+        ordered = sorted(_FILES.items(), key=lambda item: item[1], reverse=True)
+
+        for path, elapsed in ordered[:slowest]:
+            lines.append("{p:<56}{x:>12.2f}{tot:>12.2f}".format(
+                p=str(path),
+                x=xml.get(path, {}).get('time', 0) * 1000,
+                tot=elapsed * 1000
+            ))
+
+    return "\n".join(lines).strip("\n")
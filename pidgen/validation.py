@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compiled validators for decoded packets.
+
+The validation limits of every field in a packet (minValue / maxValue / range)
+are compiled into a single Python function, which checks an entire decoded record.
+
+A batch form checks a set of NumPy columns at once,
+returning a mask of valid rows and the first violating field for each row.
+
+Limits are expressed as in-memory values, so records should be decoded with convert=True.
+"""
+
+from . import debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PidgenValidator():
+    """
+    Compiled validator for a codec plan.
+
+    Attributes:
+        checks - List of (name, minimum, maximum, is_array) for each validated field
+        names - Names of the validated fields
+        optional - Names of the validated fields which may not be present in a record
+        source - Python source of the compiled validation function
+        constants - Limit values referenced by the source (e.g. {'lo0': 0, 'hi0': 100})
+    """
+
+    def __init__(self, plan, fields=None, optional=()):
+        """
+        Args:
+            plan - Codec plan
+
+        kwargs:
+            fields - Fields to validate (default = every field of the plan)
+            optional - Names of fields which may not be present in a record (e.g. conditional fields)
+        """
+
+        self.checks = []
+
+        if fields is None:
+            fields = plan.fields
+
+        for field in fields:
+
+            lo, hi = field.element.limits
+
+            if lo is None and hi is None:
+                continue
+
+            self.checks.append((field.name, lo, hi, field.count is not None))
+
+        self.names = [check[0] for check in self.checks]
+        self.optional = set(name for name in self.names if name in optional)
+
+        # Limits are bound as constants (lo0, hi0, ...) rather than written into the source,
+        # so that any value (e.g. inf or nan) can be used
+        self.constants = {}
+
+        self.source = self._generate()
+
+        namespace = dict(self.constants)
+        exec(compile(self.source, "<pidgen validator '{n}'>".format(n=plan.layout.struct.name), "exec"), namespace)
+
+        self._validate = namespace["validate"]
+
+    def __call__(self, record):
+        return self._validate(record)
+
+    def __len__(self):
+        return len(self.checks)
+
+    def _generate(self):
+        """
+        Generate the source of the validation function.
+        """
+
+        lines = [
+            "def validate(record):",
+        ]
+
+        for idx, (name, lo, hi, is_array) in enumerate(self.checks):
+
+            conditions = []
+
+            lower, upper = ("min(v)", "max(v)") if is_array else ("v", "v")
+
+            if lo is not None:
+                self.constants["lo{i}".format(i=idx)] = lo
+                conditions.append("{v} < lo{i}".format(v=lower, i=idx))
+
+            if hi is not None:
+                self.constants["hi{i}".format(i=idx)] = hi
+                conditions.append("{v} > hi{i}".format(v=upper, i=idx))
+
+            condition = " or ".join(conditions)
+
+            if name in self.optional:
+                # Fields which are not present are not validated
+                lines.append("    v = record.get({n!r}, None)".format(n=name))
+                condition = "v is not None and ({c})".format(c=condition)
+            else:
+                lines.append("    v = record[{n!r}]".format(n=name))
+
+            lines.append("    if {c}:".format(c=condition))
+            lines.append("        return {n!r}".format(n=name))
+
+        lines.append("    return None")
+
+        return "\n".join(lines) + "\n"
+
+    def validate(self, record):
+        """
+        Validate a single decoded record.
+
+        Args:
+            record - Dict of (dotted) field names to in-memory values
+
+        Return:
+            Name of the first field which violates its limits, or None if the record is valid
+        """
+
+        return self._validate(record)
+
+    def isValid(self, record):
+        """ Return True if the decoded record is within all limits """
+        return self._validate(record) is None
+
+    def validateBatch(self, columns):
+        """
+        Validate a batch of decoded records.
+
+        Args:
+            columns - Dict of field names to NumPy columns (or a NumPy structured array)
+                      Optional fields which are not included in the columns are not validated
+
+        Return:
+            (mask, fields) tuple, where
+            - mask is a boolean array (True for rows which are valid)
+            - fields is an object array containing the name of the first violating field for each row (None if valid)
+        """
+
+        if numpy is None:
+            debug.error("NumPy is required for batch validation")
+            return None
+
+        first = None
+
+        for idx, (name, lo, hi, is_array) in enumerate(self.checks):
+
+            if name in self.optional and isinstance(columns, dict) and name not in columns:
+                continue
+
+            column = numpy.asarray(columns[name])
+
+            if first is None:
+                first = numpy.full(column.shape[0], -1, dtype=numpy.intp)
+
+            bad = numpy.zeros(column.shape, dtype=bool)
+
+            if lo is not None:
+                bad |= column < lo
+            if hi is not None:
+                bad |= column > hi
+
+            if is_array:
+                bad = bad.reshape(bad.shape[0], -1).any(axis=1)
+
+            first[(first < 0) & bad] = idx
+
+        if first is None:
+            # No validators - every row is valid
+            count = len(next(iter(columns.values()))) if isinstance(columns, dict) else len(columns)
+            first = numpy.full(count, -1, dtype=numpy.intp)
+
+        names = numpy.array(self.names + [None], dtype=object)
+
+        return first < 0, names[first]
+
+
+def compileValidator(plan, fields=None, optional=()):
+    """
+    Compile the validator for a codec plan.
+    Use PidgenCodecPlan.validator rather than calling this directly, so that the result is cached.
+    """
+
+    return PidgenValidator(plan, fields=fields, optional=optional)
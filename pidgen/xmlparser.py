@@ -6,43 +6,188 @@ which provides line-number information for the decoded xml structure(s).
 """
 
 from . import debug
+from . import timing
 
 import sys
 
-# It is required that this sys.modules value be set *before* importing ElementTree
-# Because, reasons?
-sys.modules['_elementtree'] = None
+from xml.parsers import expat
+import xml.etree.ElementTree as ElementTree
 
-import xml.etree.ElementTree as ElementTree  # noqa: E402
 
+# Attribute values up to this length are interned by CompactElement
+INTERN_LENGTH = 32
 
-class LineNumberingParser(ElementTree.XMLParser):
+
+class LineNumberingElement(ElementTree.Element):
+    """
+    XML element which can store line number information.
+    (The C-accelerated Element class does not allow extra attributes to be set)
+    """
+
+    __slots__ = [
+        "_start_line_number",
+        "_start_column_number",
+        "_start_byte_index",
+        "_end_line_number",
+        "_end_column_number",
+        "_end_byte_index",
+    ]
+
+
+class CompactElement():
+    """
+    Minimal copy of a (parsed) XML element, used once the XML tree has been released.
+
+    Only the tag, attributes and line number are retained - child elements are discarded.
+    The tag, attribute names and short attribute values are interned,
+    so that repeated strings (e.g. datatypes) are shared between elements.
+    """
+
+    __slots__ = [
+        "tag",
+        "attrib",
+        "_start_line_number",
+    ]
+
+    def __init__(self, element):
+
+        self.tag = sys.intern(element.tag)
+
+        attrib = {}
+
+        for key, value in element.attrib.items():
+            if len(value) <= INTERN_LENGTH:
+                value = sys.intern(value)
+
+            attrib[sys.intern(key)] = value
+
+        self.attrib = attrib
+
+        self._start_line_number = getattr(element, "_start_line_number", 0)
+
+    def __iter__(self):
+        # Child elements are not retained
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def keys(self):
+        return self.attrib.keys()
+
+    def items(self):
+        return self.attrib.items()
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+
+class LineNumberingParser():
     """
     Custom XML parser which scrapes line numbers from elements.
 
+    The expat parser is driven directly (rather than subclassing ElementTree.XMLParser),
+    so that line numbers are available regardless of whether the C-accelerated
+    ElementTree module has already been imported.
+
     Ref: https://stackoverflow.com/questions/6949395/is-there-a-way-to-get-a-line-number-from-an-elementtree-element
     """
 
-    def _start(self, *args, **kwargs):
-        # Here we assume the default XML parser which is expat
-        # and copy its element position attributes into output Elements
-        element = super(self.__class__, self)._start(*args, **kwargs)
+    def __init__(self):
+
+        self.builder = ElementTree.TreeBuilder(element_factory=LineNumberingElement)
+
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+
+        self.parser.StartElementHandler = self._start
+        self.parser.EndElementHandler = self._end
+        self.parser.CharacterDataHandler = self.builder.data
+
+    def _start(self, tag, attributes):
+        # Copy the expat position attributes into output Elements
+        element = self.builder.start(tag, attributes)
         element._start_line_number = self.parser.CurrentLineNumber
         element._start_column_number = self.parser.CurrentColumnNumber
         element._start_byte_index = self.parser.CurrentByteIndex
 
         return element
 
-    def _end(self, *args, **kwargs):
-        element = super(self.__class__, self)._end(*args, **kwargs)
+    def _end(self, tag):
+        element = self.builder.end(tag)
         element._end_line_number = self.parser.CurrentLineNumber
         element._end_column_number = self.parser.CurrentColumnNumber
         element._end_byte_index = self.parser.CurrentByteIndex
         return element
 
+    def feed(self, data):
+        try:
+            self.parser.Parse(data, False)
+        except expat.ExpatError as e:
+            raise ElementTree.ParseError(e)
+
+    def close(self):
+        try:
+            self.parser.Parse(b"", True)
+        except expat.ExpatError as e:
+            raise ElementTree.ParseError(e)
+
+        return self.builder.close()
+
 
 def parseXML(filename):
+
+    started = timing.start()
+
     try:
         return ElementTree.parse(filename, parser=LineNumberingParser())
     except ElementTree.ParseError as e:
         debug.error("Error parsing XML file - '{f}' : {e}".format(f=filename, e=e), fail=True)
+    finally:
+        timing.stop("xml", started, key=filename, path=filename)
+
+
+def scanXML(filename):
+    """
+    Perform a fast streaming scan of an XML file, without building an element tree.
+
+    Only the root tag and the top-level elements (directly under the root) are recorded.
+
+    Args:
+        filename - Path of the XML file
+
+    Return:
+        (root_tag, entries) tuple, where entries is a list of (tag, attributes, line) for each top-level element
+    """
+
+    parser = expat.ParserCreate()
+
+    # Use a dict so the nested handlers can modify the values
+    state = {'depth': 0, 'root': None}
+    entries = []
+
+    def start(tag, attributes):
+        if state['depth'] == 0:
+            state['root'] = tag
+        elif state['depth'] == 1:
+            entries.append((tag, attributes, parser.CurrentLineNumber))
+
+        state['depth'] += 1
+
+    def end(tag):
+        state['depth'] -= 1
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+
+    started = timing.start()
+
+    try:
+        with open(filename, 'rb') as xml_file:
+            parser.ParseFile(xml_file)
+    except expat.ExpatError as e:
+        debug.error("Error parsing XML file - '{f}' : {e}".format(f=filename, e=e), fail=True)
+    finally:
+        timing.stop("xml", started, key=filename, path=filename)
+
+    return state['root'], entries
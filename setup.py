@@ -28,7 +28,7 @@ setuptools.setup(
 
     license="MIT",
     
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*']),
     
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -42,5 +42,10 @@ setuptools.setup(
         'flake8'
     ],
 
+    extras_require={
+        # Batch encoding / decoding
+        'numpy': ['numpy'],
+    },
+
     python_requires=">=3.5"
 )
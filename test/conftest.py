@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from pidgen.protocolparser import PidgenProtocolParser
+
+
+@pytest.fixture
+def protocol_file(tmpdir):
+    """
+    Write protocol XML text to a file in the test directory.
+
+    Usage:
+        filename = protocol_file(text, name="protocol.xml")
+    """
+
+    def write(text, name="protocol.xml"):
+
+        filename = os.path.join(str(tmpdir), name)
+
+        with open(filename, "w") as f:
+            f.write(text)
+
+        return filename
+
+    return write
+
+
+@pytest.fixture
+def load_protocol(protocol_file):
+    """
+    Write protocol XML text to a file in the test directory, and parse it.
+
+    Usage:
+        protocol = load_protocol(text, name="protocol.xml", **kwargs)
+
+    Any kwargs are passed to PidgenProtocolParser.
+    """
+
+    def load(text, name="protocol.xml", **kwargs):
+        return PidgenProtocolParser(protocol_file(text, name=name), **kwargs)
+
+    return load
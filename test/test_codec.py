@@ -0,0 +1,667 @@
+# -*- coding: utf-8 -*-
+
+import random
+import struct
+
+import pytest
+
+from pidgen.codec import STRUCT_FORMAT
+from pidgen.protocolparser import PidgenProtocolParser
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Struct name='Vector'>
+    <Data name='x' datatype='i16'/>
+    <Data name='y' datatype='i32'/>
+</Struct>
+
+<Struct name='Pose'>
+    <Data name='position' struct='Vector'/>
+    <Data name='heading' datatype='u16'/>
+    <Struct name='extra'>
+        <Data name='quality' datatype='u8'/>
+        <Data name='origin' struct='Vector'/>
+    </Struct>
+</Struct>
+
+<Packet name='Deep' id='1'>
+    <Data name='flags' datatype='u8'/>
+    <Data name='pose' struct='Pose'/>
+    <Data name='history' struct='Vector' array='2'/>
+    <Data name='checksum' datatype='u64' default='0x55'/>
+</Packet>
+</Protocol>
+"""
+
+
+def reference_decode(layout, buffer, offset=0, prefix=""):
+    """
+    Reference decoder, which walks the layout recursively and unpacks each value individually.
+    """
+
+    values = {}
+
+    for field in layout.fields:
+        for idx in range(field.count):
+
+            name = prefix + field.name
+
+            if field.isArray:
+                name += "[{i}]".format(i=idx)
+
+            item_offset = offset + field.offset + idx * field.itemSize
+
+            if field.isStruct:
+                values.update(reference_decode(field.layout, buffer, item_offset, name + "."))
+            else:
+                values[name] = struct.unpack_from("<" + STRUCT_FORMAT[field.encoding], buffer, item_offset)[0]
+
+    return values
+
+
+def test_flat_plan(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Deep")
+
+    plan = packet.codecPlan()
+
+    assert plan.names == [
+        "flags",
+        "pose.position.x", "pose.position.y",
+        "pose.heading",
+        "pose.extra.quality", "pose.extra.origin.x", "pose.extra.origin.y",
+        "history[0].x", "history[0].y",
+        "history[1].x", "history[1].y",
+        "checksum",
+    ]
+
+    assert plan.format == "<BhiHBhihihiQ"
+    assert plan.size == packet.layout().size
+
+    # Plans are cached
+    assert packet.codecPlan() is plan
+
+
+def test_decode_matches_reference(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Deep")
+
+    rng = random.Random(1234)
+
+    for packed in [True, False]:
+
+        plan = packet.codecPlan(packed=packed)
+        layout = packet.layout(packed=packed)
+
+        assert plan.size == layout.size
+
+        for _ in range(20):
+            data = bytes(rng.getrandbits(8) for _ in range(plan.size))
+
+            assert plan.decode(data) == reference_decode(layout, data)
+
+            # Decoding at an offset within a larger buffer
+            assert plan.decode(b"\x00\x00" + data, offset=2) == reference_decode(layout, data)
+
+
+def test_encode(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Deep")
+
+    plan = packet.codecPlan(packed=False)
+
+    values = {
+        "flags": 3,
+        "pose.position.x": -5,
+        "pose.extra.origin.y": 100000,
+        "history[1].x": 7,
+    }
+
+    data = plan.encode(values)
+
+    decoded = plan.decode(data)
+
+    assert decoded["flags"] == 3
+    assert decoded["pose.position.x"] == -5
+    assert decoded["pose.extra.origin.y"] == 100000
+    assert decoded["history[1].x"] == 7
+    assert decoded["pose.heading"] == 0
+
+    # Missing values use the 'default' key
+    assert decoded["checksum"] == 0x55
+
+    buffer = bytearray(plan.size + 4)
+    plan.encodeInto(buffer, 4, values)
+
+    assert bytes(buffer[4:]) == data
+
+
+ARRAY_PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='Snapshot' id='2'>
+    <Data name='channel' datatype='u8'/>
+    <Data name='samples' datatype='i16' array='256'/>
+    <Data name='gain' datatype='f32' array='2' default='1.5'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_array_fields(load_protocol):
+
+    protocol = load_protocol(ARRAY_PROTOCOL)
+
+    plan = protocol.findItemByName("PidgenPacket", "Snapshot").codecPlan()
+
+    assert plan.format == "<B256h2f"
+    assert plan.names == ["channel", "samples", "gain"]
+    assert plan.size == 1 + 512 + 8
+
+    samples = tuple(range(-128, 128))
+
+    data = plan.encode({"channel": 4, "samples": samples})
+
+    decoded = plan.decode(data)
+
+    assert decoded["channel"] == 4
+    assert decoded["samples"] == samples
+    assert decoded["gain"] == (1.5, 1.5)
+
+
+def test_array_batch(load_protocol):
+
+    numpy = pytest.importorskip("numpy")
+
+    protocol = load_protocol(ARRAY_PROTOCOL)
+
+    plan = protocol.findItemByName("PidgenPacket", "Snapshot").codecPlan()
+
+    assert plan.dtype.itemsize == plan.size
+
+    samples = numpy.arange(3 * 256, dtype=numpy.int16).reshape(3, 256)
+
+    data = plan.encodeBatch({"channel": [1, 2, 3], "samples": samples})
+
+    assert len(data) == 3 * plan.size
+
+    # Batch encoding matches single-packet encoding
+    assert data[plan.size:2 * plan.size] == plan.encode({"channel": 2, "samples": tuple(samples[1])})
+
+    records = plan.decodeBatch(data)
+
+    assert list(records["channel"]) == [1, 2, 3]
+    assert (records["samples"] == samples).all()
+    assert (records["gain"] == 1.5).all()
+
+    # Re-encoding a decoded batch is lossless
+    assert plan.encodeBatch(records) == data
+
+
+def test_view(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    plan = protocol.findItemByName("PidgenPacket", "Deep").codecPlan()
+
+    data = bytes(random.Random(5).getrandbits(8) for _ in range(plan.size))
+    decoded = plan.decode(data)
+
+    view = plan.view(b"\xFF" + data, offset=1)
+
+    for name in plan.names:
+        assert name in view
+        assert view[name] == decoded[name]
+
+    assert "missing" not in view
+    assert view.get("missing", 7) == 7
+    assert view.decode() == decoded
+
+
+CONDITIONAL_PROTOCOL = """<Protocol name='test' version='1'>
+<Enum name='Mode'>
+    <Value name='IDLE'/>
+    <Value name='FAST'/>
+    <Value name='SLOW'/>
+</Enum>
+
+<Packet name='Optional' id='3'>
+    <Data name='flags' datatype='u8'/>
+    <Data name='mode' datatype='u8'/>
+    <Data name='extra' datatype='u32' dependsOn='flags'/>
+    <Data name='speed' scaler='10' datatype='f32' encoding='u16' dependsOn='mode=FAST,SLOW'/>
+    <Data name='checksum' datatype='u8'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_conditional_plan(load_protocol):
+
+    protocol = load_protocol(CONDITIONAL_PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Optional")
+
+    plan = packet.codecPlan()
+
+    assert plan.size is None
+    assert plan.prefix.format == "<BB"
+    assert plan.conditions == [("flags", None), ("mode", frozenset([1, 2]))]
+
+    # Every combination of conditions is precompiled
+    assert len(plan._tails) == 4
+    assert plan.minSize == 3
+    assert plan.maxSize == 9
+
+    data = plan.encode({"flags": 0, "mode": 0, "extra": 5, "speed": 20, "checksum": 7})
+
+    assert len(data) == 3
+    assert plan.decode(data) == {"flags": 0, "mode": 0, "checksum": 7}
+
+    data = plan.encode({"flags": 1, "mode": 2, "extra": 5, "speed": 2.5, "checksum": 7}, convert=True)
+
+    assert len(data) == 9
+    assert plan.sizeOf(data) == 9
+    assert plan.decode(data) == {"flags": 1, "mode": 2, "extra": 5, "speed": 25, "checksum": 7}
+    assert plan.decode(b"\x00" + data, offset=1, convert=True)["speed"] == 2.5
+
+    # The tail of the packet is aligned correctly
+    aligned = packet.codecPlan(packed=False)
+
+    data = aligned.encode({"flags": 1, "mode": 0, "extra": 5, "checksum": 7})
+
+    assert len(data) == 12
+    assert aligned.decode(data) == {"flags": 1, "mode": 0, "extra": 5, "checksum": 7}
+
+
+def test_nested_conditional(load_protocol, capsys):
+
+    protocol = load_protocol("""<Protocol name='test' version='1'>
+<Struct name='Inner'>
+    <Data name='flags' datatype='u8'/>
+    <Data name='extra' datatype='u32' dependsOn='flags'/>
+</Struct>
+
+<Struct name='Outer'>
+    <Data name='inner' struct='Inner'/>
+</Struct>
+
+<Packet name='Nested' id='1'>
+    <Data name='id' datatype='u8'/>
+    <Data name='outer' struct='Outer'/>
+</Packet>
+</Protocol>
+""")
+
+    # Conditional fields are supported at the top level of a struct
+    assert protocol.findItemByName("PidgenStruct", "Inner").codecPlan() is not None
+
+    capsys.readouterr()
+
+    assert protocol.findItemByName("PidgenPacket", "Nested").codecPlan() is None
+
+    output = capsys.readouterr().out
+
+    assert "field 'extra' (within 'outer') is conditional - conditional fields must be at the top level of the packet" in output
+    assert "does not have a fixed size" not in output
+
+
+STRING_PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='Label' id='1'>
+    <Data name='id' datatype='u16'/>
+    <Data name='tag' datatype='string' length='8' charset='ascii'/>
+    <Data name='value' datatype='f32'/>
+</Packet>
+
+<Packet name='Message' id='2'>
+    <Data name='id' datatype='u16'/>
+    <Data name='text' datatype='string'/>
+    <Data name='level' datatype='u8'/>
+    <Data name='source' datatype='string' lengthPrefix='u16' length='300' default='none'/>
+    <Data name='extra' datatype='string' length='4' dependsOn='level'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_string_fields(load_protocol):
+
+    protocol = load_protocol(STRING_PROTOCOL)
+
+    # Fixed-capacity strings have a fixed layout
+    plan = protocol.findItemByName("PidgenPacket", "Label").codecPlan()
+
+    assert plan.format == "<H8sf"
+    assert plan.size == 14
+
+    data = plan.encode({"id": 3, "tag": "abc", "value": 1.5}, convert=True)
+
+    assert plan.decode(data) == {"id": 3, "tag": b"abc\x00\x00\x00\x00\x00", "value": 1.5}
+    assert plan.decode(data, convert=True)["tag"] == "abc"
+
+    # Strings which exceed the capacity are rejected (rather than truncated)
+    assert plan.decode(plan.encode({"tag": "abcdefgh"}, convert=True), convert=True)["tag"] == "abcdefgh"
+
+    with pytest.raises(struct.error):
+        plan.encode({"tag": "abcdefghi"}, convert=True)
+
+    with pytest.raises(struct.error):
+        plan.encodeInto(bytearray(plan.size), 0, {"tag": b"abcdefghi"})
+
+    # Length-prefixed strings
+    plan = protocol.findItemByName("PidgenPacket", "Message").codecPlan()
+
+    assert plan.size is None
+    assert plan.minSize == 2 + 1 + 1 + 2
+    assert plan.maxSize is None
+
+    data = plan.encode({"id": 1, "text": u"héllo", "level": 0}, convert=True)
+
+    assert len(data) == 2 + (1 + 6) + 1 + (2 + 4)
+    assert plan.sizeOf(data) == len(data)
+    assert plan.sizeOf(data[:5]) is None
+
+    assert plan.decode(data) == {"id": 1, "text": u"héllo".encode("utf-8"), "level": 0, "source": b"none"}
+    assert plan.decode(b"\xff" + data, offset=1, convert=True)["text"] == u"héllo"
+
+    # Conditional fields after a variable-length string
+    data = plan.encode({"id": 1, "text": b"", "level": 1, "source": b"x", "extra": b"ab"})
+
+    assert len(data) == 2 + 1 + 1 + (2 + 1) + 4
+    assert plan.sizeOf(bytearray(data)) == len(data)
+    assert plan.decode(data, convert=True) == {"id": 1, "text": "", "level": 1, "source": "x", "extra": "ab"}
+
+    with pytest.raises(struct.error):
+        plan.encode({"text": b"x" * 256})
+
+    # Multi-byte characters count towards the capacity of a fixed-capacity string
+    with pytest.raises(struct.error):
+        plan.encode({"level": 1, "extra": u"abcé"}, convert=True)
+
+    with pytest.raises(struct.error):
+        plan.decode(data[:6])
+
+
+def test_string_columns(load_protocol):
+
+    pytest.importorskip("numpy")
+
+    protocol = load_protocol(STRING_PROTOCOL)
+
+    plan = protocol.findItemByName("PidgenPacket", "Label").codecPlan()
+
+    data = plan.encode({"id": 3, "tag": "abc", "value": 1.5}, convert=True)
+
+    columns = plan.decodeColumns(data * 3)
+
+    assert list(columns["tag"]) == ["abc"] * 3
+
+    with pytest.raises(struct.error):
+        plan.encodeBatch({"tag": ["abc", "abcdefghi"]}, convert=True)
+
+
+ENDIAN_PROTOCOL = """<Protocol name='test' version='1' endian='big'>
+<Struct name='Vector'>
+    <Data name='x' datatype='i16'/>
+    <Data name='y' datatype='f32'/>
+</Struct>
+
+<Packet name='Big' id='1'>
+    <Data name='id' datatype='u16'/>
+    <Data name='position' struct='Vector'/>
+    <Data name='samples' datatype='u32' array='2' scaler='10'/>
+    <Data name='name' datatype='string' length='4'/>
+</Packet>
+
+<Packet name='Little' id='2' endian='little'>
+    <Data name='id' datatype='u16'/>
+    <Data name='position' struct='Vector'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_endian(protocol_file):
+
+    filename = protocol_file(ENDIAN_PROTOCOL)
+
+    protocol = PidgenProtocolParser(filename)
+
+    big = protocol.findItemByName("PidgenPacket", "Big")
+    little = protocol.findItemByName("PidgenPacket", "Little")
+
+    # The byte order is inherited from the protocol, unless overridden
+    assert big.byteOrder == ">"
+    assert little.byteOrder == "<"
+    assert protocol.findItemByName("PidgenStruct", "Vector").byteOrder == ">"
+
+    values = {"id": 0x0102, "position.x": -2, "position.y": 1.5}
+
+    assert little.codecPlan().encode(values) == b"\x02\x01\xfe\xff\x00\x00\xc0\x3f"
+
+    plan = big.codecPlan()
+
+    assert plan.format == ">Hhf2I4s"
+
+    values.update({"samples": (10, 70000), "name": b"ab\x00\x00"})
+
+    data = plan.encode(values)
+
+    assert data.startswith(b"\x01\x02\xff\xfe\x3f\xc0\x00\x00\x00\x00\x00\x0a\x00\x01\x11\x70")
+    assert plan.decode(data) == values
+
+    # The setting can also be provided directly (overriding the protocol file)
+    protocol = PidgenProtocolParser(filename, endian="little")
+
+    assert protocol.findItemByName("PidgenPacket", "Big").codecPlan().format == "<Hhf2I4s"
+
+    # C code swaps bytes according to the packet byte order
+    code = big.renderC()
+
+    assert "#define BIG_SIZE 20" in code
+    assert "#define BIG_SWAP (PIDGEN_HOST_BIG_ENDIAN == 0)" in code
+    assert "    Vector position;" in code
+    assert "pidgenCopy(&value->samples[i], data + 8 + i * 4, 4, BIG_SWAP);" in code
+    assert "#define LITTLE_SWAP (PIDGEN_HOST_BIG_ENDIAN != 0)" in little.renderC()
+
+
+def test_endian_columns(load_protocol):
+
+    pytest.importorskip("numpy")
+
+    plan = load_protocol(ENDIAN_PROTOCOL).findItemByName("PidgenPacket", "Big").codecPlan()
+
+    data = plan.encode({"id": 0x0102, "position.x": -2, "position.y": 1.5, "samples": (10, 70000), "name": b"ab"})
+
+    # Batches are byte-swapped to the host byte order
+    columns = plan.decodeColumns(data * 3)
+
+    assert columns["id"].dtype.isnative
+    assert list(columns["id"]) == [0x0102] * 3
+    assert columns["samples"].tolist() == [[1, 7000]] * 3
+    assert list(columns["name"]) == ["ab"] * 3
+
+    assert plan.encodeBatch(columns, convert=True) == data * 3
+
+
+BITFIELD_PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='Status' id='1'>
+    <Data name='id' datatype='u8'/>
+    <Data name='mode' datatype='u8' bits='3'/>
+    <Data name='armed' datatype='u8' bits='1'/>
+    <Data name='level' datatype='s8' bits='4'/>
+    <Data name='temperature' datatype='s16' bits='10' scaler='4'/>
+    <Data name='error' datatype='u16' bits='6'/>
+    <Data name='flag' datatype='u16' bits='1'/>
+    <Data name='count' datatype='u16'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_bitfields(load_protocol):
+
+    protocol = load_protocol(BITFIELD_PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Status")
+
+    layout = packet.layout()
+
+    # Bitfields are packed into storage words (a new word is started when a bitfield does not fit)
+    assert [(f.offset, f.bitOffset) for f in layout.fields] == [(0, 0), (1, 0), (1, 3), (1, 4), (2, 0), (2, 10), (4, 0), (6, 0)]
+    assert layout.size == 8
+
+    plan = packet.codecPlan()
+
+    assert plan.format == "<BBhHH"
+    assert [name for name, fields in plan.words] == ["id", "mode|armed|level", "temperature|error", "flag", "count"]
+
+    values = {"id": 1, "mode": 5, "armed": 1, "level": -3, "temperature": -512, "error": 63, "flag": 1, "count": 9}
+
+    data = plan.encode(values)
+
+    assert data == struct.pack("<BBhHH", 1, 5 | (1 << 3) | (13 << 4), 512 + (63 << 10) - 65536, 1, 9)
+    assert plan.decode(data) == values
+    assert plan.decode(data, convert=True)["temperature"] == -128
+
+    # Values which do not fit within a bitfield are rejected (rather than masked)
+    for name, value in [("mode", 8), ("level", 8), ("level", -9), ("error", 64), ("armed", -1)]:
+        with pytest.raises(struct.error):
+            plan.encode(dict(values, **{name: value}))
+
+    assert plan.decode(plan.encode(dict(values, level=-8, error=0)))["level"] == -8
+
+    view = plan.view(data)
+
+    assert view["level"] == -3
+    assert view["error"] == 63
+
+    code = packet.renderC()
+
+    assert "    int8_t level : 4;" in code
+    assert "        bits |= (uint16_t)((((uint16_t) value->error) & 0x3F) << 10);" in code
+
+
+def test_bitfield_columns(load_protocol):
+
+    pytest.importorskip("numpy")
+
+    plan = load_protocol(BITFIELD_PROTOCOL).findItemByName("PidgenPacket", "Status").codecPlan()
+
+    values = {"id": 1, "mode": 5, "armed": 1, "level": -3, "temperature": -512, "error": 63, "flag": 1, "count": 9}
+
+    data = plan.encode(values)
+
+    # Bitfields are extracted from entire columns at once
+    columns = plan.decodeColumns(data * 4)
+
+    assert columns["level"].tolist() == [-3] * 4
+    assert columns["temperature"].tolist() == [-128] * 4
+    assert columns["error"].tolist() == [63] * 4
+
+    assert plan.encodeBatch(columns, convert=True) == data * 4
+
+    # Values which do not fit within a bitfield are rejected (rather than masked)
+    for name, value in [("mode", 8), ("level", 8), ("level", -9), ("error", 64), ("armed", -1)]:
+        with pytest.raises(struct.error):
+            plan.encodeBatch(dict((key, [values[key], value if key == name else values[key]]) for key in values))
+
+
+def test_decode_into(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Deep")
+
+    plan = packet.codecPlan()
+
+    rng = random.Random(99)
+
+    data = bytes(rng.getrandbits(8) for _ in range(plan.size))
+
+    expected = plan.decode(data)
+
+    record = plan.decodeInto(data)
+
+    assert record.asDict() == expected
+    assert record.pose_position_x == expected["pose.position.x"]
+    assert record.history_1__y == expected["history[1].y"]
+
+    # Records have no __dict__
+    with pytest.raises(AttributeError):
+        record.unknown = 1
+
+    # Records are reused via the pool
+    plan.pool.release(record)
+
+    assert plan.decodeInto(b"\x00" + data, offset=1) is record
+    assert plan.pool.allocated == 1
+
+    other = plan.recordClass()
+
+    assert plan.decodeInto(data, record=other) == record
+
+    # Conversions, and bitfields
+    plan = load_protocol(BITFIELD_PROTOCOL, name="bits.xml").findItemByName("PidgenPacket", "Status").codecPlan()
+
+    data = plan.encode({"id": 1, "mode": 5, "armed": 1, "level": -3, "temperature": -512, "error": 63, "flag": 1, "count": 9})
+
+    assert plan.decodeInto(data, convert=True).asDict() == plan.decode(data, convert=True)
+
+
+def test_decode_row(load_protocol):
+
+    pytest.importorskip("numpy")
+
+    plan = load_protocol(PROTOCOL).findItemByName("PidgenPacket", "Deep").codecPlan()
+
+    rng = random.Random(99)
+
+    data = bytes(rng.getrandbits(8) for _ in range(plan.size))
+
+    # Decoding into a preallocated NumPy row
+    rows = plan.newRows(3)
+
+    plan.decodeRow(data, rows, 1)
+
+    assert rows[1]["history[1].y"] == plan.decode(data)["history[1].y"]
+    assert rows[0]["flags"] == 0
+
+
+COLLISION_PROTOCOL = """<Protocol name='test' version='1'>
+<Struct name='Vector'>
+    <Data name='x' datatype='i16'/>
+    <Data name='y' datatype='i16'/>
+</Struct>
+
+<Packet name='Collision' id='1'>
+    <Data name='v' struct='Vector'/>
+    <Data name='v_x' datatype='u8'/>
+    <Data name='update' datatype='u8'/>
+    <Data name='NAMES' datatype='u8'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_record_names(load_protocol):
+
+    plan = load_protocol(COLLISION_PROTOCOL, name="collision.xml").findItemByName("PidgenPacket", "Collision").codecPlan()
+
+    # Colliding and reserved names are mangled, rather than shadowing each other (or the record methods)
+    assert plan.recordClass.ATTRIBUTES == ("v_x", "v_y", "v_x_", "update_", "NAMES_")
+
+    values = {"v.x": -5, "v.y": 7, "v_x": 200, "update": 3, "NAMES": 4}
+
+    record = plan.decodeInto(plan.encode(values))
+
+    assert record.v_x == -5
+    assert record.v_x_ == 200
+    assert record.update_ == 3
+    assert record.asDict() == values
+
+    assert record.update(dict(values, update=9)).update_ == 9
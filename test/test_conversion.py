@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import warnings
+from fractions import Fraction
+
+import pytest
+
+from pidgen.conversion import PidgenConversion
+from pidgen.data import PidgenDataElement as Data
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='telemetry' id='1'>
+  <Data name='current' datatype='u32' encoding='f16' scaler='10' default='2500' units='0.1A'/>
+  <Data name='voltage' encoding='f32'/>
+  <Data name='temperature' datatype='f32' encoding='i16' scaler='100'/>
+  <Data name='counts' datatype='u16' encoding='u8' scaler='1/4' array='3'/>
+</Packet>
+</Protocol>
+"""
+
+
+def load(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    return protocol.findItemByName("PidgenPacket", "telemetry").codecPlan()
+
+
+def test_integer_conversion():
+
+    conversion = PidgenConversion(Data.DATA_S32, Data.DATA_S8, Fraction(1, 10))
+
+    assert conversion.integer
+
+    assert conversion.encode(125) == 13
+    assert conversion.encode(-125) == -13
+    assert conversion.encode(10000) == 127
+    assert conversion.decode(-13) == -130
+
+
+def test_scalar_conversion(load_protocol):
+
+    plan = load(load_protocol)
+
+    data = plan.encode({"current": 1234, "voltage": 12.5, "temperature": -3.217, "counts": (4, 9, 2000)}, convert=True)
+
+    encoded = plan.decode(data)
+
+    assert encoded["current"] == 12336.0  # float16 precision
+    assert encoded["temperature"] == -322
+    assert encoded["counts"] == (1, 2, 255)
+
+    decoded = plan.decode(data, convert=True)
+
+    assert decoded["current"] == 1234
+    assert decoded["voltage"] == 12.5
+    assert decoded["temperature"] == pytest.approx(-3.22)
+    assert decoded["counts"] == (4, 8, 1020)
+
+    # The in-memory default is converted (2500 * 10 is narrowed to 24992 in float16)
+    assert plan.decode(plan.encode({}), convert=True)["current"] == 2499
+
+
+def test_column_conversion(load_protocol):
+
+    numpy = pytest.importorskip("numpy")
+
+    plan = load(load_protocol)
+
+    columns = {
+        "current": numpy.array([0, 1234, 2500], dtype=numpy.uint32),
+        "voltage": numpy.array([1.0, 2.0, 3.0], dtype=numpy.float32),
+        "temperature": numpy.array([-3.217, 0.0, 99.999]),
+        "counts": numpy.array([[4, 9, 2000], [0, 1, 2], [3, 5, 7]], dtype=numpy.uint16),
+    }
+
+    data = plan.encodeBatch(columns, convert=True)
+
+    # Vectorized conversion matches the scalar conversion
+    for idx in range(3):
+        row = dict((name, columns[name][idx].tolist()) for name in columns)
+        assert data[idx * plan.size:(idx + 1) * plan.size] == plan.encode(row, convert=True)
+
+    decoded = plan.decodeColumns(data)
+
+    assert decoded["current"].dtype == numpy.uint32
+    assert list(decoded["current"]) == [0, 1234, 2499]
+    assert list(decoded["temperature"]) == pytest.approx([-3.22, 0.0, 100.0])
+    assert decoded["counts"].tolist() == [[4, 8, 1020], [0, 0, 4], [4, 4, 8]]
+
+
+def test_non_finite_conversion():
+
+    conversion = PidgenConversion(Data.DATA_F64, Data.DATA_S16, Fraction(100))
+
+    # NaN is converted to zero, and infinite values saturate
+    assert conversion.encode(float("nan")) == 0
+    assert conversion.encode(float("inf")) == 32767
+    assert conversion.encode(float("-inf")) == -32768
+
+    conversion = PidgenConversion(Data.DATA_U8, Data.DATA_F32, Fraction(1, 2))
+
+    assert conversion.decode(float("nan")) == 0
+    assert conversion.decode(float("inf")) == 255
+    assert conversion.decode(float("-inf")) == 0
+
+
+def test_non_finite_column_conversion():
+
+    numpy = pytest.importorskip("numpy")
+
+    conversion = PidgenConversion(Data.DATA_F64, Data.DATA_S16, Fraction(100))
+
+    values = [float("nan"), float("inf"), float("-inf"), 1.5]
+
+    # Non-finite values are handled explicitly (rather than raising a warning in the cast)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        column = conversion.encodeColumn(numpy.array(values))
+
+    # Vectorized conversion matches the scalar conversion
+    assert column.tolist() == [conversion.encode(value) for value in values] == [0, 32767, -32768, 150]
+
+
+def test_float16_overflow(load_protocol):
+
+    plan = load(load_protocol)
+
+    # 7000 * 10 overflows float16, and is saturated to the largest finite float16 value
+    data = plan.encode({"current": 7000}, convert=True)
+
+    assert plan.decode(data)["current"] == 65504.0
+    assert plan.decode(data, convert=True)["current"] == 6550
+
+    conversion = PidgenConversion(Data.DATA_F64, Data.DATA_F16)
+
+    assert conversion.encode(-1e6) == -65504.0
+    assert conversion.encode(float("inf")) == float("inf")
+
+
+def test_float16_overflow_column(load_protocol):
+
+    numpy = pytest.importorskip("numpy")
+
+    plan = load(load_protocol)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        data = plan.encodeBatch({"current": numpy.array([7000, 1234], dtype=numpy.uint32)}, convert=True)
+
+    # Vectorized conversion matches the scalar conversion
+    assert data[:plan.size] == plan.encode({"current": 7000}, convert=True)
+
+    assert plan.decodeColumns(data)["current"].tolist() == [6550, 1234]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Enum name="StatusCodes" prefix="STATUS_">
+  <Value name='OK' value='1'/>
+  <Value name="warning"/>
+  <Value name="ERROR"/>
+  <Value name="CRITICAL" value="0x08"/>
+  <Value name="FATAL"/>
+</Enum>
+
+<Enum name="Sparse">
+  <Value name='low' value='-5'/>
+  <Value name='high' value='100000'/>
+  <Value name='alias' value='-5'/>
+</Enum>
+</Protocol>
+"""
+
+
+def load(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    return protocol.findItemByName("PidgenEnumeration", "StatusCodes"), protocol.findItemByName("PidgenEnumeration", "Sparse")
+
+
+def test_lookup_tables(load_protocol):
+
+    status, sparse = load(load_protocol)
+
+    assert [(item.name, value) for item, value in status.computedValues] == [
+        ("OK", 1), ("warning", 2), ("ERROR", 3), ("CRITICAL", 8), ("FATAL", 9)
+    ]
+
+    assert status.values[3].value == 8
+
+    assert status.isDense
+    assert status.nameOf(2) == "STATUS_WARNING"
+    assert status.nameOf(4) is None
+    assert status.nameOf(0) is None
+    assert status.nameOf(100) is None
+    assert status.valueOf("STATUS_FATAL") == 9
+    assert status.valueOf("FATAL") == 9
+
+    assert not sparse.isDense
+    assert sparse.nameOf(-5) == "LOW"
+    assert sparse.nameOf(100000) == "HIGH"
+    assert sparse.nameOf(7) is None
+
+
+def test_int_enum(load_protocol):
+
+    status, sparse = load(load_protocol)
+
+    Status = status.intEnum()
+
+    assert Status(8).name == "STATUS_CRITICAL"
+    assert Status.STATUS_OK == 1
+
+    Sparse = sparse.intEnum()
+
+    # Duplicate values are aliases
+    assert Sparse.ALIAS is Sparse.LOW
+
+
+def test_render_c(load_protocol):
+
+    status, sparse = load(load_protocol)
+
+    code = status.renderC()
+
+    assert "STATUS_CRITICAL = 8," in code
+    assert "static const char* const names[9]" in code
+
+    code = sparse.renderC()
+
+    assert "switch (value)" in code
+    assert "case 100000:" in code
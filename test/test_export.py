@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from pidgen.export import exportCapture, loadStore, PidgenColumnWriter
+from pidgen.packet import PidgenPacket
+from pidgen.stream import PidgenStream
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='Status' id='0x10'>
+    <Data name='mode' datatype='u8'/>
+    <Data name='voltage' datatype='f64' encoding='u16' scaler='100' units='V'/>
+    <Data name='values' datatype='i16' array='3'/>
+</Packet>
+
+<Packet name='Log' id='0x20'>
+    <Data name='level' datatype='u8'/>
+    <Data name='extra' datatype='u32' dependsOn='level'/>
+    <Data name='message' datatype='string'/>
+</Packet>
+</Protocol>
+"""
+
+
+def capture(tmpdir, load_protocol, count=500):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packets = protocol.getChildren(PidgenPacket, traverse_children=True)
+
+    stream = PidgenStream(packets)
+
+    data = bytearray()
+
+    for idx in range(count):
+        data += stream.encode(0x10, {"mode": idx % 256, "voltage": 1200 + idx, "values": (idx, -idx, 7)})
+
+        if idx % 10 == 0:
+            data += stream.encode(0x20, {"level": idx % 3, "extra": idx, "message": "x" * (idx // 10)}, convert=True)
+
+    path = os.path.join(str(tmpdir), "capture.bin")
+
+    with open(path, "wb") as f:
+        f.write(data)
+
+    return packets, path
+
+
+def test_column_writer(tmpdir):
+
+    numpy = pytest.importorskip("numpy")
+
+    path = os.path.join(str(tmpdir), "column.npy")
+
+    writer = PidgenColumnWriter(path)
+
+    writer.append(numpy.array(["a", "bb"]))
+    writer.append(numpy.array(["a much longer string"]))
+    writer.close()
+
+    assert list(numpy.load(path)) == ["a", "bb", "a much longer string"]
+
+
+def test_export(tmpdir, load_protocol):
+
+    numpy = pytest.importorskip("numpy")
+
+    packets, path = capture(tmpdir, load_protocol)
+
+    for npz in [False, True]:
+
+        out = os.path.join(str(tmpdir), "npz" if npz else "npy")
+
+        # Small chunks, so that frames are split across chunks
+        counts = exportCapture(packets, path, out, chunk_size=100, npz=npz)
+
+        assert counts == {"Status": 500, "Log": 50}
+
+        columns, metadata = loadStore(os.path.join(out, "Status.npz" if npz else "Status"))
+
+        assert metadata["count"] == 500
+        assert metadata["fields"]["voltage"]["units"] == "V"
+
+        assert list(columns["mode"][:3]) == [0, 1, 2]
+        assert columns["values"].shape == (500, 3)
+        assert list(columns["values"][499]) == [499, -499, 7]
+        assert abs(columns["voltage"][1] - 12.01) < 1e-9
+
+        columns, metadata = loadStore(os.path.join(out, "Log.npz" if npz else "Log"))
+
+        assert list(columns["level"][:4]) == [0, 1, 2, 0]
+        assert list(columns["extra__present"][:4]) == [False, True, True, False]
+        assert columns["extra"][1] == 10
+        assert columns["message"][49] == "x" * 49
+
+        # Packets decoded one at a time use the in-memory datatype of each field
+        assert columns["level"].dtype == numpy.uint8
+        assert columns["extra"].dtype == numpy.uint32
+        assert metadata["fields"]["level"]["dtype"] == "|u1"
+
+
+def test_missing_capture(tmpdir, load_protocol):
+
+    packets, path = capture(tmpdir, load_protocol, count=1)
+
+    out = os.path.join(str(tmpdir), "out")
+
+    assert exportCapture(packets, path + ".missing", out) is None
+    assert not os.path.exists(out)
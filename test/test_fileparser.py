@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from pidgen.fileparser import compileIgnoreMatcher, scanDirectory, walkDirectory
+from pidgen.protocolparser import PidgenProtocolParser
+from pidgen.struct import PidgenStruct
+
+
+def write(path, text):
+    dirname = os.path.dirname(path)
+
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def test_ignore_matcher():
+
+    ignore = compileIgnoreMatcher("build, *.BAK ,old_*")
+
+    assert ignore("build")
+    assert ignore("BUILD")
+    assert ignore("file.bak")
+    assert ignore("old_packets.xml")
+    assert not ignore("packets.xml")
+
+    # Empty patterns ignore nothing
+    assert not compileIgnoreMatcher(None)("build")
+
+
+def test_scan_directory(tmpdir):
+
+    root = str(tmpdir)
+
+    write(os.path.join(root, "a.xml"), "<Protocol/>")
+    write(os.path.join(root, "b.XML"), "<Protocol/>")
+    write(os.path.join(root, "image.png"), "")
+    write(os.path.join(root, "sub", "c.xml"), "<Protocol/>")
+    write(os.path.join(root, "skip", "d.xml"), "<Protocol/>")
+
+    files, dirs = scanDirectory(root, compileIgnoreMatcher(["skip"]))
+
+    assert [os.path.basename(f) for f in files] == ["a.xml", "b.XML"]
+    assert [os.path.basename(d) for d in dirs] == ["sub"]
+
+    listing = walkDirectory(root, compileIgnoreMatcher(["skip"]), max_workers=4)
+
+    assert len(listing) == 2
+    assert [os.path.basename(f) for f in listing[os.path.join(root, "sub")][0]] == ["c.xml"]
+
+
+def test_require_directory(tmpdir):
+
+    root = str(tmpdir)
+
+    write(os.path.join(root, "protocol.xml"), """<Protocol name='test' version='1'>
+<Require dir='defs' ignore='*_old.xml'/>
+</Protocol>""")
+
+    write(os.path.join(root, "defs", "a.xml"), "<Protocol><Struct name='A'/></Protocol>")
+    write(os.path.join(root, "defs", "a_old.xml"), "<Protocol><Struct name='A'/></Protocol>")
+    write(os.path.join(root, "defs", "nested", "b.xml"), "<Protocol><Packet name='B' id='1'/></Protocol>")
+    write(os.path.join(root, "defs", "nested", "notes.txt"), "")
+
+    protocol = PidgenProtocolParser(os.path.join(root, "protocol.xml"))
+
+    names = sorted([s.name for s in protocol.getChildren(PidgenStruct, traverse_children=True)])
+
+    assert names == ["A", "B"]
+
+
+def test_lazy_loading(tmpdir):
+
+    root = str(tmpdir)
+
+    write(os.path.join(root, "protocol.xml"), """<Protocol name='test' version='1'>
+<Require file='a.xml'/>
+</Protocol>""")
+
+    write(os.path.join(root, "a.xml"), """<Protocol>
+<Require file='b.xml'/>
+<Struct name='StructA'><Data name='x' datatype='u8'/></Struct>
+</Protocol>""")
+
+    write(os.path.join(root, "b.xml"), "<Protocol><Packet name='PacketB' id='1'/></Protocol>")
+
+    protocol = PidgenProtocolParser(os.path.join(root, "protocol.xml"), lazy=True)
+
+    # Files are indexed, but not yet parsed
+    assert len(protocol.files) == 3
+    assert sorted(protocol.symbol_index.keys()) == ["packetb", "structa"]
+    assert len(protocol.getChildren(PidgenStruct, traverse_children=True)) == 0
+
+    packet = protocol.findItemByName(PidgenStruct, "packetb")
+
+    assert packet is not None
+    assert packet.name == "PacketB"
+
+    # Only the file defining the packet has been parsed
+    assert [s.name for s in protocol.getChildren(PidgenStruct, traverse_children=True)] == ["PacketB"]
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pidgen.crc import getAlgorithm, ALGORITHMS
+from pidgen.framing import PidgenFramedStream
+from pidgen.packet import PidgenPacket
+
+
+PROTOCOL = """<Protocol name='test' version='1' endian='{endian}'>
+<Framing sync='0xEB90' id='u8' length='u16' crc='{crc}'/>
+
+<Packet name='Status' id='0x10'>
+    <Data name='mode' datatype='u8'/>
+    <Data name='uptime' datatype='u32'/>
+</Packet>
+
+<Packet name='Sample' id='0x11'>
+    <Data name='values' datatype='i16' array='3'/>
+</Packet>
+</Protocol>
+"""
+
+# Standard check values (CRC of the ASCII string "123456789")
+CHECK = {
+    "crc8": 0xF4,
+    "crc16-ccitt": 0x29B1,
+    "crc16-xmodem": 0x31C3,
+    "crc16-modbus": 0x4B37,
+    "crc32": 0xCBF43926,
+    "crc32c": 0xE3069283,
+    "sum8": 0xDD,
+    "xor8": 0x31,
+}
+
+
+def load(load_protocol, crc="crc16-ccitt", endian="little"):
+
+    protocol = load_protocol(PROTOCOL.format(crc=crc, endian=endian))
+
+    return PidgenFramedStream(protocol.getChildren(PidgenPacket, traverse_children=True), protocol.framing)
+
+
+def test_crc_check_values():
+
+    assert sorted(CHECK.keys()) == sorted(ALGORITHMS.keys())
+
+    data = b"123456789"
+
+    for name, value in CHECK.items():
+
+        crc = getAlgorithm(name)
+
+        assert crc.compute(data) == value
+
+        # Table-driven implementation (rather than the standard library)
+        if getattr(crc, "_native", None) is not None:
+            native = crc._native
+            crc._native = None
+
+            try:
+                assert crc.compute(data) == value
+            finally:
+                crc._native = native
+
+
+def test_crc_batch():
+
+    numpy = pytest.importorskip("numpy")
+
+    data = b"123456789"
+
+    rows = numpy.frombuffer(data * 3, dtype=numpy.uint8).reshape(3, len(data))
+
+    for name, value in CHECK.items():
+        assert list(getAlgorithm(name).computeBatch(rows)) == [value] * 3
+
+
+def test_framing(load_protocol):
+
+    for endian in ["little", "big"]:
+
+        stream = load(load_protocol, endian=endian)
+
+        assert stream.sync == b"\xEB\x90"
+        assert stream.overhead == 2 + 3 + 2
+
+        frame = stream.encode(0x10, {"mode": 2, "uptime": 1000})
+
+        assert len(frame) == stream.overhead + 5
+        assert frame[:2] == b"\xEB\x90"
+
+        if endian == "big":
+            assert frame[2:5] == b"\x10\x00\x05"
+            assert frame[-2:] == stream.crc.compute(frame[2:-2]).to_bytes(2, "big")
+        else:
+            assert frame[2:5] == b"\x10\x05\x00"
+            assert frame[-2:] == stream.crc.compute(frame[2:-2]).to_bytes(2, "little")
+
+        assert stream.decode(frame) == [(0x10, {"mode": 2, "uptime": 1000})]
+
+
+def test_resync(load_protocol):
+
+    stream = load(load_protocol)
+
+    metrics = stream.enableMetrics()
+
+    frames = [
+        stream.encode(0x10, {"mode": 1, "uptime": 100}),
+        stream.encode(0x11, {"values": (1, -2, 3)}),
+        stream.encode(0x10, {"mode": 3, "uptime": 300}),
+    ]
+
+    # Corrupt the second frame, and add some noise (including a false sync word)
+    corrupt = bytearray(frames[1])
+    corrupt[6] ^= 0xFF
+
+    data = b"\x00\x01" + frames[0] + b"\xEB\x90\x55" + bytes(corrupt) + frames[2]
+
+    results = stream.decode(data)
+
+    assert results == [
+        (0x10, {"mode": 1, "uptime": 100}),
+        (0x10, {"mode": 3, "uptime": 300}),
+    ]
+
+    assert stream.crcErrors >= 1
+    assert stream.resyncs >= 1
+    assert stream.consumed == len(data)
+
+    # Framing errors are included in the metrics
+    assert metrics.crcErrors == stream.crcErrors
+    assert metrics.resyncs == stream.resyncs
+
+    text = metrics.prometheus()
+
+    assert "pidgen_crc_errors_total {n}".format(n=stream.crcErrors) in text
+    assert "pidgen_resyncs_total {n}".format(n=stream.resyncs) in text
+
+    # Fragmented feed, split at every possible position
+    expected = results
+
+    for split in range(len(data)):
+
+        stream = load(load_protocol)
+
+        assert stream.feed(data[:split]) + stream.feed(data[split:]) == expected
+
+
+def test_validate_batch(load_protocol):
+
+    pytest.importorskip("numpy")
+
+    for crc in ["crc16-ccitt", "crc32", "crc8", "sum8"]:
+
+        stream = load(load_protocol, crc=crc, endian="big")
+
+        data = bytearray()
+
+        for idx in range(20):
+            if idx % 2:
+                data += stream.encode(0x10, {"mode": idx, "uptime": idx * 1000})
+            else:
+                data += stream.encode(0x11, {"values": (idx, -idx, 0)})
+
+        # Corrupt the payload of a few frames (leaving the header intact)
+        starts, sizes, ids = stream.scan(bytes(data))
+
+        assert len(starts) == 20
+        assert list(ids[:2]) == [0x11, 0x10]
+
+        for idx in [3, 8, 15]:
+            data[starts[idx] + 6] ^= 0x01
+
+        valid = stream.validateBatch(bytes(data), starts, sizes)
+
+        assert [idx for idx in range(20) if not valid[idx]] == [3, 8, 15]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from pidgen import ir
+from pidgen.protocolparser import PidgenProtocolParser
+
+
+def test_pack_roundtrip():
+
+    model = {
+        "none": None,
+        "bools": [True, False],
+        "ints": [0, 1, 127, 128, 65535, 2 ** 32, 2 ** 63, -1, -32, -33, -2 ** 40],
+        "float": 1.5,
+        "text": ["", "a" * 31, "b" * 300, u"µA"],
+        "bytes": b"\x00\x01",
+        "nested": {"list": list(range(20)), "map": dict((str(i), i) for i in range(20))},
+    }
+
+    out = []
+    ir._pack(model, out)
+    data = b"".join(out)
+
+    decoded, idx = ir._unpack(memoryview(data), 0)
+
+    assert idx == len(data)
+    assert decoded == model
+
+
+def test_export_import(tmpdir, protocol_file):
+
+    root = str(tmpdir)
+
+    filename = protocol_file("""<Protocol name='test' version='2'>
+<Enum name='Ids' prefix='PKT_'>
+    <Value name='a' value='5'/>
+    <Value name='b'/>
+</Enum>
+<Packet name='Status' id='PKT_B'>
+    <Data name='x' datatype='u8'/>
+    <Data name='y' datatype='u32' encoding='i16' units='mV'/>
+</Packet>
+</Protocol>""")
+
+    protocol = PidgenProtocolParser(filename)
+
+    path = os.path.join(root, "protocol.ir")
+
+    ir.exportIR(protocol, path)
+
+    loaded = ir.importIR(path)
+
+    assert loaded.name == "test"
+    assert loaded.version == "2"
+
+    packet = loaded.find("packets", "status")
+
+    assert packet["size"] == 3
+    assert [(f["name"], f["encoding"], f["offset"]) for f in packet["fields"]] == [("x", "U8", 0), ("y", "S16", 1)]
+    assert loaded.source(packet) == (filename, 6)
+
+    enum = loaded.find("enumerations", "ids")
+
+    assert [(v["title"], v["value"]) for v in enum["values"]] == [("PKT_A", 5), ("PKT_B", 6)]
+
+    # Corrupt files are rejected
+    with open(path, "r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\xff")
+
+    assert ir.importIR(path) is None
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from pidgen.data import PidgenDataElement
+from pidgen.xmlparser import ElementTree
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Struct name='Vector'>
+    <Data name='x' datatype='i16'/>
+    <Data name='y' datatype='i16'/>
+</Struct>
+
+<Packet name='Sample' id='1'>
+    <Data name='flags' datatype='u8'/>
+    <Data name='value' datatype='u32'/>
+    <Data name='position' struct='Vector'/>
+    <Data name='history' struct='Vector' array='3'/>
+    <Struct name='inner'>
+        <Data name='a' datatype='u8'/>
+        <Data name='b' datatype='f64'/>
+    </Struct>
+    <Data name='samples' datatype='u16' array='4'/>
+    <Data name='tail' datatype='u8'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_packed_layout(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Sample")
+
+    layout = packet.layout()
+
+    offsets = [(f.name, f.offset, f.size) for f in layout.fields]
+
+    assert offsets == [
+        ("flags", 0, 1),
+        ("value", 1, 4),
+        ("position", 5, 4),
+        ("history", 9, 12),
+        ("inner", 21, 9),
+        ("samples", 30, 8),
+        ("tail", 38, 1),
+    ]
+
+    assert layout.size == 39
+    assert layout.field("history").isArray
+    assert layout.field("history").layout.struct.name == "Vector"
+
+    # Layouts are cached
+    assert packet.layout() is layout
+
+
+def test_aligned_layout(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Sample")
+
+    layout = packet.layout(packed=False)
+
+    offsets = [(f.name, f.offset, f.padding) for f in layout.fields]
+
+    assert offsets == [
+        ("flags", 0, 0),
+        ("value", 4, 3),
+        ("position", 8, 0),
+        ("history", 12, 0),
+        ("inner", 24, 0),
+        ("samples", 40, 0),
+        ("tail", 48, 0),
+    ]
+
+    assert layout.field("inner").size == 16
+    assert layout.alignment == 8
+    assert layout.padding == 7
+    assert layout.size == 56
+
+
+def test_layout_invalidation(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "Sample")
+    vector = protocol.findItemByName("PidgenStruct", "Vector")
+
+    layout = packet.layout()
+
+    # Changing a referenced struct invalidates the packet layout
+    PidgenDataElement(vector, xml=ElementTree.fromstring("<Data name='z' datatype='i16'/>"))
+
+    assert not layout.isValid()
+
+    updated = packet.layout()
+
+    assert updated is not layout
+    assert vector.encodedSize == 6
+    assert updated.size == 39 + 2 * 4
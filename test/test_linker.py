@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from pidgen import debug
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Enum name='PacketIds' prefix='PKT_'>
+    <Value name='STATUS' value='5'/>
+    <Value name='COMMAND'/>
+</Enum>
+
+<Struct name='Vector'>
+    <Data name='x' datatype='i16'/>
+    <Data name='y' datatype='i16'/>
+</Struct>
+
+<Packet name='Status' id='PKT_STATUS'>
+    <Data name='mode' datatype='u8'/>
+    <Data name='position' struct='Vector'/>
+    <Data name='extra' datatype='u16' dependsOn='mode=1,2'/>
+    <Struct name='details'>
+        <Data name='speed' datatype='u16' requires='MODE'/>
+    </Struct>
+</Packet>
+
+<Packet name='Command' id='COMMAND'>
+    <Data name='target' struct='Vectr'/>
+    <Data name='value' datatype='u8' dependsOn='flag'/>
+</Packet>
+
+<Packet name='Other' id='PKT_MISSING'>
+    <Data name='value' datatype='u8'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_link(load_protocol):
+
+    errors = debug.getErrorCount()
+
+    protocol = load_protocol(PROTOCOL)
+
+    # All unresolved references are reported as a single error
+    assert debug.getErrorCount() == errors + 1
+
+    index = protocol.linker.index
+
+    vector = index.lookup("struct", "vector")[0]
+
+    status = protocol.findItemByName("PidgenPacket", "Status")
+
+    assert status.idTarget is index.lookup("value", "PKT_STATUS")[0]
+    assert status.packetIdValue == 5
+
+    mode, position, extra = status.data
+
+    assert position.structTarget is vector
+    assert position.referencedStruct is vector
+
+    assert extra.dependency == ("mode", ["1", "2"])
+    assert extra.dependencyTarget is mode
+
+    # Dependencies can be resolved from an enclosing struct
+    speed = status.structs[0].data[0]
+    assert speed.dependencyTarget is mode
+
+    # Plain enumeration value names can be used
+    command = protocol.findItemByName("PidgenPacket", "Command")
+    assert command.packetIdValue == 6
+
+    unresolved = dict((key + ":" + name, suggestion) for (element, key, name, choices), suggestion in zip(protocol.linker.unresolved, protocol.linker.suggestions()))
+
+    assert sorted(unresolved.keys()) == ["dependsOn:flag", "id:PKT_MISSING", "struct:Vectr"]
+
+    assert unresolved["struct:Vectr"] == "vector"
+    assert unresolved["dependsOn:flag"] is None
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from benchmarks.synthetic import generateProtocol, packetName
+from pidgen import memory
+from pidgen.packet import PidgenPacket
+from pidgen.protocolparser import PidgenProtocolParser
+from pidgen.xmlparser import CompactElement
+
+
+def test_compact_mode(tmpdir):
+
+    master = generateProtocol(str(tmpdir), files=3, packets=3, fields=5)
+
+    full = PidgenProtocolParser(master)
+    compact = PidgenProtocolParser(master, compact=True)
+
+    full_packets = full.getChildren(PidgenPacket, traverse_children=True)
+    compact_packets = compact.getChildren(PidgenPacket, traverse_children=True)
+
+    assert len(compact_packets) == len(full_packets) == 9
+
+    for a, b in zip(full_packets, compact_packets):
+
+        assert isinstance(b.xml, CompactElement)
+        assert "xml" not in b.kwargs
+
+        assert b.name == a.name
+        assert b.tag == a.tag
+        assert b.lineNumber == a.lineNumber
+        assert b.comment == a.comment
+
+        assert b.codecPlan().format == a.codecPlan().format
+
+    # Repeated strings are shared between elements
+    a, b = [packet.children[0] for packet in compact_packets[:2]]
+    assert a.xml.tag is b.xml.tag
+    assert a.xml.get("struct") is b.xml.get("struct")
+
+    # Compact mode uses less memory
+    full_bytes = sum(entry["bytes"] for entry in memory.measure(full).values())
+    compact_bytes = sum(entry["bytes"] for entry in memory.measure(compact).values())
+
+    assert compact_bytes < full_bytes
+
+
+def test_compact_lazy(tmpdir):
+
+    master = generateProtocol(str(tmpdir), files=3, packets=2, fields=3)
+
+    protocol = PidgenProtocolParser(master, lazy=True, compact=True)
+
+    packet = protocol.findItemByName(PidgenPacket, packetName(1, 1))
+
+    assert isinstance(packet.xml, CompactElement)
+    assert isinstance(packet.parent.xml, CompactElement)
+
+
+def test_memory_report(tmpdir):
+
+    master = generateProtocol(str(tmpdir), files=2, packets=2, fields=3)
+
+    protocol, current, peak = memory.trace(PidgenProtocolParser, master)
+
+    assert 0 < current <= peak
+
+    stats = memory.measure(protocol)
+
+    assert stats["PidgenPacket"]["count"] == 4
+    assert stats["PidgenProtocolParser"]["count"] == 1
+
+    text = memory.report(stats, current, peak)
+
+    assert "PidgenDataElement" in text
+    assert "Not attributed to a type" in text
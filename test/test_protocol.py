@@ -1 +1,76 @@
 # -*- coding: utf-8 -*-
+
+import os
+
+from benchmarks.synthetic import generateProtocol, packetName
+from pidgen import timing
+from pidgen.fileparser import PidgenFileParser
+from pidgen.packet import PidgenPacket
+from pidgen.protocolparser import PidgenProtocolParser
+
+
+def test_synthetic_protocol(tmpdir):
+
+    master = generateProtocol(str(tmpdir), files=6, packets=3, fields=4, depth=3, enum_values=50)
+
+    protocol = PidgenProtocolParser(master)
+
+    # All files are included through the <Require> chains
+    assert len(protocol.getChildren(PidgenFileParser, traverse_children=True)) == 6
+    assert len(protocol.files) == 7
+
+    packets = protocol.getChildren(PidgenPacket, traverse_children=True)
+
+    assert len(packets) == 18
+
+    packet = protocol.findItemByName(PidgenPacket, packetName(4, 2))
+
+    assert packet.packetId == "PKT_ID_14"
+    assert len(packet.layout().fields) == 4
+
+    enum = protocol.findItemByName("PidgenEnumeration", "PacketIds")
+
+    assert len(enum.computedValues) == 50
+
+
+def test_phase_timing(tmpdir):
+
+    master = generateProtocol(os.path.join(str(tmpdir), "protocol"), files=2, packets=2)
+
+    timing.reset()
+    timing.enable(True)
+
+    try:
+        PidgenProtocolParser(master)
+        phases = timing.results()
+        construct = timing.details("construct")
+        files = timing.files()
+        report = timing.report()
+    finally:
+        timing.enable(False)
+        timing.reset()
+
+    assert phases["protocol"]["count"] == 1
+    assert phases["xml"]["count"] == 3
+    assert phases["validate"]["count"] > 10
+
+    assert phases["xml"]["time"] < phases["protocol"]["time"]
+
+    # Self times exclude nested sections, so they add up to the total time
+    total = sum(phase["self"] for phase in phases.values())
+    assert abs(total - phases["protocol"]["time"]) < 1e-6
+
+    assert construct["PidgenPacket"]["count"] == 4
+    assert construct["PidgenFileParser"]["count"] == 2
+
+    # Time is attributed to the master file, and each included file
+    assert len(files) == 3
+    assert master in files
+
+    assert "Slowest files" in report
+    assert "PidgenPacket" in report
+
+    # Disabled timing does not record anything
+    PidgenProtocolParser(master)
+
+    assert timing.results() == {}
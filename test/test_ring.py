@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pidgen.packet import PidgenPacket
+from pidgen.ring import PidgenSharedRing
+
+
+PROTOCOL = """<Protocol name='test' version='1' endian='big'>
+<Packet name='Status' id='1'>
+    <Data name='mode' datatype='u8'/>
+    <Data name='uptime' datatype='u32'/>
+</Packet>
+
+<Packet name='Log' id='2'>
+    <Data name='level' datatype='u8'/>
+    <Data name='message' datatype='string' length='32' lengthPrefix='u8'/>
+</Packet>
+</Protocol>
+"""
+
+
+def load(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    return protocol.getChildren(PidgenPacket, traverse_children=True)
+
+
+def test_ring(load_protocol):
+
+    packets = load(load_protocol)
+
+    with PidgenSharedRing(packets, capacity=4) as writer:
+
+        assert writer.slotSize == {1: 5, 2: 4 + 1 + 1 + 32}
+        assert all(offset % 64 == 0 for offset in writer.offsets.values())
+
+        # Attach a reader (as another process would, by name)
+        ring = PidgenSharedRing(packets, name=writer.name, create=False)
+
+        status = ring.reader(1)
+        log = ring.reader(2)
+
+        assert status.pending() == 0
+
+        for idx in range(3):
+            writer.write(1, {"mode": idx, "uptime": idx * 100})
+
+        writer.write(2, {"level": 1, "message": "hello"}, convert=True)
+
+        assert ring.sequence(1) == 3
+        assert status.read() == [{"mode": idx, "uptime": idx * 100} for idx in range(3)]
+        assert log.read(convert=True) == [{"level": 1, "message": "hello"}]
+        assert status.read() == []
+
+        # Wrap around the end of the ring
+        for idx in range(3, 6):
+            writer.write(1, {"mode": idx, "uptime": idx * 100})
+
+        views = status.views()
+
+        assert [bytes(view)[0] for view in views] == [3, 4, 5]
+        assert status.check()
+
+        # Readers which fall behind skip the overwritten packets
+        for idx in range(6, 16):
+            writer.write(1, {"mode": idx, "uptime": 0})
+
+        assert not status.check()
+
+        views = status.views()
+
+        # The slot of the oldest packet (12) may be being overwritten by the writer
+        assert [bytes(view)[0] for view in views] == [13, 14, 15]
+        assert status.lost == 7
+
+        del views
+
+        ring.close()
+
+
+def test_ring_arrays(load_protocol):
+
+    pytest.importorskip("numpy")
+
+    packets = load(load_protocol)
+
+    with PidgenSharedRing(packets, capacity=4) as writer:
+
+        reader = writer.reader(1)
+
+        for idx in range(3):
+            writer.write(1, {"mode": idx, "uptime": idx * 100})
+
+        assert len(reader.read()) == 3
+
+        # Wrap around the end of the ring
+        for idx in range(3, 6):
+            writer.write(1, {"mode": idx, "uptime": idx * 100})
+
+        arrays = reader.arrays()
+
+        assert [len(a) for a in arrays] == [1, 2]
+        assert [int(mode) for a in arrays for mode in a["mode"]] == [3, 4, 5]
+        assert [int(uptime) for a in arrays for uptime in a["uptime"]] == [300, 400, 500]
+        assert reader.check()
+
+        del arrays
+
+
+def test_ring_partial_write(load_protocol):
+
+    packets = load(load_protocol)
+
+    with PidgenSharedRing(packets, capacity=4) as writer:
+
+        reader = writer.reader(1)
+
+        for idx in range(4):
+            writer.write(1, {"mode": idx, "uptime": idx})
+
+        # Writer is preempted after writing part of packet 4 (into the slot of packet 0), before it is published
+        offset = writer.offsets[1]
+        writer.shm.buf[offset:offset + 4] = b"\x63\x00\x00\x00"
+
+        assert writer.sequence(1) == 4
+        assert reader.pending() == 3
+
+        assert reader.read() == [{"mode": idx, "uptime": idx} for idx in range(1, 4)]
+        assert reader.lost == 1
+        assert reader.check()
+
+        # Packets which are overwritten while being decoded are discarded
+        reader = writer.reader(1)
+
+        views = reader.views()
+
+        assert [bytes(view)[0] for view in views] == [1, 2, 3]
+
+        writer.write(1, {"mode": 4, "uptime": 4})
+
+        assert not reader.check()
+
+        del views
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+from pidgen import debug
+from pidgen.data import PidgenDataElement
+from pidgen.element import SCHEMAS
+from pidgen.fileparser import PidgenFileParser
+from pidgen.packet import PidgenPacket
+from pidgen.struct import PidgenStruct
+
+
+def test_schema_tables():
+
+    schema = PidgenDataElement.SCHEMA
+
+    assert SCHEMAS["PidgenDataElement"] is schema
+
+    assert type(schema.allowedKeys) is frozenset
+    assert "name" in schema.allowedKeys
+    assert "name" in schema.requiredKeys
+    assert "comment" in schema.allowedKeys
+
+    assert schema.canonicalKey("Requires") == "dependson"
+    assert schema.canonicalKey("VerifyMinValue") == "minvalue"
+    assert schema.canonicalKey("units") == "units"
+
+    # Packets inherit the allowed children of structs
+    assert PidgenPacket.SCHEMA.allowedChildren == PidgenStruct.SCHEMA.allowedChildren
+    assert PidgenPacket.SCHEMA.requiredKeys == frozenset(["name", "id"])
+
+    assert PidgenFileParser.SCHEMA.canonicalChild("PKT") == "packet"
+    assert PidgenFileParser.SCHEMA.canonicalChild("Structure") == "struct"
+    assert PidgenFileParser.SCHEMA.canonicalChild("enum") == "enumeration"
+
+
+def test_validation(load_protocol):
+
+    errors = debug.getErrorCount()
+
+    protocol = load_protocol("""<Protocol Name='test' VERSION='1'>
+<Pkt NAME='Status' Id='1'>
+    <Data Name='mode' DataType='u8'/>
+    <Structure name='extra'>
+        <Data name='flags' datatype='u8'/>
+    </Structure>
+</Pkt>
+</Protocol>
+""")
+
+    # Required keys are matched case-insensitively
+    assert debug.getErrorCount() == errors
+
+    packet = protocol.findItemByName(PidgenPacket, "Status")
+
+    assert len(packet.data) == 1
+    assert len(packet.structs) == 1
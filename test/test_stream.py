@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+
+import pytest
+
+from pidgen.packet import PidgenPacket
+from pidgen.stream import PidgenStream, PidgenBatchStream
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Enum name='PacketIds' prefix='PKT_'>
+    <Value name='STATUS' value='0x10'/>
+    <Value name='SAMPLE'/>
+</Enum>
+
+<Packet name='Status' id='PKT_STATUS'>
+    <Data name='mode' datatype='u8'/>
+    <Data name='uptime' datatype='u32'/>
+</Packet>
+
+<Packet name='Sample' id='PKT_SAMPLE'>
+    <Data name='values' datatype='i16' array='3'/>
+</Packet>
+
+<Packet name='Raw' id='0x200'>
+    <Data name='value' datatype='u16'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_packet_id(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    assert protocol.findItemByName("PidgenPacket", "Status").packetIdValue == 0x10
+    assert protocol.findItemByName("PidgenPacket", "Sample").packetIdValue == 0x11
+    assert protocol.findItemByName("PidgenPacket", "Raw").packetIdValue == 0x200
+
+
+def test_stream(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    stream = PidgenStream(protocol.getChildren(PidgenPacket, traverse_children=True))
+
+    assert sorted(stream.plans.keys()) == [0x10, 0x11, 0x200]
+
+    data = stream.encode(0x10, {"mode": 2, "uptime": 1000})
+    data += stream.encode(0x11, {"values": (1, -2, 3)})
+    data += stream.encode(0x200, {"value": 0xABCD})
+
+    # Feed the data in small chunks - frames are only returned once complete
+    results = []
+
+    for idx in range(0, len(data), 3):
+        results += stream.feed(data[idx:idx + 3])
+
+    assert results == [
+        (0x10, {"mode": 2, "uptime": 1000}),
+        (0x11, {"values": (1, -2, 3)}),
+        (0x200, {"value": 0xABCD}),
+    ]
+
+    assert stream.errors == 0
+    assert len(stream._buffer) == 0
+
+    # Unknown packet ID
+    assert stream.feed(b"\x99\x99\x00\x00") == []
+    assert stream.errors == 1
+
+
+def test_conditional_frames(load_protocol):
+
+    protocol = load_protocol("""<Protocol name='test' version='1'>
+<Packet name='Optional' id='7'>
+    <Data name='flags' datatype='u8'/>
+    <Data name='extra' datatype='u32' dependsOn='flags'/>
+</Packet>
+</Protocol>
+""")
+
+    stream = PidgenStream(protocol.getChildren(PidgenPacket, traverse_children=True))
+
+    data = stream.encode(7, {"flags": 1, "extra": 99}) + stream.encode(7, {"flags": 0})
+
+    assert len(data) == (2 + 5) + (2 + 1)
+
+    results = []
+
+    for idx in range(len(data)):
+        results += stream.feed(data[idx:idx + 1])
+
+    assert results == [
+        (7, {"flags": 1, "extra": 99}),
+        (7, {"flags": 0}),
+    ]
+
+    # Decoding into reusable records (absent conditional fields are None)
+    records = stream.decodeRecords(data)
+
+    assert [(packet_id, record.flags, record.extra) for packet_id, record in records] == [(7, 1, 99), (7, 0, None)]
+
+    for packet_id, record in records:
+        stream.plans[packet_id].pool.release(record)
+
+    assert len(stream.plans[7].pool) == 2
+
+
+def test_string_frames(load_protocol):
+
+    protocol = load_protocol("""<Protocol name='test' version='1'>
+<Packet name='Log' id='3'>
+    <Data name='level' datatype='u8'/>
+    <Data name='message' datatype='string'/>
+</Packet>
+</Protocol>
+""")
+
+    stream = PidgenStream(protocol.getChildren(PidgenPacket, traverse_children=True))
+
+    messages = ["", "short", "a much longer message"]
+
+    data = b"".join(stream.encode(3, {"level": idx, "message": text}, convert=True) for idx, text in enumerate(messages))
+
+    results = []
+
+    for idx in range(0, len(data), 4):
+        results += stream.feed(data[idx:idx + 4], convert=True)
+
+    assert results == [(3, {"level": idx, "message": text}) for idx, text in enumerate(messages)]
+    assert len(stream._buffer) == 0
+
+
+def test_batch_frames(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    stream = PidgenBatchStream(protocol.getChildren(PidgenPacket, traverse_children=True), mtu=32)
+
+    packets = [(0x10, {"mode": idx, "uptime": idx * 10}) for idx in range(10)]
+    packets.insert(5, (0x11, {"values": (1, -2, 3)}))
+
+    frames = stream.encodeFrames(packets)
+
+    # Status frames are 7 bytes, Sample frames are 8 bytes
+    assert [len(f) for f in frames] == [28, 29, 21]
+    assert all(len(f) <= 32 for f in frames)
+
+    results = []
+
+    for frame in frames:
+        results += stream.decodeFrame(frame)
+
+    assert results == packets
+    assert stream.errors == 0
+
+    # Packets are accumulated until the frame is full
+    assert stream.add(0x200, {"value": 1}) is None
+    assert stream.count == 1
+    assert stream.flush() == stream.encode(0x200, {"value": 1})
+    assert stream.flush() is None
+
+    # Truncated frame
+    assert stream.decodeFrame(frames[0][:-1]) == results[:3]
+    assert stream.errors == 1
+
+    # A packet which cannot be encoded does not discard the buffered packets
+    for idx in range(4):
+        assert stream.add(0x10, {"mode": idx, "uptime": 0}) is None
+
+    with pytest.raises(struct.error):
+        stream.add(0x10, {"mode": 300, "uptime": 0})
+
+    assert stream.count == 4
+    assert stream.decodeFrame(stream.flush()) == [(0x10, {"mode": idx, "uptime": 0}) for idx in range(4)]
+
+
+def test_metrics(tmpdir, load_protocol):
+
+    protocol = load_protocol("""<Protocol name='test' version='1'>
+<Packet name='Status' id='1'>
+    <Data name='mode' datatype='u8' maxValue='5'/>
+    <Data name='uptime' datatype='u32'/>
+</Packet>
+
+<Packet name='Log' id='2'>
+    <Data name='message' datatype='string'/>
+</Packet>
+</Protocol>
+""")
+
+    stream = PidgenStream(protocol.getChildren(PidgenPacket, traverse_children=True))
+
+    assert stream.slots == {1: 0, 2: 1}
+
+    metrics = stream.enableMetrics(validate=True)
+
+    data = b"".join(stream.encode(1, {"mode": mode, "uptime": 0}) for mode in range(8))
+
+    data += stream.encode(2, {"message": "ok"}, convert=True)
+
+    results = stream.feed(data, convert=True)
+
+    assert len(results) == 9
+
+    snapshot = metrics.snapshot()
+
+    status = snapshot["packets"]["Status"]
+
+    assert status["frames"] == 8
+    assert status["bytes"] == 8 * 5
+    assert status["validationFailures"] == 2
+    assert sum(count for bound, count in status["histogram"]) == 8
+
+    log = snapshot["packets"]["Log"]
+
+    assert log["frames"] == 1
+    assert log["bytes"] == 3
+
+    # Unknown packet ID
+    assert stream.feed(b"\x99\x99\x00\x00") == []
+    assert metrics.unknown == 1
+
+    text = metrics.prometheus()
+
+    assert 'pidgen_frames_total{packet="Status",id="1"} 8' in text
+    assert 'pidgen_decode_seconds_count{packet="Log",id="2"} 1' in text
+    assert 'pidgen_decode_seconds_bucket{packet="Status",id="1",le="+Inf"} 8' in text
+
+    path = os.path.join(str(tmpdir), "pidgen.prom")
+
+    metrics.writePrometheus(path)
+
+    with open(path) as f:
+        assert f.read() == text
+
+    metrics.reset()
+
+    assert metrics.snapshot()["packets"]["Status"]["frames"] == 0
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+
+PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='status' id='1'>
+  <Data name='mode' datatype='u8' maxValue='3'/>
+  <Data name='temperature' datatype='f32' encoding='i16' scaler='10' range='-40, 125.5f'/>
+  <Data name='voltage' datatype='f32' minValue='10.5f'/>
+  <Data name='cells' datatype='u16' array='4' range='3000:4200'/>
+  <Data name='spare' datatype='u8'/>
+</Packet>
+</Protocol>
+"""
+
+
+def load(load_protocol):
+
+    protocol = load_protocol(PROTOCOL)
+
+    packet = protocol.findItemByName("PidgenPacket", "status")
+
+    assert packet.hasValidators()
+
+    return packet.codecPlan()
+
+
+def test_validator(load_protocol):
+
+    plan = load(load_protocol)
+
+    validator = plan.validator
+
+    assert validator.names == ["mode", "temperature", "voltage", "cells"]
+    assert plan.validator is validator
+
+    good = {"mode": 2, "temperature": 20.0, "voltage": 12.0, "cells": (3700, 3710, 3720, 3730)}
+
+    data = plan.encode(good, convert=True)
+
+    assert validator(plan.decode(data, convert=True)) is None
+
+    assert validator(dict(good, mode=4)) == "mode"
+    assert validator(dict(good, temperature=-40.5)) == "temperature"
+    assert validator(dict(good, voltage=10.0)) == "voltage"
+    assert validator(dict(good, cells=(3700, 4300, 3700, 3700))) == "cells"
+
+    # The first violating field is reported
+    assert validator(dict(good, voltage=0.0, mode=9)) == "mode"
+
+
+NON_FINITE_PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='limits' id='3'>
+  <Data name='a' datatype='f32' maxValue='nan'/>
+  <Data name='b' datatype='f64' range='0..1e400'/>
+  <Data name='c' datatype='f32' minValue='-inf' maxValue='2.5f'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_non_finite_limits(load_protocol):
+
+    plan = load_protocol(NON_FINITE_PROTOCOL, name="limits.xml").findItemByName("PidgenPacket", "limits").codecPlan()
+
+    elements = dict((field.name, field.element) for field in plan.fields)
+
+    assert elements["b"].limits == (0, float("inf"))
+    assert elements["c"].limits == (float("-inf"), 2.5)
+
+    validator = plan.validator
+
+    assert validator({"a": 1.0, "b": 1e300, "c": -1e30}) is None
+    assert validator({"a": 1.0, "b": -1.0, "c": 0.0}) == "b"
+    assert validator({"a": 1.0, "b": 1.0, "c": 3.0}) == "c"
+
+
+def test_batch_validator(load_protocol):
+
+    numpy = pytest.importorskip("numpy")
+
+    plan = load(load_protocol)
+
+    columns = {
+        "mode": numpy.array([0, 5, 1, 7]),
+        "temperature": numpy.array([0.0, 0.0, 130.0, 200.0]),
+        "voltage": numpy.array([11.0, 11.0, 11.0, 11.0]),
+        "cells": numpy.array([[3500] * 4, [3500] * 4, [3500] * 4, [3500, 3500, 100, 3500]]),
+    }
+
+    data = plan.encodeBatch(columns, convert=True)
+
+    mask, fields = plan.validator.validateBatch(plan.decodeColumns(data))
+
+    assert mask.tolist() == [True, False, False, False]
+    assert fields.tolist() == [None, "mode", "temperature", "mode"]
+
+
+CONDITIONAL_PROTOCOL = """<Protocol name='test' version='1'>
+<Packet name='event' id='2'>
+  <Data name='level' datatype='u8' maxValue='5'/>
+  <Data name='extra' datatype='u16' maxValue='1000' dependsOn='level'/>
+  <Data name='count' datatype='u8' range='1:10'/>
+</Packet>
+</Protocol>
+"""
+
+
+def test_conditional_validator(load_protocol):
+
+    plan = load_protocol(CONDITIONAL_PROTOCOL, name="conditional.xml").findItemByName("PidgenPacket", "event").codecPlan()
+
+    assert plan.dtype is None
+
+    validator = plan.validator
+
+    assert validator.names == ["level", "extra", "count"]
+    assert validator.optional == {"extra"}
+
+    # Conditional fields are only validated when they are present
+    assert validator(plan.decode(plan.encode({"level": 0, "count": 3}))) is None
+    assert validator(plan.decode(plan.encode({"level": 2, "extra": 1001, "count": 3}))) == "extra"
+    assert validator(plan.decode(plan.encode({"level": 2, "extra": 1000, "count": 11}))) == "count"
+    assert validator({"level": 6, "count": 3}) == "level"